@@ -1,13 +1,24 @@
-from typing import Literal, Optional
+import csv
+import json
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, repeat
+from time import perf_counter
+from typing import Iterator, Literal, Optional
 
 import click
+from marshmallow import ValidationError
 from marshmallow.utils import INCLUDE
+from sqlalchemy import insert, or_, select
 
 from cookgpt import logging
 from cookgpt.auth import app
 from cookgpt.auth.data.enums import UserType
 from cookgpt.auth.data.schemas import Auth
-from cookgpt.auth.models import User
+from cookgpt.auth.models import Token, User
+from cookgpt.ext.database import db
+from cookgpt.ext.passwords import hasher
+
+IMPORT_FIELDS = ("first_name", "last_name", "email", "username", "password")
 
 
 @app.cli.command("create-user")
@@ -154,3 +165,163 @@ def get_access_token(identity: str, new: bool) -> None:
     else:
         token = user.request_token()
     click.echo(f"Access token: {token.access_token}")
+
+
+@app.cli.command("purge-tokens")
+@click.option(
+    "--batch-size", "-b", default=500, help="tokens deleted per statement"
+)
+def purge_tokens(batch_size: int):
+    """Delete expired and revoked tokens"""
+    count = Token.purge(batch_size=batch_size)
+    click.echo(f"Purged {count} tokens")
+
+
+def read_users(path: str, format: str) -> Iterator[tuple[int, dict]]:
+    """
+    yield the line number and fields of each user in a file, reporting
+    and skipping the lines that aren't json objects
+    """
+    with open(path, newline="") as file:
+        if format == "jsonl":
+            for line_no, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    fields = json.loads(line)
+                except json.JSONDecodeError as err:
+                    click.echo(
+                        f"line {line_no}: invalid json: {err}", err=True
+                    )
+                    continue
+                if not isinstance(fields, dict):
+                    click.echo(f"line {line_no}: not an object", err=True)
+                    continue
+                yield line_no, fields
+        else:
+            reader = csv.DictReader(file)
+            for row in reader:
+                yield reader.line_num, row
+
+
+def hash_password(password: str, rounds: int) -> str:
+    """hash a password in a worker process"""
+    import bcrypt
+
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds)).decode()
+
+
+def import_batch(
+    batch: "list[tuple[int, dict]]",
+    seen_emails: "set[str]",
+    seen_usernames: "set[str]",
+    pool: ProcessPoolExecutor,
+    user_type: UserType,
+) -> int:
+    """insert a batch of users, skipping existing ones, and return the count"""
+    schema = Auth.Signup.Body()
+    rows: "list[tuple[int, dict]]" = []
+    for line_no, fields in batch:
+        try:
+            # empty csv cells are missing values
+            fields = {k: fields.get(k) or None for k in IMPORT_FIELDS}
+            rows.append((line_no, schema.load(fields)))  # type: ignore
+        except ValidationError as err:
+            click.echo(f"line {line_no}: {err.messages}", err=True)
+        except (AttributeError, TypeError) as err:
+            click.echo(f"line {line_no}: invalid row: {err}", err=True)
+
+    emails = {row["email"] for _, row in rows}
+    usernames = {row["username"] for _, row in rows if row.get("username")}
+    # everything taken in the database, in one query per batch
+    for email, username in db.session.execute(
+        select(User.email, User.username).where(
+            or_(User.email.in_(emails), User.username.in_(usernames))
+        )
+    ):
+        seen_emails.add(email)
+        if username:
+            seen_usernames.add(username)
+
+    new: "list[dict]" = []
+    for line_no, row in rows:
+        username = row.get("username")
+        if row["email"] in seen_emails or username in seen_usernames:
+            click.echo(f"line {line_no}: user already exists", err=True)
+            continue
+        seen_emails.add(row["email"])
+        if username:
+            seen_usernames.add(username)
+        new.append(row)
+    if not new:
+        return 0
+
+    hashes = pool.map(
+        hash_password,
+        [row["password"] for row in new],
+        repeat(hasher.log_rounds),
+    )
+    for row, hashed in zip(new, hashes):
+        row["password"] = hashed
+        row["user_type"] = user_type
+        row.setdefault("username", None)
+    db.session.execute(insert(User), new)
+    db.session.commit()
+    return len(new)
+
+
+@app.cli.command("import-users")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--format",
+    "-f",
+    type=click.Choice(["csv", "jsonl"], False),
+    help="file format, guessed from the extension by default",
+)
+@click.option(
+    "--batch-size", "-b", default=1000, help="users inserted per statement"
+)
+@click.option(
+    "--workers",
+    "-w",
+    default=None,
+    type=int,
+    help="password hashing processes",
+)
+@click.option(
+    "--user-type",
+    "-t",
+    type=click.Choice(["ADMIN", "COOK"], False),
+    default="COOK",
+)
+def import_users(
+    path: str,
+    format: Optional[str],
+    batch_size: int,
+    workers: Optional[int],
+    user_type: Literal["ADMIN", "COOK"],
+):
+    """Create users in bulk from a CSV or JSON lines file"""
+    if format is None:
+        jsonl = path.endswith((".jsonl", ".ndjson"))
+        format = "jsonl" if jsonl else "csv"
+    rows = read_users(path, format.lower())
+    seen_emails: "set[str]" = set()
+    seen_usernames: "set[str]" = set()
+    imported = 0
+    start = perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while batch := list(islice(rows, batch_size)):
+            imported += import_batch(
+                batch,
+                seen_emails,
+                seen_usernames,
+                pool,
+                UserType(user_type.lower()),
+            )
+            elapsed = perf_counter() - start
+            click.echo(
+                f"Imported {imported} users"
+                f" ({imported / elapsed:.0f} users/s)"
+            )
+    logging.info("Imported %d users from %s", imported, path)
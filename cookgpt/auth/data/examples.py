@@ -82,6 +82,17 @@ class Auth:
             "auth_info": AuthInfo,
         }
 
+    class Revoke:
+        Body = {
+            "issued_before": DateTime,
+            "user_id": Uuid,
+        }
+        Response = {
+            "message": "Revoked tokens",
+            "revoked": 12,
+        }
+        Forbidden = {"message": "Only admins can revoke tokens"}
+
 
 class User:
     """User data examples"""
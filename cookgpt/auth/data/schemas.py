@@ -213,6 +213,46 @@ class Auth:
             )
             auth_info = fields.Nested(AuthInfoSchema)
 
+    class Revoke:
+        class Body(Schema):
+            issued_before = Datetime(
+                required=False,
+                metadata={
+                    "description": (
+                        "revoke tokens issued before this time (UTC), "
+                        "defaults to now"
+                    ),
+                },
+            )
+            user_id = UserID(
+                required=False,
+                metadata={
+                    "description": "only revoke this user's tokens",
+                },
+            )
+
+        class Response(Schema):
+            message = fields.String(
+                metadata={
+                    "description": "success message",
+                    "example": ex.Auth.Revoke.Response["message"],
+                }
+            )
+            revoked = fields.Integer(
+                metadata={
+                    "description": "the number of tokens revoked",
+                    "example": ex.Auth.Revoke.Response["revoked"],
+                }
+            )
+
+        class Forbidden(Schema):
+            message = fields.String(
+                metadata={
+                    "description": "error message",
+                    "example": ex.Auth.Revoke.Forbidden["message"],
+                }
+            )
+
 
 class User:
     """User data"""
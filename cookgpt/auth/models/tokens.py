@@ -1,31 +1,78 @@
 from datetime import datetime, timedelta, timezone
-from typing import TYPE_CHECKING, Iterable, List, cast
-from uuid import UUID, uuid4
+from typing import TYPE_CHECKING, Iterable, List, NamedTuple, Optional, cast
+from uuid import UUID
 
-from flask_jwt_extended import (
-    create_access_token,
-    create_refresh_token,
-    decode_token,
+from flask_jwt_extended import create_access_token, create_refresh_token
+from sqlalchemy import (
+    ForeignKey,
+    Index,
+    String,
+    delete,
+    or_,
+    select,
+    update,
 )
-from sqlalchemy import ForeignKey, String
 from sqlalchemy.orm import Mapped, mapped_column
 
-from cookgpt.ext.cache import cache
-from cookgpt.ext.database import db
+from cookgpt import logging
+from cookgpt.ext.cache import (
+    cache,
+    token_state_cache_key,
+    tokens_revoked_before_cache_key,
+)
+from cookgpt.ext.database import db, uuid7
 from cookgpt.globals import current_app as app
-from cookgpt.utils import utcnow, utcnow_from__ts
+from cookgpt.utils import no_ms, utcnow
 
 if TYPE_CHECKING:
     from cookgpt.auth.models.user import User  # noqa: F401
 
 
+def expires_in(delta: timedelta) -> datetime:
+    """
+    get an expiry time from now, truncated to the second like a jwt's
+    `exp` claim
+    """
+    return no_ms(datetime.now(tz=timezone.utc) + delta)
+
+
+def naive(dt: datetime) -> datetime:
+    """convert an aware datetime to a naive utc datetime"""
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+# jtis of revoked or deactivated tokens, scored by access token expiry
+REVOKED_TOKENS_KEY = "tokens:revoked"
+
+
+class TokenState(NamedTuple):
+    """The parts of a token needed to authenticate a request"""
+
+    active: bool
+    revoked: bool
+    user_id: str
+    created_at: float
+
+
 class Token(db.Model):  # type: ignore
     """Json Web Token model"""
 
     serialize_rules = ("-user",)
+    __table_args__ = (
+        Index(
+            "ix_token_user_id_active_revoked_access_expires_at",
+            "user_id",
+            "active",
+            "revoked",
+            "access_expires_at",
+        ),
+    )
 
     access_token: Mapped[str] = mapped_column(String(500), unique=True)
     refresh_token: Mapped[str] = mapped_column(String(500), unique=True)
+    # naive utc, like `created_at`
+    access_expires_at: Mapped[datetime] = mapped_column(nullable=False)
+    refresh_expires_at: Mapped[datetime] = mapped_column(nullable=False)
     revoked: Mapped[bool] = mapped_column(default=False)
     active: Mapped[bool] = mapped_column(default=True)
     user_id: Mapped[UUID] = mapped_column(ForeignKey("user.id"))
@@ -41,12 +88,165 @@ class Token(db.Model):  # type: ignore
             "✔" if self.revoked else "✗",
         )
 
+    @property
+    def state(self) -> TokenState:
+        """the token's authentication state"""
+        return TokenState(
+            self.active,
+            self.revoked,
+            self.user_id.hex,
+            self.created_at.replace(tzinfo=timezone.utc).timestamp(),
+        )
+
+    @classmethod
+    def cache_states(cls, tokens: "Iterable[Token]"):
+        """
+        cache the state of tokens until their refresh tokens expire
+        """
+        now = utcnow()
+        for token in tokens:
+            timeout = int((token.rtoken_expiry - now).total_seconds())
+            key = token_state_cache_key(token_id=token.id.hex)
+            if timeout > 0:
+                cache.set(key, token.state, timeout=timeout)
+            else:
+                cache.delete(key)
+
+    @classmethod
+    def add_to_revoked_set(cls, tokens: "Iterable[Token]"):
+        """
+        record tokens that can no longer be used, until their access tokens
+        expire, for stateless access token verification
+        """
+        now = utcnow().timestamp()
+        revoked = {
+            token.id.hex: token.atoken_expiry.timestamp()
+            for token in tokens
+            if token.revoked or not token.active
+        }
+        revoked = {jti: exp for jti, exp in revoked.items() if exp > now}
+        if not revoked:
+            return
+        pipe = app.redis.pipeline()
+        pipe.zadd(REVOKED_TOKENS_KEY, revoked)
+        pipe.zremrangebyscore(REVOKED_TOKENS_KEY, "-inf", now)
+        pipe.execute()
+
+    @classmethod
+    def is_revoked(cls, payload: dict) -> bool:
+        """
+        check whether an access token was revoked without querying the
+        database
+        """
+        if app.redis.zscore(REVOKED_TOKENS_KEY, payload["jti"]) is not None:
+            return True
+        watermarks = cache.get_many(
+            tokens_revoked_before_cache_key(),
+            tokens_revoked_before_cache_key(user_id=payload["sub"]),
+        )
+        revoked_before = max(filter(None, watermarks), default=None)
+        if revoked_before is None:
+            return False
+        # tokens issued before `created` was added only have `iat`
+        created = payload.get("created", payload["iat"])
+        return created < revoked_before
+
+    @classmethod
+    def get_state(
+        cls, jti: str, user_id: Optional[str] = None
+    ) -> Optional[TokenState]:
+        """
+        get a token's state, only querying the database if it isn't cached
+        """
+        from flask import has_request_context, request
+
+        # the verification and blocklist callbacks both need the state
+        states: dict[str, Optional[TokenState]] = {}
+        if has_request_context():
+            states = request.environ.setdefault("cookgpt.token_states", {})
+        if jti in states:
+            return states[jti]
+        keys = [
+            token_state_cache_key(token_id=jti),
+            tokens_revoked_before_cache_key(),
+        ]
+        if user_id is not None:
+            keys.append(tokens_revoked_before_cache_key(user_id=user_id))
+        state, *watermarks = cache.get_many(*keys)
+        if state is None:
+            logging.debug("Token state for %s not cached", jti[-6:])
+            token = db.session.get(cls, UUID(jti))
+            if token is not None:
+                cls.cache_states([token])
+                state = token.state
+        # bulk revocations are recorded as a time, not per token
+        revoked_before = max(filter(None, watermarks), default=None)
+        if (
+            state is not None
+            and revoked_before is not None
+            and state.created_at < revoked_before
+        ):
+            state = state._replace(revoked=True)
+        states[jti] = state
+        return state
+
+    @classmethod
+    def revoke_issued_before(
+        cls, before: datetime, user_id: Optional[UUID] = None
+    ) -> int:
+        """
+        revoke all tokens created before a time, optionally only the tokens
+        of one user, and return how many were revoked
+        """
+        if before.tzinfo is None:
+            before = before.replace(tzinfo=timezone.utc)
+        # a watermark in the future would reject tokens minted after the
+        # UPDATE, which stay unrevoked in the database
+        before = min(before, datetime.now(tz=timezone.utc))
+        stmt = update(cls).where(
+            cls.created_at < naive(before), cls.revoked.is_(False)
+        )
+        if user_id is not None:
+            stmt = stmt.where(cls.user_id == user_id)
+        result = db.session.execute(
+            stmt.values(revoked=True, updated_at=datetime.utcnow()),
+            execution_options={"synchronize_session": False},
+        )
+        db.session.commit()
+
+        # cached states are overridden until the last of these tokens
+        # could have been refreshed
+        lifetime: timedelta = app.config["JWT_REFRESH_TOKEN_EXPIRES"]
+        timeout = int((before + lifetime - utcnow()).total_seconds()) + 1
+        if timeout > 0:
+            key = tokens_revoked_before_cache_key(
+                user_id=user_id.hex if user_id else None
+            )
+            current = cache.get(key)
+            if current is None or current < before.timestamp():
+                cache.set(key, before.timestamp(), timeout=timeout)
+        return result.rowcount
+
+    def update(self, commit=True, **kwargs):
+        """Updates the token"""
+        super().update(commit, **kwargs)
+        if commit:
+            self.cache_states([self])
+            self.add_to_revoked_set([self])
+        return self
+
     def refresh(self):
         """refresh access token"""
+        expiry = expires_in(app.config["JWT_ACCESS_TOKEN_EXPIRES"])
         access_token = create_access_token(
-            self.user_id.hex, additional_claims={"jti": self.id.hex}
+            self.user_id.hex,
+            additional_claims={
+                "jti": self.id.hex,
+                "exp": expiry,
+                "created": self.state.created_at,
+            },
         )
-        self.update(access_token=access_token)
+        self.update(access_token=access_token, access_expires_at=naive(expiry))
 
     def atoken_has_expired(self):
         """Checks if access token has expired"""
@@ -61,42 +261,83 @@ class Token(db.Model):  # type: ignore
     @property
     def atoken_expiry(self):
         """Gets access_token expiry time"""
-        key = f"atoken_expiry:{self.access_token}"
-        if cache.has(key):
-            return datetime.fromtimestamp(cache.get(key), tz=timezone.utc)
-        decoded = decode_token(self.access_token, allow_expired=True)
-        cache.set(key, decoded["exp"], timeout=0)
-        return datetime.fromtimestamp(decoded["exp"], tz=timezone.utc)
+        return self.access_expires_at.replace(tzinfo=timezone.utc)
 
     @property
     def rtoken_expiry(self):
         """Gets refresh_token expiry time"""
-        key = f"rtoken_expiry:{self.refresh_token}"
-        if cache.has(key):  # pragma: no cover
-            return datetime.fromtimestamp(cache.get(key), tz=timezone.utc)
-        decoded = decode_token(self.refresh_token, allow_expired=True)
-        cache.set(key, decoded["exp"], timeout=0)
-        return datetime.fromtimestamp(decoded["exp"], tz=timezone.utc)
+        return self.refresh_expires_at.replace(tzinfo=timezone.utc)
 
     @classmethod
     def create(cls, user_id, commit=True) -> "Token":  # type: ignore
         """Creates jwt token"""
-        id = uuid4()
+        id = uuid7()
+        created_at = datetime.utcnow()
+        # set `exp` ourselves so it matches the stored expiry exactly
+        aexpiry = expires_in(app.config["JWT_ACCESS_TOKEN_EXPIRES"])
+        rexpiry = expires_in(app.config["JWT_REFRESH_TOKEN_EXPIRES"])
+        # `created` lets bulk revocations be checked without the database
+        created = created_at.replace(tzinfo=timezone.utc).timestamp()
         atoken = create_access_token(
-            user_id.hex, additional_claims={"jti": id.hex}
+            user_id.hex,
+            additional_claims={
+                "jti": id.hex,
+                "exp": aexpiry,
+                "created": created,
+            },
         )
         rtoken = create_refresh_token(
-            user_id.hex, additional_claims={"jti": id.hex}
+            user_id.hex, additional_claims={"jti": id.hex, "exp": rexpiry}
         )
         token = super().create(
             id=id,
+            created_at=created_at,
             user_id=user_id,
             access_token=atoken,
             refresh_token=rtoken,
+            access_expires_at=naive(aexpiry),
+            refresh_expires_at=naive(rexpiry),
             commit=commit,
         )
+        if commit:
+            cls.cache_states([token])
         return token
 
+    @classmethod
+    def purge(cls, batch_size: int = 500) -> int:
+        """
+        delete revoked tokens and tokens that can no longer be refreshed,
+        `batch_size` at a time, and evict their cache entries
+        """
+        purgeable = or_(
+            cls.revoked.is_(True),
+            cls.refresh_expires_at <= naive(utcnow()),
+        )
+        total = 0
+        while True:
+            batch = db.session.execute(
+                select(cls.id, cls.access_token, cls.refresh_token)
+                .where(purgeable)
+                .limit(batch_size)
+            ).all()
+            if not batch:
+                break
+            db.session.execute(
+                delete(cls).where(cls.id.in_([id for id, _, _ in batch])),
+                execution_options={"synchronize_session": False},
+            )
+            db.session.commit()
+            keys = []
+            for id, atoken, rtoken in batch:
+                keys.append(token_state_cache_key(token_id=id.hex))
+                # expiries used to be cached by jwt with no timeout
+                keys.append(f"atoken_expiry:{atoken}")
+                keys.append(f"rtoken_expiry:{rtoken}")
+            cache.delete_many(*keys)
+            total += len(batch)
+            logging.debug("Purged %d tokens", total)
+        return total
+
 
 class TokenMixin:
     """TokenMixin"""
@@ -106,16 +347,41 @@ class TokenMixin:
 
     def revoke_all_tokens(self):
         """Revokes all jwt tokens"""
-        for token in cast(Iterable[Token], self.tokens):
-            token.update(revoked=True, commit=False)
-        db.session.commit()
+        Token.revoke_issued_before(datetime.now(tz=timezone.utc), self.id)
 
     def revoke_expired_tokens(self):
         """Revokes expired jwt tokens"""
-        for token in cast(Iterable[Token], self.tokens):
-            if token.atoken_has_expired():
-                token.update(revoked=True, commit=False)
+        now = no_ms(datetime.utcnow())
+        stmt = (
+            update(Token)
+            .where(
+                Token.user_id == self.id,
+                Token.revoked.is_(False),
+                Token.access_expires_at <= now,
+            )
+            .values(revoked=True, updated_at=now)
+        )
+        options = {"synchronize_session": False}
+        if db.engine.dialect.update_returning:
+            ids = db.session.scalars(
+                stmt.returning(Token.id), execution_options=options
+            ).all()
+        else:  # pragma: no cover
+            # mysql has no UPDATE ... RETURNING, so find the rows this
+            # update stamped
+            db.session.execute(stmt, execution_options=options)
+            ids = db.session.scalars(
+                select(Token.id).where(
+                    Token.user_id == self.id,
+                    Token.revoked.is_(True),
+                    Token.updated_at == now,
+                )
+            ).all()
         db.session.commit()
+        if ids:
+            cache.delete_many(
+                *[token_state_cache_key(token_id=id.hex) for id in ids]
+            )
 
     def revoke_token(self, token: "Token"):
         """Revokes jwt token"""
@@ -153,36 +419,40 @@ class TokenMixin:
     def get_active_tokens(self, with_expired=False):
         """Gets active jwt tokens"""
         active_tokens = Token.query.filter_by(
-            user=self, active=True, revoked=False
+            user_id=self.id, active=True, revoked=False
         )
-        for token in active_tokens.all():
-            if with_expired or not token.atoken_has_expired():
-                yield token
+        if not with_expired:
+            active_tokens = active_tokens.filter(
+                Token.access_expires_at > naive(utcnow())
+            )
+        yield from active_tokens.all()
 
     def get_inactive_tokens(self, with_expired=False):
         """Gets expired jwt tokens"""
         inactive_tokens = Token.query.filter_by(
-            user=self, active=False, revoked=False
+            user_id=self.id, active=False, revoked=False
         )
-        for token in inactive_tokens.all():
-            if with_expired or not token.atoken_has_expired():
-                yield token
+        if not with_expired:
+            inactive_tokens = inactive_tokens.filter(
+                Token.access_expires_at > naive(utcnow())
+            )
+        yield from inactive_tokens.all()
 
     def request_token(self) -> "Token":
         """Requests a jwt token"""
 
-        token: "Token"
         leeway: timedelta = app.config["JWT_ACCESS_TOKEN_LEEWAY"]
-        active_tokens = Token.query.filter_by(
-            user=self, active=True, revoked=False
-        ).order_by(Token.created_at.desc())
-        for token in active_tokens.all():
-            if token.atoken_has_expired():
-                # skip expired tokens
-                continue
-            # check if token is about to expire
-            decoded = decode_token(token.access_token)
-            exp = utcnow_from__ts(decoded["exp"])
-            if exp - leeway >= utcnow():
-                return cast(Token, token)
+        # skip tokens that have expired or are about to
+        token = (
+            Token.query.filter(
+                Token.user_id == self.id,
+                Token.active.is_(True),
+                Token.revoked.is_(False),
+                Token.access_expires_at >= naive(utcnow() + leeway),
+            )
+            .order_by(Token.created_at.desc())
+            .first()
+        )
+        if token is not None:
+            return cast(Token, token)
         return self.create_token()
@@ -1,15 +1,24 @@
 """User Database Models"""
 
-from typing import TYPE_CHECKING, List, Optional, cast
+from time import monotonic
+from typing import TYPE_CHECKING, List, NamedTuple, Optional, cast
+from uuid import UUID
 
-from sqlalchemy import Enum
+from sqlalchemy import Enum, or_, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Mapped, mapped_column
 
+from cookgpt import logging
 from cookgpt.auth.data.enums import UserType
 from cookgpt.auth.models.tokens import TokenMixin
 from cookgpt.chatbot.models import ThreadMixin
-from cookgpt.ext.auth import bcrypt
+from cookgpt.ext.cache import (
+    cache,
+    user_snapshot_cache_key,
+    user_version_cache_key,
+)
 from cookgpt.ext.database import db
+from cookgpt.ext.passwords import hasher
 
 if TYPE_CHECKING:
     from cookgpt.auth.models.tokens import Token  # noqa: F401
@@ -23,6 +32,71 @@ def get_max_chat_cost() -> int:
     return cast(int, app.config["MAX_CHAT_COST"])
 
 
+def gravatar(email: str) -> str:
+    """get the gravatar for an email address"""
+    from hashlib import sha256
+
+    return (
+        "https://www.gravatar.com/avatar/" + sha256(email.encode()).hexdigest()
+    )
+
+
+class UserSnapshot(NamedTuple):
+    """
+    The parts of a user most requests read, cached so authenticating a
+    request doesn't need a SELECT. Use `live()` to get a user to write to.
+    """
+
+    id: UUID
+    first_name: str
+    last_name: Optional[str]
+    username: Optional[str]
+    email: str
+    user_type: UserType
+    max_chat_cost: int
+    version: int
+
+    @property
+    def name(self) -> str:
+        """get user's name"""
+        name = self.first_name
+        if self.last_name:
+            name += " " + self.last_name
+        return name
+
+    @property
+    def type(self) -> UserType:
+        """get the user's type"""
+        return self.user_type
+
+    @property
+    def sid(self) -> str:
+        """Returns string id"""
+        return str(self.id)
+
+    @property
+    def pk(self) -> str:
+        """Returns primary key"""
+        return str(self.id)
+
+    @property
+    def profile_picture(self) -> str:
+        """get the user's profile picture"""
+        return gravatar(self.email)
+
+    def live(self) -> "User":
+        """load the user from the database"""
+        user = db.session.get(User, self.id)
+        if user is None:  # pragma: no cover
+            raise User.DoesNotExist
+        return user
+
+
+# snapshots served without asking redis, by user id
+_local_snapshots: dict[str, tuple[float, UserSnapshot]] = {}
+MAX_LOCAL_SNAPSHOTS = 1024
+
+
 class User(
     db.Model,  # type: ignore
     TokenMixin,
@@ -54,12 +128,14 @@ class User(
         lazy=True,
         cascade="all, delete-orphan",
         order_by="Thread.created_at.desc()",
+        primaryjoin="and_(User.id == Thread.user_id,"
+        " Thread.deleted_at.is_(None))",
     )
 
     def __repr__(self):
         return "{}[{}](name={}, email={}, threads={}, tokens={})".format(
             self.type.name,
-            self.sid[:6],
+            self.sid[-6:],
             self.name,
             self.email,
             len(self.threads),  # type: ignore
@@ -78,12 +154,7 @@ class User(
     def profile_picture(self):
         """get the user's profile picture"""
         # hash the user's email to get a gravatar
-        from hashlib import sha256
-
-        return (
-            "https://www.gravatar.com/avatar/"
-            + sha256(self.email.encode()).hexdigest()
-        )
+        return gravatar(self.email)
 
     @property
     def type(self) -> UserType:  # pragma: no cover
@@ -100,49 +171,143 @@ class User(
         else:
             return self.user_type
 
+    def snapshot(self, version: int = 0) -> UserSnapshot:
+        """take a snapshot of the user"""
+        return UserSnapshot(
+            id=self.id,
+            first_name=self.first_name,
+            last_name=self.last_name,
+            username=self.username,
+            email=self.email,
+            user_type=self.type,
+            max_chat_cost=self.max_chat_cost,
+            version=version,
+        )
+
+    @classmethod
+    def get_snapshot(cls, user_id: str) -> Optional[UserSnapshot]:
+        """
+        get a user's snapshot, only querying the database if the cached one
+        is missing or older than the user's last update
+        """
+        from cookgpt.globals import current_app as app
+
+        now = monotonic()
+        entry = _local_snapshots.get(user_id)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        version, snapshot = cache.get_many(
+            user_version_cache_key(user_id=user_id),
+            user_snapshot_cache_key(user_id=user_id),
+        )
+        version = version or 0
+        if snapshot is None or snapshot.version != version:
+            logging.debug("Snapshot of user %s not cached", user_id[-6:])
+            # a lagging replica would cache a stale snapshot for an hour
+            user = db.session.get(
+                cls, UUID(user_id), bind_arguments={"primary": True}
+            )
+            if user is None:
+                return None
+            # tagged with the version read before the SELECT, so a snapshot
+            # taken while the user is updated is never served
+            snapshot = user.snapshot(version)
+            cache.set(
+                user_snapshot_cache_key(user_id=user_id),
+                snapshot,
+                timeout=app.config.get("USER_SNAPSHOT_TIMEOUT", 3600),
+            )
+        ttl = app.config.get("USER_SNAPSHOT_LOCAL_TTL", 5)
+        if ttl > 0:
+            if len(_local_snapshots) >= MAX_LOCAL_SNAPSHOTS:
+                _local_snapshots.clear()
+            _local_snapshots[user_id] = (now + ttl, snapshot)
+        return snapshot
+
+    def invalidate_snapshot(self):
+        """make every process drop its snapshot of the user"""
+        # keyed like the `sub` claim of the user's tokens
+        user_id = self.id.hex
+        cache.cache.inc(user_version_cache_key(user_id=user_id))
+        cache.delete(user_snapshot_cache_key(user_id=user_id))
+        _local_snapshots.pop(user_id, None)
+
     def validate_password(self, password):
         """verify that a password can be used to authenticate as this user"""
-        return bcrypt.check_password_hash(self.password, password)
+        if not hasher.verify(self.password, password):
+            return False
+        if hasher.needs_rehash(self.password):
+            # the work factor changed since this password was hashed
+            self.update(password=password)
+        return True
+
+    @classmethod
+    def taken(
+        cls,
+        username: Optional[str],
+        email: Optional[str],
+        exclude: Optional[UUID] = None,
+    ) -> str:
+        """
+        find out which of a username and email is used by another user,
+        after an insert or update violated a unique constraint
+        """
+        query = select(cls.username, cls.email).where(
+            or_(cls.username == username, cls.email == email)
+        )
+        if exclude is not None:
+            query = query.where(cls.__table__.c.id != exclude)
+        user = db.session.execute(query).first()
+        if user is not None and username and user.username == username:
+            return "username is taken"
+        return "email is taken"
 
     @classmethod
     def create(cls, commit=True, **kwargs) -> "User":
-        """create a new user"""
-
-        if (
-            "username" in kwargs
-            and cls.query.filter_by(username=kwargs["username"]).first()
-        ):
-            raise cls.CreateError("username is taken")
-        if (
-            "email" in kwargs
-            and cls.query.filter_by(email=kwargs["email"]).first()
-        ):
-            raise cls.CreateError("email is taken")
+        """
+        create a new user
+
+        the user is inserted straight away and the unique constraints on
+        username and email decide whether it can be created
+        """
         if "password" in kwargs:
-            kwargs["password"] = bcrypt.generate_password_hash(
-                kwargs["password"]
-            )
-        return super().create(commit, **kwargs)
+            kwargs["password"] = hasher.hash(kwargs["password"])
+        user = super().create(commit=False, **kwargs)
+        try:
+            with db.session.begin_nested():
+                db.session.add(user)
+        except IntegrityError as err:
+            logging.debug("Error inserting user: %s", err.orig)
+            raise cls.CreateError(
+                cls.taken(kwargs.get("username"), kwargs.get("email"))
+            ) from err
+        if commit:
+            db.session.commit()
+        return user
 
     def update(self, commit=True, **kwargs) -> "User":
         """update a user"""
-        # if username is used by a different user, raise error
-        if (
-            "username" in kwargs
-            and self.username != kwargs["username"]
-            and self.query.filter_by(username=kwargs["username"]).first()
-        ):
-            raise self.UpdateError("username is taken")
-        # if email is used by a different user, raise error
-        if (
-            "email" in kwargs
-            and self.email != kwargs["email"]
-            and self.query.filter_by(email=kwargs["email"]).first()
-        ):
-            raise self.UpdateError("email is taken")
         if "password" in kwargs:
             # if password is being updated, hash it
-            kwargs["password"] = bcrypt.generate_password_hash(
-                kwargs["password"]
-            )
-        return super().update(commit, **kwargs)
+            kwargs["password"] = hasher.hash(kwargs["password"])
+        try:
+            # a failed update rolls back to the user's previous values
+            with db.session.begin_nested():
+                super().update(commit=False, **kwargs)
+        except IntegrityError as err:
+            logging.debug("Error updating user: %s", err.orig)
+            raise self.UpdateError(
+                self.taken(
+                    kwargs.get("username"), kwargs.get("email"), self.id
+                )
+            ) from err
+        if commit:
+            db.session.commit()
+            self.invalidate_snapshot()
+        return self
+
+    def delete(self, commit=True):
+        """delete a user"""
+        super().delete(commit)
+        if commit:
+            self.invalidate_snapshot()
@@ -0,0 +1,9 @@
+from redisflow import celeryapp as app
+
+
+@app.task(name="auth.purge_tokens")
+def purge_tokens(batch_size: int = 500):
+    """delete expired and revoked tokens"""
+    from cookgpt.auth.models import Token
+
+    return Token.purge(batch_size=batch_size)
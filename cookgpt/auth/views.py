@@ -1,3 +1,4 @@
+from datetime import datetime, timezone
 from typing import Any, Optional, cast
 from uuid import UUID
 
@@ -15,6 +16,7 @@ from cookgpt.auth.data.enums import UserType
 from cookgpt.auth.models import Token
 from cookgpt.ext.auth import auth_required
 from cookgpt.ext.database import db
+from cookgpt.ext.passwords import HasherBusy
 from cookgpt.utils import abort, api_output
 
 
@@ -55,7 +57,11 @@ def login(json_data: dict) -> Any:
     if user is None:
         logging.debug("User does not exist: %s", login)
         abort(404, "User does not exist")
-    elif not user.validate_password(password):
+    try:
+        valid = user.validate_password(password)
+    except HasherBusy as err:
+        abort(503, err.args[0])
+    if not valid:
         logging.debug("Incorrect password for user: %s", login)
         abort(401, "Cannot authenticate")
     token: "Token" = user.request_token()
@@ -89,7 +95,7 @@ def logout() -> Any:
 
     logging.info("Logging out user...")
     jwt = get_jwt()
-    user: "User" = get_current_user()
+    user: "User" = get_current_user().live()
     token = db.session.get(Token, UUID(jwt["jti"]))
     assert token is not None
     logging.debug("Deactivating token: %s", token)
@@ -129,6 +135,8 @@ def signup(json_data: dict) -> Any:
     except User.CreateError as err:
         logging.debug("Error while creating user: %s", err.args[0])
         return {"message": err.args[0]}, 422
+    except HasherBusy as err:
+        abort(503, err.args[0])
     return {"message": "Successfully signed up"}, 201
 
 
@@ -162,6 +170,41 @@ def refresh() -> Any:
     }
 
 
+@app.post("/tokens/revoke")
+@auth_required()
+@app.input(sc.Auth.Revoke.Body, example=ex.Auth.Revoke.Body)
+@app.output(
+    sc.Auth.Revoke.Response,
+    200,
+    example=ex.Auth.Revoke.Response,
+    description="Number of revoked tokens",
+)
+@api_output(
+    sc.Auth.Revoke.Forbidden,
+    403,
+    example=ex.Auth.Revoke.Forbidden,
+    description="Error message if the user is not an admin",
+)
+@app.doc(description=docs.AUTH_REVOKE)
+def revoke_tokens(json_data: dict) -> Any:
+    """Revoke tokens in bulk."""
+    from cookgpt.auth.models.user import UserSnapshot
+
+    user: "UserSnapshot" = get_current_user()
+    if user.type != UserType.ADMIN:
+        abort(403, "Only admins can revoke tokens")
+    now = datetime.now(tz=timezone.utc)
+    before: datetime = json_data.get("issued_before") or now
+    if before.tzinfo is None:
+        before = before.replace(tzinfo=timezone.utc)
+    if before > now:
+        abort(422, "issued_before cannot be in the future")
+    user_id: Optional[UUID] = json_data.get("user_id")
+    logging.info("Revoking tokens issued before %s", before)
+    count = Token.revoke_issued_before(before, user_id)
+    return {"message": "Revoked tokens", "revoked": count}
+
+
 class UserView(MethodView):
     """User view"""
 
@@ -175,7 +218,7 @@ class UserView(MethodView):
     @app.doc(tags=["user"], description=docs.USER_INFO)
     def get(self):
         """Get user's information"""
-        user = get_current_user()
+        user = get_current_user().live()
         user.user_type = user.type
         return user
 
@@ -196,7 +239,7 @@ class UserView(MethodView):
         """Update user's information"""
         from cookgpt.auth.models import User
 
-        user: User = get_current_user()  # type: ignore
+        user: User = get_current_user().live()
         try:
             updated = user.update(**json_data)
         except User.UpdateError as err:
@@ -223,3 +266,30 @@ class UserView(MethodView):
 
 
 app.add_url_rule("/user", view_func=UserView.as_view("user"))  # type: ignore
+
+
+@app.get("/user/export")
+@auth_required()
+@api_output(
+    {},
+    content_type="application/x-ndjson",
+    status_code=200,
+    description="The user's threads, messages and media as JSON lines",
+)
+@app.doc(tags=["user"], description=docs.USER_EXPORT)
+def export_user():
+    """Export user's threads"""
+    from flask import Response, stream_with_context
+
+    from cookgpt.chatbot.transfer import export_threads
+
+    user = get_current_user()
+    logging.info("Exporting threads of user %s", user.id)
+    lines = (line + "\n" for line in export_threads(user.id, secrets=False))
+    return Response(
+        stream_with_context(lines),
+        mimetype="application/x-ndjson",
+        headers={
+            "Content-Disposition": "attachment; filename=cookgpt-export.jsonl"
+        },
+    )
@@ -14,9 +14,11 @@ from cookgpt import logging
 from cookgpt.chatbot.data.fake_data import responses
 from cookgpt.chatbot.data.prompts import prompt as PROMPT
 from cookgpt.chatbot.memory import BaseMemory, ThreadMemory
-from cookgpt.ext.config import config
+from cookgpt.ext.config import config, set_langchain_verbosity
 from cookgpt.globals import getvar, setvar
 
+set_langchain_verbosity(config)
+
 
 def get_llm() -> BaseChatModel:  # pragma: no cover
     """returns the language model"""
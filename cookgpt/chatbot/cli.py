@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta
+from time import perf_counter
+from typing import TYPE_CHECKING, Optional
+
+import click
+
+from cookgpt import logging
+from cookgpt.chatbot import app
+from cookgpt.chatbot.models import Thread
+
+if TYPE_CHECKING:
+    from cookgpt.auth.models import User
+
+
+@app.cli.command("archive")
+@click.option(
+    "--days", "-d", default=90, help="archive threads idle for this long"
+)
+@click.option(
+    "--closed-days",
+    "-c",
+    default=7,
+    help="archive closed threads idle for this long",
+)
+@click.option(
+    "--batch-size", "-b", default=100, help="threads archived per commit"
+)
+@click.option(
+    "--limit", "-n", default=None, type=int, help="most threads to archive"
+)
+def archive(days: int, closed_days: int, batch_size: int, limit: "int | None"):
+    """Move the chats of old and closed threads into compressed archives"""
+    now = datetime.utcnow()
+    idle_before = now - timedelta(days=days)
+    closed_before = now - timedelta(days=closed_days)
+    threads = chats = raw_size = stored_size = 0
+    start = perf_counter()
+    while limit is None or threads < limit:
+        size = (
+            batch_size if limit is None else min(batch_size, limit - threads)
+        )
+        thread_ids = Thread.archivable(idle_before, closed_before, size)
+        if not thread_ids:
+            break
+        archived, raw, stored = Thread.archive_many(thread_ids)
+        threads += len(thread_ids)
+        chats += archived
+        raw_size += raw
+        stored_size += stored
+    elapsed = perf_counter() - start
+    click.echo(
+        f"Archived {threads} threads ({chats} chats) in {elapsed:.1f}s: "
+        f"{raw_size / 1024:.1f} KiB of rows stored in "
+        f"{stored_size / 1024:.1f} KiB, "
+        f"{(raw_size - stored_size) / 1024:.1f} KiB reclaimed"
+    )
+    logging.info("Archived %d threads with %d chats", threads, chats)
+
+
+def find_user(identity: str) -> "User":
+    """get a user by email or username"""
+    from cookgpt.auth.models import User
+
+    user = User.query.filter(
+        (User.email == identity) | (User.username == identity)
+    ).first()
+    if user is None:
+        raise click.BadParameter(f"no user {identity!r}")
+    return user
+
+
+@app.cli.command("export")
+@click.argument("identity")
+@click.option(
+    "--output",
+    "-o",
+    type=click.File("w"),
+    default="-",
+    help="file to write to, stdout by default",
+)
+@click.option(
+    "--batch-size", "-b", default=1000, help="rows read per round trip"
+)
+def export(identity: str, output, batch_size: int):
+    """Write a user's threads, chats and media as JSON lines"""
+    from cookgpt.chatbot.transfer import export_threads
+
+    user = find_user(identity)
+    lines = 0
+    start = perf_counter()
+    for line in export_threads(user.id, batch_size):
+        output.write(line + "\n")
+        lines += 1
+    elapsed = perf_counter() - start
+    click.echo(f"Exported {lines} rows in {elapsed:.1f}s", err=True)
+    logging.info("Exported %d rows for user %s", lines, user.id)
+
+
+@app.cli.command("import")
+@click.argument("path", type=click.File("r"))
+@click.option(
+    "--user",
+    "-u",
+    "identity",
+    default=None,
+    help="email or username of the user to give the threads to",
+)
+@click.option(
+    "--batch-size", "-b", default=1000, help="rows inserted per statement"
+)
+def import_(path, identity: Optional[str], batch_size: int):
+    """Insert threads, chats and media written by `export`"""
+    from cookgpt.chatbot.transfer import import_threads
+
+    user_id = find_user(identity).id if identity else None
+    start = perf_counter()
+    counts = import_threads(path, user_id, batch_size)
+    elapsed = perf_counter() - start
+    total = sum(counts.values())
+    click.echo(
+        f"Imported {counts['thread']} threads, {counts['chat']} chats and "
+        f"{counts['media']} media files in {elapsed:.1f}s"
+        f" ({total / max(elapsed, 1e-9):.0f} rows/s)"
+    )
@@ -137,6 +137,16 @@ class Chat:
                     ),
                 },
             )
+            previous_chat_id = PrevChatId(
+                metadata={
+                    "description": (
+                        "The id of the chat this message follows. If it "
+                        "already has a reply, the message starts a new "
+                        "branch of the thread. If not specified, the "
+                        "message follows the last chat on the active branch."
+                    ),
+                },
+            )
 
             @validates_schema
             def validate_query(self, data, **kwargs):
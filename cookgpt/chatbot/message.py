@@ -1,14 +1,23 @@
+import re
+from concurrent.futures import Future
 from dataclasses import dataclass, field
 from pathlib import Path
 from string import Template
-from typing import Iterable, Optional
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Optional
 
+from cookgpt import logging
 from cookgpt.auth.models.user import User
-from cookgpt.chatbot.data.enums import MessageType
-from cookgpt.chatbot.models import Chat, Thread
-from cookgpt.ext.genai import gemini, gemini_vision, genai, glm  # noqa: F401
+from cookgpt.chatbot.data.enums import MediaType, MessageType
+from cookgpt.chatbot.models import Chat, ChatMedia, Thread
+
+if TYPE_CHECKING:
+    import google.ai.generativelanguage as glm
+    import google.generativeai as genai
 
 TEMPLATES_DIR = Path(__file__).parent / "data" / "templates"
+IMAGE_SEARCH_PATTERN = re.compile(
+    r"^Image Search: (?P<query>[\w\d\s\_\-]+)$", re.IGNORECASE
+)
 
 
 @dataclass
@@ -26,7 +35,7 @@ class ChatHistory:
     _chats: list[Chat] = field(init=False, repr=False, compare=False)
 
     def __post_init__(self):
-        self._chats = [chat for chat in self.thread.chats if chat.content]
+        self._chats = [chat for chat in self.thread.history if chat.content]
 
     def __len__(self):
         return len(self._chats)
@@ -51,13 +60,15 @@ class ChatHistory:
         return self._chats[index]
 
 
-def contents_from_chats(chats: Iterable[Chat]) -> list[glm.Content]:
+def contents_from_chats(chats: Iterable[Chat]) -> "list[glm.Content]":
     """
     Convert a list of chats to a `glm.Content` object.
 
     Args:
         chats (list[Chat]): The chats to convert
     """
+    from cookgpt.ext.genai import glm
+
     contents = []
     for chat in chats:
         content = ""
@@ -73,7 +84,7 @@ def contents_from_chats(chats: Iterable[Chat]) -> list[glm.Content]:
     return contents
 
 
-def fetch_image(url: str) -> glm.Blob:
+def fetch_image(url: str) -> "glm.Blob":
     """
     Fetch an image from a url.
 
@@ -82,27 +93,18 @@ def fetch_image(url: str) -> glm.Blob:
     Returns:
         `glm.Blob`: The image blob
     """
-    import requests  # type: ignore[import-untyped]
+    from cookgpt.ext.genai import glm
+    from cookgpt.ext.httpclient import BROWSER_HEADERS, client
 
-    headers = {
-        "User-Agent": (
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
-            " AppleWebKit/537.36 (KHTML, like Gecko)"
-            " Chrome/120.0.0.0 Safari/537.36"
-        )
-    }
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    return glm.Blob(
-        data=response.content,
-        mime_type=response.headers["Content-Type"],
-    )
+    data, mime_type = client.download(url, headers=BROWSER_HEADERS)
+    return glm.Blob(data=data, mime_type=mime_type)
 
 
 def get_image_analysis_prompt(
     image_url: str,
-) -> glm.Content:
+) -> "glm.Content":
     """Generate an image prompt"""
+    from cookgpt.ext.genai import glm
 
     prompt = (TEMPLATES_DIR / "image_prompt.txt").read_text()
     return glm.Content(
@@ -128,11 +130,11 @@ def create_chat_history(
 
 
 def create_chat_session(
-    model: genai.GenerativeModel,
+    model: "genai.GenerativeModel",
     thread: Thread,
     system_prompt: Optional[str] = None,
     **vars: str,
-) -> genai.ChatSession:
+) -> "genai.ChatSession":
     """
     Create a chat session from a thread.
 
@@ -142,6 +144,8 @@ def create_chat_session(
         system_prompt (Optional[str], optional): The system prompt to use. Defaults to None.
         **vars: Variables to be passed to the system prompt. Defaults to None.
     """  # noqa: E501
+    from cookgpt.ext.genai import glm
+
     history = create_chat_history(thread)
     context = []
     if system_prompt is not None:
@@ -165,10 +169,10 @@ def create_chat_session(
 
 
 def generate_model_prompt(
-    model: genai.GenerativeModel,
+    model: "genai.GenerativeModel",
     thread: Thread,
     media_url: str,
-) -> glm.Content:
+) -> "glm.Content":
     """
     Generate a model prompt within the chat context
     """
@@ -176,6 +180,95 @@ def generate_model_prompt(
     return chat.get_prompt()
 
 
+class ImageSearchParser:
+    """
+    Incrementally remove the `Image Search: ...` directive from a stream
+    of response chunks.
+
+    Text is held back only while it could still be the start of a
+    directive line, so everything else is passed through as soon as it
+    arrives. When a directive line is complete, `on_query` is called with
+    the query it contains.
+    """
+
+    PREFIX = "image search:"
+
+    def __init__(self, on_query: Optional[Callable[[str], Any]] = None):
+        self.on_query = on_query
+        self.query = ""
+        self._buffer = ""
+        self._line_start = True
+        self._skip_newlines = False
+
+    def _directive(self, line: str) -> bool:
+        """check if a line is a directive, and handle it if it is"""
+        match = IMAGE_SEARCH_PATTERN.match(line)
+        if match is None:
+            return False
+        query = match["query"].strip()
+        logging.debug("Found image search directive: %r", query)
+        if not self.query:
+            self.query = query
+            if self.on_query is not None:
+                self.on_query(query)
+        # drop the blank lines that follow the directive
+        self._skip_newlines = True
+        return True
+
+    def feed(self, text: str) -> str:
+        """
+        Parse the next chunk of the response.
+
+        Args:
+            text (str): The chunk to parse
+        Returns:
+            str: The part of the response that can be streamed
+        """
+        output = []
+        buffer = self._buffer + text
+        while buffer:
+            if self._skip_newlines:
+                buffer = buffer.lstrip("\n")
+                if not buffer:
+                    break
+                self._skip_newlines = False
+            if not self._line_start:
+                # pass text through until the next line starts
+                end = buffer.find("\n") + 1
+                if not end:
+                    output.append(buffer)
+                    buffer = ""
+                    break
+                output.append(buffer[:end])
+                buffer = buffer[end:]
+                self._line_start = True
+                continue
+            head = buffer[: len(self.PREFIX)].lower()
+            if not self.PREFIX.startswith(head):
+                self._line_start = False
+                continue
+            end = buffer.find("\n")
+            if end == -1:
+                break  # wait for the rest of the line
+            line, buffer = buffer[:end], buffer[end + 1 :]
+            if not self._directive(line):
+                output.append(line + "\n")
+        self._buffer = buffer
+        return "".join(output)
+
+    def finish(self) -> str:
+        """
+        Flush whatever is left once the response is complete.
+
+        Returns:
+            str: The remaining part of the response
+        """
+        buffer, self._buffer = self._buffer, ""
+        if self._line_start and self._directive(buffer):
+            return ""
+        return buffer
+
+
 def extract_image_search(response: str) -> tuple[str, str]:
     """
     Extract the image search query and url from a response.
@@ -185,18 +278,72 @@ def extract_image_search(response: str) -> tuple[str, str]:
     Returns:
         tuple[str, str]: The query and the response
     """
-    import re
+    parser = ImageSearchParser()
+    response = parser.feed(response) + parser.finish()
+    return parser.query, response.strip()
 
-    pattern = re.compile(
-        r"^Image Search: (?P<query>[\w\d\s\_\-]+)\n+$",
-        re.IGNORECASE | re.MULTILINE,
-    )
-    match = pattern.search(response)
-    if match is None:
-        return "", response
-    query = match["query"]
-    response = pattern.sub("", response)
-    return query, response.strip()  # type: ignore[return-value]
+
+def search_images(query: str) -> "Future[list[Any]]":
+    """
+    Start an image search in the background.
+
+    Args:
+        query (str): The query to search for
+    Returns:
+        Future: The image results
+    """
+    from cookgpt.chatbot.serper import ImageResult, Serper
+
+    return Serper(type="images").search_async(query, ImageResult)
+
+
+def attach_images(
+    chat: Chat, images: "Future[list[Any]]", limit: Optional[int] = None
+) -> list[ChatMedia]:
+    """
+    Attach the results of an image search to a chat.
+
+    The media are added to the session but not committed.
+
+    Args:
+        chat (Chat): The chat to attach the images to
+        images (Future): The image search started by `search_images`
+        limit (Optional[int], optional): Maximum number of images to
+            attach. Defaults to the `CHATBOT_IMAGE_SEARCH_RESULTS` config.
+    """
+    from flask import current_app as app
+
+    from cookgpt.ext.database import db
+
+    if limit is None:
+        limit = int(app.config.get("CHATBOT_IMAGE_SEARCH_RESULTS", 3))
+    try:
+        results = images.result(timeout=app.config.get("HTTP_READ_TIMEOUT"))
+    except Exception as err:
+        logging.warning("Image search failed: %s", err)
+        return []
+    media: list[ChatMedia] = []
+    for result in results:
+        if len(media) >= limit:
+            break
+        url = result.imageUrl
+        if len(url) > 255:
+            url = result.thumbnailUrl
+        if len(url) > 255:  # pragma: no cover
+            continue
+        media.append(
+            ChatMedia.create(
+                commit=False,
+                chat_id=chat.id,
+                secret="",
+                url=url,
+                type=MediaType.IMAGE,
+                description=result.title,
+            )
+        )
+    db.session.add_all(media)
+    logging.debug("Attached %d images to chat %s", len(media), chat.id)
+    return media
 
 
 response = """\
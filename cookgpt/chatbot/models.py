@@ -1,10 +1,27 @@
 """Chatbot models."""
+import json
+import zlib
 from datetime import datetime
-from typing import TYPE_CHECKING, List, Optional, Sequence, cast
-from uuid import UUID, uuid4
+from enum import Enum as PyEnum
+from time import sleep
+from typing import TYPE_CHECKING, Any, Callable, List, Optional, Sequence
+from uuid import UUID
 
-from sqlalchemy import Enum, ForeignKey, String, Text
+from sqlalchemy import (
+    Enum,
+    ForeignKey,
+    Index,
+    LargeBinary,
+    String,
+    delete,
+    func,
+    insert,
+    select,
+    update,
+)
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.orm.attributes import instance_state
 
 from cookgpt import logging
 from cookgpt.ext import cache, db
@@ -14,13 +31,52 @@ from cookgpt.ext.cache import (
     thread_cache_key,
     threads_cache_key,
 )
+from cookgpt.ext.database import CompressedText, uuid7
 from cookgpt.utils import utcnow
 
 from .data.enums import MediaType, MessageType
 
 if TYPE_CHECKING:
+    from sqlalchemy import CTE, Column, ColumnElement, Row, Select, Table
+
     from cookgpt.auth.models.user import User  # noqa: F401
 
+# mysql stops a recursive cte after 1000 rows unless told otherwise, and
+# a branch can be longer than that
+RECURSION_HINT = "/*+ SET_VAR(cte_max_recursion_depth = 1000000) */"
+
+
+def earlier_chats(chat_id: UUID) -> "CTE":
+    """
+    the ids of a chat and the chats before it on its branch, walked back
+    through each chat's previous chat
+    """
+    chats = (
+        select(Chat.id, Chat.previous_chat_id)
+        .where(Chat.id == chat_id)
+        .cte("earlier_chats", recursive=True)
+    )
+    return chats.union_all(
+        select(Chat.id, Chat.previous_chat_id).where(
+            Chat.id == chats.c.previous_chat_id
+        )
+    )
+
+
+def later_chats(chat_id: UUID) -> "CTE":
+    """
+    the ids of a chat and the chats after it on any of its branches,
+    walked forward through the replies to each chat
+    """
+    chats = (
+        select(Chat.id)
+        .where(Chat.id == chat_id)
+        .cte("later_chats", recursive=True)
+    )
+    return chats.union_all(
+        select(Chat.id).where(Chat.previous_chat_id == chats.c.id)
+    )
+
 
 class ChatMedia(db.Model):  # type: ignore
     """A media file"""
@@ -30,8 +86,8 @@ class ChatMedia(db.Model):  # type: ignore
     secret: Mapped[str] = mapped_column(String(36))
     url: Mapped[str] = mapped_column(String(255))
     type: Mapped[MediaType] = mapped_column(Enum(MediaType))
-    description: Mapped[str] = mapped_column(Text)
-    chat_id: Mapped[UUID] = mapped_column(db.ForeignKey("chat.id"))
+    description: Mapped[str] = mapped_column(CompressedText)
+    chat_id: Mapped[UUID] = mapped_column(db.ForeignKey("chat.id"), index=True)
     chat: Mapped["Chat"] = db.relationship(  # type: ignore[assignment]
         back_populates="media",
         lazy=True,
@@ -51,8 +107,8 @@ class Chat(db.Model):  # type: ignore
 
     serialize_rules = "-thread"
 
-    id: Mapped[UUID] = mapped_column(primary_key=True, default=uuid4)
-    content: Mapped[str] = mapped_column(Text)
+    id: Mapped[UUID] = mapped_column(primary_key=True, default=uuid7)
+    content: Mapped[str] = mapped_column(CompressedText)
     cost: Mapped[int] = mapped_column(default=0)
     chat_type: Mapped[MessageType] = mapped_column(Enum(MessageType))
     thread_id: Mapped[UUID] = mapped_column(db.ForeignKey("thread.id"))
@@ -63,13 +119,18 @@ class Chat(db.Model):  # type: ignore
         Optional["Chat"]
     ] = db.relationship(  # type: ignore[assignment]
         remote_side=[id],
-        backref=db.backref("next_chat", uselist=False, cascade="all, delete"),
+        # more than one reply when the conversation branches
+        backref=db.backref(
+            "replies", order_by="Chat.order", cascade="all, delete"
+        ),
         uselist=False,
         single_parent=True,
         foreign_keys=[previous_chat_id],
     )
     sent_time: Mapped[datetime] = mapped_column(default=utcnow)
     order: Mapped[int] = mapped_column(default=0)
+    # set when the chat is deleted, until `Thread.purge_deleted` removes it
+    deleted_at: Mapped[Optional[datetime]] = mapped_column(index=True)
     thread: Mapped["Thread"] = db.relationship(  # type: ignore[assignment]
         back_populates="chats",
         lazy=True,
@@ -88,19 +149,44 @@ class Chat(db.Model):  # type: ignore
         db.UniqueConstraint(
             "thread_id", "order", name="unique_order_per_thread"
         ),
+        # finds a thread's first chat
+        Index(
+            "ix_chat_thread_id_previous_chat_id",
+            "thread_id",
+            "previous_chat_id",
+        ),
+        # finds a chat's next chat
+        Index("ix_chat_previous_chat_id", "previous_chat_id"),
     )
 
     def __repr__(self):
         return "{}[{}](user={}, cost={}, thread={}, prev={}, next={})".format(
             self.chat_type.value.title(),
-            self.id.hex[:6],
+            self.id.hex[-6:],
             self.thread.user.name,
             self.cost,
-            self.thread_id.hex[:6],
-            self.previous_chat_id.hex[:6] if self.previous_chat_id else "none",
-            self.next_chat_id.hex[:6] if self.next_chat_id else "none",
+            self.thread_id.hex[-6:],
+            self.previous_chat_id.hex[-6:]
+            if self.previous_chat_id
+            else "none",
+            self.next_chat_id.hex[-6:] if self.next_chat_id else "none",
         )
 
+    @property
+    def next_chat(self) -> "Chat | None":
+        """get the reply on the thread's active branch, or the latest one"""
+        replies = [chat for chat in self.replies if chat.deleted_at is None]
+        branch = self.thread.branch_ids
+        for chat in replies:
+            if chat.id in branch:
+                return chat
+        return replies[-1] if replies else None
+
+    @next_chat.setter
+    def next_chat(self, chat: "Chat"):
+        """make `chat` a reply to this chat"""
+        chat.previous_chat = self
+
     @property
     def next_chat_id(self) -> "UUID | None":
         """get the next chat's id"""
@@ -160,17 +246,83 @@ class Chat(db.Model):  # type: ignore
         for media in self.media:
             media.delete(commit)
 
+    def mark_deleted(self):
+        """
+        hide the chat and the chats after it on its branches straight
+        away, and leave the rows to `Thread.purge_deleted`
+        """
+        later = later_chats(self.id)
+        chat_ids = db.session.scalars(
+            select(Chat.id)
+            .join(later, later.c.id == Chat.id)
+            .where(Chat.deleted_at.is_(None))
+            .prefix_with(RECURSION_HINT, dialect="mysql")
+        ).all()
+        threads = db.session.execute(
+            select(Thread.id, Thread.user_id).where(
+                Thread.id == self.thread_id
+            )
+        ).all()
+        # unlinked, so the previous chat is the last in the thread again
+        # by id, mysql cannot update a table a subquery reads from
+        db.session.execute(
+            update(Chat)
+            .where(Chat.id.in_(chat_ids))
+            .values(deleted_at=datetime.utcnow(), previous_chat_id=None),
+            execution_options={"synchronize_session": False},
+        )
+        # a branch through the chat is shown up to the chat before it
+        db.session.execute(
+            update(Thread)
+            .where(
+                Thread.id == self.thread_id,
+                Thread.active_chat_id.in_(chat_ids),
+            )
+            .values(active_chat_id=self.previous_chat_id),
+            execution_options={"synchronize_session": False},
+        )
+        db.session.commit()
+        forget_chats(chat_ids, threads)
+
+    @classmethod
+    def delete_many(cls, chat_ids: "Sequence[UUID]") -> int:
+        """
+        delete chats and their media using one statement per table, and
+        return the number of chats deleted
+        """
+        if not chat_ids:
+            return 0
+        threads = db.session.execute(
+            select(Thread.id, Thread.user_id).where(
+                Thread.id.in_(
+                    select(cls.thread_id).where(cls.id.in_(chat_ids))
+                )
+            )
+        ).all()
+        delete_chats(cls.id.in_(chat_ids), chat_ids, threads)
+        return len(chat_ids)
+
 
 class Thread(db.Model):  # type: ignore
     """A conversation thread"""
 
     serialize_rules = ("-user",)
+    __table_args__ = (
+        Index(
+            "ix_thread_user_id_closed_created_at",
+            "user_id",
+            "closed",
+            "created_at",
+        ),
+    )
 
     title: Mapped[str] = mapped_column(db.String(80))
     chats: Mapped[List["Chat"]] = db.relationship(  # type: ignore[assignment]
         back_populates="thread",
         cascade="all, delete-orphan",
         order_by="Chat.order",
+        primaryjoin="and_(Thread.id == Chat.thread_id,"
+        " Chat.deleted_at.is_(None))",
     )
     user_id: Mapped[UUID] = mapped_column(ForeignKey("user.id"))
     user: Mapped["User"] = db.relationship(  # type: ignore[assignment]
@@ -180,11 +332,20 @@ class Thread(db.Model):  # type: ignore
         foreign_keys=[user_id],
     )
     closed: Mapped[bool] = mapped_column(default=False)
+    # the order of the next chat, bumped by `allocate_order`
+    next_order: Mapped[int] = mapped_column(default=0, server_default="0")
+    # the last chat on the branch being shown. not a foreign key, as
+    # threads are imported before their chats
+    active_chat_id: Mapped[Optional[UUID]] = mapped_column()
+    # set when the thread is deleted, until `purge_deleted` removes it
+    deleted_at: Mapped[Optional[datetime]] = mapped_column(index=True)
+    # set while the thread's chats are held in a `ThreadArchive`
+    archived_at: Mapped[Optional[datetime]] = mapped_column()
 
     def __repr__(self):
         num_chats = len(self.chats)  # type: ignore
         return "Thread[{}](user={}, chats={}, closed={})".format(
-            self.id.hex[:6],
+            self.id.hex[-6:],
             self.user.name,
             num_chats,
             "✔" if self.closed else "✗",
@@ -192,19 +353,87 @@ class Thread(db.Model):  # type: ignore
 
     @property
     def cost(self) -> int:
-        """total cost of all messages"""
+        """total cost of all messages, including archived ones"""
+        if self.archived_at is not None:
+            return self.archived(ThreadArchive.cost)
         return sum(chat.cost for chat in self.chats)  # type: ignore
 
     @property
     def chat_count(self) -> int:
-        """number of messages in the thread"""
+        """number of messages in the thread, including archived ones"""
+        if self.archived_at is not None:
+            return self.archived(ThreadArchive.chat_count)
         return len(self.chats)  # type: ignore
 
+    def archived(self, column: "Mapped[int]") -> int:
+        """read a total kept in the thread's archive"""
+        return (
+            db.session.scalar(
+                select(column).where(ThreadArchive.thread_id == self.id)
+            )
+            or 0
+        )
+
+    @property
+    def history(self) -> "list[Chat]":
+        """
+        get the chats on the active branch, oldest first, walking back
+        from its last chat in one query
+        """
+        if self.active_chat_id is None:
+            return list(self.chats)  # type: ignore
+        earlier = earlier_chats(self.active_chat_id)
+        chats = (
+            Chat.query.join(earlier, earlier.c.id == Chat.id)
+            .filter(Chat.deleted_at.is_(None))
+            .order_by(Chat.order)
+            .prefix_with(RECURSION_HINT, dialect="mysql")
+            .all()
+        )
+        self._branch = (self.active_chat_id, {chat.id for chat in chats})
+        return chats
+
+    @property
+    def branch_ids(self) -> "set[UUID]":
+        """
+        get the ids of the chats on the active branch, read once for each
+        branch shown
+        """
+        if self.active_chat_id is None:
+            return set()
+        branch: "tuple[Optional[UUID], set[UUID]]" = getattr(
+            self, "_branch", (None, set())
+        )
+        key, ids = branch
+        if key != self.active_chat_id:
+            earlier = earlier_chats(self.active_chat_id)
+            ids = set(
+                db.session.scalars(
+                    select(earlier.c.id).prefix_with(
+                        RECURSION_HINT, dialect="mysql"
+                    )
+                )
+            )
+            self._branch = (self.active_chat_id, ids)
+        return ids
+
     @property
     def last_chat(self) -> "Chat":
-        """get the last chat in the thread"""
+        """get the last chat on the active branch"""
+        # the active chat is read from the row, it may have just changed
+        chat = (
+            Chat.query.join(Thread, Thread.active_chat_id == Chat.id)
+            .filter(Thread.id == self.id, Chat.deleted_at.is_(None))
+            .first()
+        )
+        if chat is not None:
+            return chat
         return (
-            Chat.query.filter(Chat.thread_id == self.id, ~Chat.next_chat.has())
+            Chat.query.filter(
+                Chat.thread_id == self.id,
+                Chat.deleted_at.is_(None),
+                ~Chat.replies.any(),
+            )
             .order_by(Chat.order.desc())
             .first()
         )  # type: ignore
@@ -222,17 +451,20 @@ class Thread(db.Model):  # type: ignore
         logging.debug(
             "adding %s to thread %s: %s",
             chat_type.value.lower(),
-            self.id.hex[:6],
+            self.id.hex[-6:],
             content[:20],
         )
-        previous_chat = previous_chat or self.last_chat
-        # TODO: if `previous_chat` already has a `next_chat` then
-        #       perform doubly-linked list insertion
-
         if previous_chat and previous_chat.thread_id != self.id:
             raise ValueError("previous_chat not in same thread")
 
-        order = previous_chat.order + 1 if previous_chat else 0
+        # the thread's row stays locked until the chat is committed, so
+        # concurrent adds also agree on the last chat
+        order = self.allocate_order()
+        previous_chat = previous_chat or self.last_chat
+        # a reply to a chat that already has one starts a new branch, and
+        # the chats on the other branches keep their orders and links
+        self.active_chat_id = attrs.setdefault("id", uuid7())
+
         new_chat = Chat.create(
             commit,
             content=content,
@@ -247,6 +479,49 @@ class Thread(db.Model):  # type: ignore
         db.session.refresh(self)
         return new_chat
 
+    def allocate_order(self, count: int = 1) -> int:
+        """
+        reserve `count` consecutive chat orders in the thread and return
+        the first, with one atomic update of the thread's counter
+        """
+        if not instance_state(self).persistent:
+            db.session.add(self)
+            db.session.flush([self])
+        bump = (
+            update(Thread)
+            .where(Thread.id == self.id)
+            .values(next_order=Thread.next_order + count)
+        )
+        options = {"synchronize_session": False}
+        if db.engine.dialect.update_returning:
+            next_order = db.session.execute(
+                bump.returning(Thread.next_order), execution_options=options
+            ).scalar_one()
+        else:
+            # mysql: the update locks the row, so this reads our own bump
+            db.session.execute(bump, execution_options=options)
+            # raises if the thread is gone instead of returning None
+            next_order = db.session.execute(
+                select(Thread.next_order).where(Thread.id == self.id)
+            ).scalar_one()
+        return next_order - count
+
+    def activate(self, chat: "Chat"):
+        """show the branch through `chat`, down to its latest chat"""
+        if chat.thread_id != self.id:
+            raise ValueError("chat not in same thread")
+        later = later_chats(chat.id)
+        chat_id = db.session.scalar(
+            select(Chat.id)
+            .join(later, later.c.id == Chat.id)
+            .where(Chat.deleted_at.is_(None))
+            .order_by(Chat.order.desc())
+            .limit(1)
+            .prefix_with(RECURSION_HINT, dialect="mysql")
+        )
+        self.update(active_chat_id=chat_id)
+        cache.delete(chats_cache_key(thread_id=self.pk))
+
     def add_query(
         self,
         content: str,
@@ -275,21 +550,297 @@ class Thread(db.Model):  # type: ignore
 
     def close(self):
         """Close the thread"""
-        logging.debug("closing thread %s", self.id.hex[:6])
+        logging.debug("closing thread %s", self.id.hex[-6:])
         self.update(closed=True)
 
     def clear(self):
         """Clear all messages in the thread"""
+        logging.debug("clearing chats from thread %s", self.id.hex[-6:])
+        Thread.delete_many([self.id], chats_only=True)
+
+    @classmethod
+    def delete_many(
+        cls, thread_ids: "Sequence[UUID]", chats_only: bool = False
+    ) -> int:
+        """
+        delete threads with their chats and media, or only the chats, using
+        one statement per table, and return the number of chats deleted
+        """
+        if not thread_ids:
+            return 0
+        threads = db.session.execute(
+            select(cls.id, cls.user_id).where(cls.id.in_(thread_ids))
+        ).all()
+        chat_ids = db.session.scalars(
+            select(Chat.id).where(Chat.thread_id.in_(thread_ids))
+        ).all()
+        if chats_only:
+            db.session.execute(
+                update(cls)
+                .where(cls.id.in_(thread_ids))
+                .values(active_chat_id=None),
+                execution_options={"synchronize_session": False},
+            )
+        delete_chats(
+            Chat.thread_id.in_(thread_ids),
+            chat_ids,
+            threads,
+            () if chats_only else thread_ids,
+        )
+        return len(chat_ids)
+
+    @classmethod
+    def mark_deleted(
+        cls, thread_ids: "Sequence[UUID]", chats_only: bool = False
+    ) -> int:
+        """
+        hide threads, or only their chats, straight away and leave the rows
+        to `purge_deleted`, returning the number of threads affected
+        """
+        if not thread_ids:
+            return 0
+        threads = db.session.execute(
+            select(cls.id, cls.user_id).where(
+                cls.id.in_(thread_ids), cls.deleted_at.is_(None)
+            )
+        ).all()
+        live = (Chat.thread_id.in_(thread_ids), Chat.deleted_at.is_(None))
+        chat_ids = db.session.scalars(select(Chat.id).where(*live)).all()
+        if chats_only:
+            statement = (
+                update(Chat)
+                .where(*live)
+                .values(deleted_at=datetime.utcnow(), previous_chat_id=None)
+            )
+            db.session.execute(
+                update(cls)
+                .where(cls.id.in_(thread_ids))
+                .values(active_chat_id=None),
+                execution_options={"synchronize_session": False},
+            )
+        else:
+            # a thread's chats are hidden with it
+            statement = (
+                update(cls)
+                .where(cls.id.in_(thread_ids), cls.deleted_at.is_(None))
+                .values(deleted_at=datetime.utcnow())
+            )
+        db.session.execute(
+            statement, execution_options={"synchronize_session": False}
+        )
+        db.session.commit()
+        forget_chats(chat_ids, threads)
+        return len(threads)
+
+    @classmethod
+    def purge_deleted(
+        cls, batch_size: int = 100, pause: float = 0.0
+    ) -> "tuple[int, int]":
+        """
+        delete hidden threads and chats a batch at a time, sleeping between
+        batches, and return how many threads and chats were deleted
+        """
+        threads = purge_batches(
+            select(cls.id).where(cls.deleted_at.is_not(None)),
+            cls.delete_many,
+            batch_size,
+            pause,
+        )
+        chats = purge_batches(
+            select(Chat.id).where(Chat.deleted_at.is_not(None)),
+            Chat.delete_many,
+            batch_size,
+            pause,
+        )
+        logging.info("purged %d threads and %d chats", threads, chats)
+        return threads, chats
+
+    @classmethod
+    def archivable(
+        cls, idle_before: datetime, closed_before: datetime, limit: int = 100
+    ) -> "Sequence[UUID]":
+        """
+        get threads that have been idle since `idle_before`, or closed and
+        idle since `closed_before`, and can be archived
+        """
+        last_activity = func.coalesce(
+            select(func.max(Chat.sent_time))
+            .where(Chat.thread_id == cls.id)
+            .scalar_subquery(),
+            cls.created_at,
+        )
+        return db.session.scalars(
+            select(cls.id)
+            .where(
+                cls.deleted_at.is_(None),
+                cls.archived_at.is_(None),
+                # tombstoned chats wait for `purge_deleted` to drop their
+                # media, so their threads are archived on a later run
+                ~select(Chat.id)
+                .where(Chat.thread_id == cls.id, Chat.deleted_at.is_not(None))
+                .exists(),
+                (last_activity < idle_before)
+                | (cls.closed & (last_activity < closed_before)),
+            )
+            .order_by(cls.id)
+            .limit(limit)
+        ).all()
+
+    @classmethod
+    def archive_many(
+        cls, thread_ids: "Sequence[UUID]"
+    ) -> "tuple[int, int, int]":
+        """
+        move the chats and media of threads into compressed archives,
+        returning the number of chats archived and the bytes they took
+        before and after compression
+        """
+        # locked until the commit, so no chat is added to a thread while
+        # its chats are copied out
+        thread_ids = db.session.scalars(
+            select(cls.id)
+            .where(cls.id.in_(thread_ids), cls.archived_at.is_(None))
+            .with_for_update()
+        ).all()
+        if not thread_ids:
+            return 0, 0, 0
+        payloads: "dict[UUID, dict[str, list]]" = {
+            id: {"chats": [], "media": []} for id in thread_ids
+        }
+        chat_threads: "dict[UUID, UUID]" = {}
+        for row in db.session.execute(
+            select(*Chat.__table__.columns)
+            .where(Chat.thread_id.in_(thread_ids))
+            .order_by(Chat.thread_id, Chat.order)
+        ):
+            chat_threads[row.id] = row.thread_id
+            payloads[row.thread_id]["chats"].append(
+                dump_row(Chat.__table__, row)
+            )
+        for row in db.session.execute(
+            select(*ChatMedia.__table__.columns).where(
+                ChatMedia.chat_id.in_(chat_threads)
+            )
+        ):
+            payloads[chat_threads[row.chat_id]]["media"].append(
+                dump_row(ChatMedia.__table__, row)
+            )
+
+        archives = []
+        raw_size = stored_size = 0
+        for thread_id, payload in payloads.items():
+            raw = json.dumps(payload, separators=(",", ":")).encode()
+            data = zlib.compress(raw, 9)
+            raw_size += len(raw)
+            stored_size += len(data)
+            archives.append(
+                {
+                    "id": uuid7(),
+                    "thread_id": thread_id,
+                    "data": data,
+                    "chat_count": len(payload["chats"]),
+                    "cost": sum(chat["cost"] for chat in payload["chats"]),
+                    "raw_size": len(raw),
+                }
+            )
+        db.session.execute(insert(ThreadArchive), archives)
+        chat_ids = list(chat_threads)
+        if chat_ids:
+            db.session.execute(
+                insert(ArchivedChat),
+                [{"id": id, "thread_id": chat_threads[id]} for id in chat_ids],
+            )
+        # only the chats in the archives, where a lock is not taken
+        remove_chats(Chat.id.in_(chat_ids))
+        db.session.execute(
+            update(cls)
+            .where(cls.id.in_(thread_ids))
+            .values(archived_at=datetime.utcnow()),
+            execution_options={"synchronize_session": False},
+        )
+        forget_instances(set(chat_ids))
+        threads = db.session.execute(
+            select(cls.id, cls.user_id).where(cls.id.in_(thread_ids))
+        ).all()
+        db.session.commit()
+        forget_chats(chat_ids, threads)
         logging.debug(
-            "clearing %d chats from thread %s",
-            len(self.chats),
-            self.id.hex[:6],
+            "archived %d chats from %d threads into %d bytes",
+            len(chat_ids),
+            len(thread_ids),
+            stored_size,
+        )
+        return len(chat_ids), raw_size, stored_size
+
+    def restore(self):
+        """put the chats and media of an archived thread back"""
+        # a second restore waits for the first, then finds no archive
+        archive = db.session.scalar(
+            select(ThreadArchive)
+            .where(ThreadArchive.thread_id == self.id)
+            .with_for_update()
+        )
+        if archive is None:  # pragma: no cover
+            return
+        logging.debug("restoring thread %s from archive", self.id.hex[-6:])
+        payload = json.loads(zlib.decompress(archive.data))
+        try:
+            # a chat's previous chat always comes before it
+            if payload["chats"]:
+                db.session.execute(
+                    insert(Chat),
+                    [load_row(Chat.__table__, c) for c in payload["chats"]],
+                )
+            if payload["media"]:
+                db.session.execute(
+                    insert(ChatMedia),
+                    [
+                        load_row(ChatMedia.__table__, m)
+                        for m in payload["media"]
+                    ],
+                )
+            db.session.execute(
+                delete(ArchivedChat).where(ArchivedChat.thread_id == self.id),
+                execution_options={"synchronize_session": False},
+            )
+            db.session.delete(archive)
+            self.archived_at = None
+            db.session.commit()
+        except IntegrityError as err:
+            db.session.rollback()
+            restored = db.session.scalar(
+                select(ThreadArchive.id).where(
+                    ThreadArchive.thread_id == self.id
+                )
+            )
+            if restored is not None:
+                raise
+            # another request restored it first, where rows aren't locked
+            logging.debug("thread already restored: %s", err.orig)
+            db.session.refresh(self)
+            return
+        forget_chats((), [(self.id, self.user_id)])
+
+    @classmethod
+    def restore_chat(
+        cls, chat_id: UUID, user_id: Optional[UUID] = None
+    ) -> bool:
+        """
+        restore the archived thread holding a chat, optionally only if
+        `user_id` owns it, and return whether one was restored
+        """
+        query = (
+            select(cls)
+            .join(ArchivedChat, ArchivedChat.thread_id == cls.id)
+            .where(ArchivedChat.id == chat_id)
         )
-        for chat in Chat.query.filter(
-            Chat.thread_id == self.id,
-            Chat.previous_chat_id == None,  # noqa: E711
-        ).all():
-            cast(Chat, chat).delete()
+        if user_id is not None:
+            query = query.where(cls.user_id == user_id)
+        thread = db.session.scalar(query)
+        if thread is None:
+            return False
+        thread.restore()
+        return True
 
     @classmethod
     def create(self, commit=True, **attrs):
@@ -309,10 +860,203 @@ class Thread(db.Model):  # type: ignore
 
     def delete(self, commit=True):
         """Delete the thread"""
-        super().delete(commit)
-        if commit:
-            cache.delete(thread_cache_key(thread_id=self.pk))
-            cache.delete(threads_cache_key(user_id=self.user.pk))
+        if not commit:  # pragma: no cover
+            # cascades through the session when the caller commits
+            return super().delete(commit)
+        Thread.delete_many([self.id])
+
+
+class ThreadArchive(db.Model):  # type: ignore
+    """The chats and media of a thread, compressed into one row"""
+
+    thread_id: Mapped[UUID] = mapped_column(
+        ForeignKey("thread.id"), unique=True
+    )
+    # zlib-compressed json of the thread's chat and media rows
+    data: Mapped[bytes] = mapped_column(LargeBinary)
+    chat_count: Mapped[int] = mapped_column(default=0)
+    # the total cost of the chats, still counted against the user
+    cost: Mapped[int] = mapped_column(default=0)
+    raw_size: Mapped[int] = mapped_column(default=0)
+
+    def __repr__(self):
+        return "ThreadArchive[{}](chats={}, size={}/{})".format(
+            self.thread_id.hex[-6:],
+            self.chat_count,
+            len(self.data),
+            self.raw_size,
+        )
+
+
+class ArchivedChat(db.Model):  # type: ignore
+    """The thread of a chat held in a `ThreadArchive`, by the chat's id"""
+
+    thread_id: Mapped[UUID] = mapped_column(
+        ForeignKey("thread.id"), index=True
+    )
+
+
+def dump_row(table: "Table", row: "Row") -> "dict[str, Any]":
+    """turn a row into json-friendly values"""
+    values: "dict[str, Any]" = {}
+    for column in table.columns:
+        value = getattr(row, column.key)
+        if isinstance(value, UUID):
+            value = str(value)
+        elif isinstance(value, PyEnum):
+            value = value.name
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        values[column.key] = value
+    return values
+
+
+def load_row(table: "Table", values: "dict[str, Any]") -> "dict[str, Any]":
+    """
+    turn values made by `dump_row` back into column values. columns added
+    since the values were dumped get their defaults
+    """
+    row: "dict[str, Any]" = {}
+    for column in table.columns:
+        if column.key not in values:
+            row[column.key] = column_default(column)
+            continue
+        value = values[column.key]
+        if value is not None:
+            python_type = column.type.python_type
+            if python_type is UUID:
+                value = UUID(value)
+            elif python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif issubclass(python_type, PyEnum):
+                value = python_type[value]
+        row[column.key] = value
+    return row
+
+
+def column_default(column: "Column") -> Any:
+    """the value the orm would insert into a column left out of a row"""
+    default = column.default
+    if default is None:
+        return None
+    if default.is_callable:
+        return default.arg(None)  # type: ignore[attr-defined]
+    if default.is_scalar:
+        return default.arg  # type: ignore[attr-defined]
+    return None  # pragma: no cover
+
+
+def forget_chats(
+    chat_ids: "Sequence[UUID]", threads: "Sequence[Row[tuple[UUID, UUID]]]"
+):
+    """drop the cached copies of chats and of the threads holding them"""
+    keys = [chat_cache_key(chat_id=str(id)) for id in chat_ids]
+    for thread_id, user_id in threads:
+        keys.append(chats_cache_key(thread_id=str(thread_id)))
+        keys.append(thread_cache_key(thread_id=str(thread_id)))
+        keys.append(threads_cache_key(user_id=str(user_id)))
+    cache.delete_many(*keys)
+
+
+def delete_chats(
+    condition: "ColumnElement[bool]",
+    chat_ids: "Sequence[UUID]",
+    threads: "Sequence[Row[tuple[UUID, UUID]]]",
+    thread_ids: "Sequence[UUID]" = (),
+):
+    """
+    delete the chats matching `condition` with their media, and optionally
+    threads, using one statement per table
+    """
+    from redisflow import celeryapp
+
+    file_ids = db.session.scalars(
+        select(ChatMedia.secret).where(
+            ChatMedia.chat_id.in_(select(Chat.id).where(condition)),
+            ChatMedia.secret != "",
+        )
+    ).all()
+    remove_chats(condition)
+    if thread_ids:
+        options = {"synchronize_session": False}
+        db.session.execute(
+            delete(ArchivedChat).where(ArchivedChat.thread_id.in_(thread_ids)),
+            execution_options=options,
+        )
+        db.session.execute(
+            delete(ThreadArchive).where(
+                ThreadArchive.thread_id.in_(thread_ids)
+            ),
+            execution_options=options,
+        )
+        db.session.execute(
+            delete(Thread).where(Thread.id.in_(thread_ids)),
+            execution_options=options,
+        )
+    # detach loaded copies instead of expiring them on commit, like
+    # rows deleted through the session
+    forget_instances({*chat_ids, *thread_ids})
+    db.session.commit()
+
+    forget_chats(chat_ids, threads)
+    if file_ids:
+        celeryapp.send_task("chatbot.delete_media", args=(list(file_ids),))
+    logging.debug(
+        "deleted %d chats and %d files from %d threads",
+        len(chat_ids),
+        len(file_ids),
+        len(threads),
+    )
+
+
+def remove_chats(condition: "ColumnElement[bool]"):
+    """delete the rows of the chats matching `condition` and their media"""
+    options = {"synchronize_session": False}
+    db.session.execute(
+        delete(ChatMedia).where(
+            ChatMedia.chat_id.in_(select(Chat.id).where(condition))
+        ),
+        execution_options=options,
+    )
+    # chats reference each other, so unlink them before deleting them
+    db.session.execute(
+        update(Chat).where(condition).values(previous_chat_id=None),
+        execution_options=options,
+    )
+    db.session.execute(
+        delete(Chat).where(condition), execution_options=options
+    )
+
+
+def purge_batches(
+    query: "Select[tuple[UUID]]",
+    delete_many: "Callable[[Sequence[UUID]], int]",
+    batch_size: int,
+    pause: float,
+) -> int:
+    """delete the rows a query selects a batch at a time, and count them"""
+    purged = 0
+    while ids := db.session.scalars(query.limit(batch_size)).all():
+        delete_many(ids)
+        purged += len(ids)
+        sleep(pause)
+    return purged
+
+
+def forget_instances(ids: "set[UUID]"):
+    """expunge the loaded chats, threads and media of deleted rows"""
+    for state in list(db.session.identity_map.all_states()):
+        instance = state.obj()
+        if state.class_ is ChatMedia:
+            # read without loading, the row is gone
+            id = state.dict.get("chat_id")
+        elif state.class_ in (Chat, Thread) and state.identity:
+            id = state.identity[0]
+        else:
+            continue
+        # expunging a thread cascades to its chats
+        if id in ids and instance is not None and instance in db.session:
+            db.session.expunge(instance)
 
 
 class ThreadMixin:
@@ -420,11 +1164,12 @@ class ThreadMixin:
             self.type.value,  # type: ignore
             self.name,  # type: ignore
         )
-        for thread in threads:
-            thread.clear()
+        Thread.delete_many([thread.id for thread in threads], chats_only=True)
 
     def get_active_threads(self) -> Sequence[Thread]:
         """Get all active threads"""
         return Thread.query.filter(
-            Thread.user_id == self.id, Thread.closed == False  # noqa: E712
+            Thread.user_id == self.id,
+            Thread.closed == False,  # noqa: E712
+            Thread.deleted_at.is_(None),
         ).all()
@@ -2,12 +2,21 @@
 utilize google image search to find images
 """
 
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass, field
-from typing import Any, Callable, Literal, Optional, TypeVar
+from threading import Lock
+from typing import Any, Callable, Literal, Optional, Sequence, TypeVar
 
 from pydantic import BaseModel
 
+from cookgpt import logging
+from cookgpt.utils import PerProcess
+
 ModelT = TypeVar("ModelT")
+RawResults = list[dict[str, Any]]
+
+_inflight: dict[str, "Future[RawResults]"] = {}
+_inflight_lock = Lock()
 
 
 class ImageResult(BaseModel):
@@ -61,6 +70,29 @@ def _get_serper_api_key():
         )
 
 
+def _get_serper_cache_timeout() -> int:
+    from cookgpt.ext.config import config
+
+    return config.get("SERPER_CACHE_TIMEOUT", 86400)
+
+
+def _make_executor() -> ThreadPoolExecutor:
+    from cookgpt.ext.config import config
+
+    return ThreadPoolExecutor(
+        max_workers=config.get("SERPER_MAX_WORKERS", 4),
+        thread_name_prefix="serper",
+    )
+
+
+_executor = PerProcess(_make_executor)
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """get the thread pool used for concurrent searches"""
+    return _executor.get()
+
+
 @dataclass
 class Serper:
     """Serper Wrapper"""
@@ -93,10 +125,20 @@ class Serper:
     num: int = 10
     """number of results to return"""
 
+    base_url: str = field(default="https://google.serper.dev", repr=False)
+    """serper.dev api root"""
+
+    cache_timeout: int = field(
+        repr=False,
+        compare=False,
+        default_factory=_get_serper_cache_timeout,
+    )
+    """how long (in seconds) to cache results for"""
+
     @property
     def url(self) -> str:
         """url to query"""
-        return "https://google.serper.dev/" + self.type
+        return self.base_url.rstrip("/") + "/" + self.type
 
     def _construct_payload(self) -> dict[str, str]:
         """construct payload for request"""
@@ -120,24 +162,143 @@ class Serper:
             "Content-Type": "application/json",
         }
 
-    def search(
-        self, query: str, model: Callable[..., ModelT] = lambda x: x
-    ) -> list[ModelT]:
-        """fetch results from serper.dev"""
-        import requests
+    def cache_key(self, query: str) -> str:
+        """get the cache key for a query"""
+        from cookgpt.ext.cache import serper_cache_key
+
+        return serper_cache_key(
+            type=self.type,
+            query=query,
+            country=self.country,
+            locale=self.locale,
+            page=self.page,
+            num=self.num,
+            auto_correct=self.auto_correct,
+        )
+
+    def _fetch(self, query: str) -> RawResults:
+        """fetch raw results from serper.dev"""
+        from cookgpt.ext.httpclient import client
 
         payload = self._construct_payload()
         payload["q"] = query
 
-        response = requests.post(
+        logging.debug("Searching serper.dev for %r", query)
+        response = client.post(
             self.url,
             json=payload,
             headers=self._get_headers(),
         )
-        # print(payload)
-        # print(response.request.headers)
         response.raise_for_status()
-        return [model(**result) for result in response.json()[self.type]]
+        return response.json()[self.type]
+
+    def _fetch_shared(self, key: str, query: str) -> RawResults:
+        """
+        fetch raw results, sharing one upstream request between callers
+        that search for the same thing at the same time
+        """
+        with _inflight_lock:
+            future = _inflight.get(key)
+            owner = future is None
+            if owner:
+                future = _inflight[key] = Future()
+        assert future is not None
+        if not owner:
+            logging.debug("Waiting for in-flight search %r", query)
+            return future.result()
+        try:
+            results = self._fetch(query)
+        except BaseException as err:
+            future.set_exception(err)
+            raise
+        else:
+            future.set_result(results)
+            return results
+        finally:
+            with _inflight_lock:
+                _inflight.pop(key, None)
+
+    def search(
+        self,
+        query: str,
+        model: Callable[..., ModelT] = dict,  # type: ignore[assignment]
+    ) -> list[ModelT]:
+        """fetch results from serper.dev"""
+        return self.search_many([query], model)[0]
+
+    def search_async(
+        self,
+        query: str,
+        model: Callable[..., ModelT] = dict,  # type: ignore[assignment]
+    ) -> "Future[list[ModelT]]":
+        """fetch results from serper.dev in the background"""
+        from flask import current_app, has_app_context
+
+        app = (
+            current_app._get_current_object()  # type: ignore[attr-defined]
+            if has_app_context()
+            else None
+        )
+
+        def search() -> list[ModelT]:
+            if app is None:
+                return self.search(query, model)
+            with app.app_context():
+                return self.search(query, model)
+
+        return get_executor().submit(search)
+
+    def search_many(
+        self,
+        queries: Sequence[str],
+        model: Callable[..., ModelT] = dict,  # type: ignore[assignment]
+    ) -> list[list[ModelT]]:
+        """
+        fetch results for several queries, running the uncached ones
+        concurrently
+
+        Args:
+            queries (Sequence[str]): The queries to search for
+            model (Callable, optional): Called with each result's fields
+        Returns:
+            list[list]: The results of each query, in order
+        """
+        from flask import has_app_context
+
+        from cookgpt.ext.cache import cache
+
+        keys = [self.cache_key(query) for query in queries]
+        use_cache = has_app_context() and self.cache_timeout > 0
+        results: dict[str, RawResults] = {}
+        if use_cache:
+            for key, cached in zip(keys, cache.get_many(*keys)):
+                if cached is not None:
+                    results[key] = cached
+        logging.debug(
+            "Found %d of %d searches in cache", len(results), len(keys)
+        )
+        missing = {
+            key: query
+            for key, query in zip(keys, queries)
+            if key not in results
+        }
+        if len(missing) == 1:
+            ((key, query),) = missing.items()
+            results[key] = self._fetch_shared(key, query)
+        elif missing:
+            executor = get_executor()
+            futures = {
+                key: executor.submit(self._fetch_shared, key, query)
+                for key, query in missing.items()
+            }
+            for key, future in futures.items():
+                results[key] = future.result()
+        if use_cache and missing:
+            cache.set_many(
+                {key: results[key] for key in missing},
+                timeout=self.cache_timeout,
+            )
+        return [[model(**result) for result in results[key]] for key in keys]
 
 
 if __name__ == "__main__":
@@ -1,10 +1,9 @@
+from concurrent.futures import Future
 from typing import Optional
 from uuid import UUID
 
-from cookgpt.chatbot.message import get_image_analysis_prompt
 from cookgpt.chatbot.models import ChatMedia
 from cookgpt.chatbot.utils import get_stream_name
-from cookgpt.ext.genai import gemini_vision
 from cookgpt.utils import utcnow
 from redisflow import celeryapp as app
 
@@ -12,6 +11,8 @@ from redisflow import celeryapp as app
 @app.task(name="chatbot.fetch_image_description")
 def fetch_image_description(chatmedia_id: UUID):
     """fetch image description from ai"""
+    from cookgpt.chatbot.message import get_image_analysis_prompt
+    from cookgpt.ext.genai import gemini_vision
 
     chatmedia = ChatMedia.query.get(chatmedia_id)
     assert chatmedia, "Chat media does not exist"
@@ -23,6 +24,27 @@ def fetch_image_description(chatmedia_id: UUID):
     return description
 
 
+@app.task(name="chatbot.delete_media")
+def delete_media(file_ids: list[str]):
+    """delete the files of deleted chat media from imagekit"""
+    from cookgpt.ext.imagekit import delete_files
+
+    delete_files(file_ids)
+
+
+@app.task(name="chatbot.purge_deleted")
+def purge_deleted():
+    """delete hidden threads and chats, a throttled batch at a time"""
+    from cookgpt.chatbot.models import Thread
+    from cookgpt.globals import current_app
+
+    threads, chats = Thread.purge_deleted(
+        batch_size=current_app.config.get("PURGE_BATCH_SIZE", 100),
+        pause=current_app.config.get("PURGE_BATCH_PAUSE", 1.0),
+    )
+    return {"threads": threads, "chats": chats}
+
+
 @app.task(name="chatbot.send_query")
 def send_query(
     query_id: UUID,
@@ -33,9 +55,15 @@ def send_query(
 ):
     """send query to ai and process response"""
 
-    from cookgpt.chatbot.message import TEMPLATES_DIR, create_chat_session
+    from cookgpt.chatbot.message import (
+        TEMPLATES_DIR,
+        ImageSearchParser,
+        attach_images,
+        create_chat_session,
+        search_images,
+    )
     from cookgpt.chatbot.models import Chat, Thread
-    from cookgpt.ext.database import db
+    from cookgpt.ext.database import db, read_from_primary
     from cookgpt.ext.genai import gemini
     from cookgpt.globals import current_app as app
 
@@ -73,17 +101,35 @@ def send_query(
     response_cost = 0
     ai_response = ""
 
+    # start the image search as soon as the directive is streamed
+    images: list[Future] = []
+    parser = ImageSearchParser(
+        on_query=lambda query: images.append(search_images(query))
+    )
+
+    def add_to_stream(text: str):
+        if text:
+            app.redis.xadd(
+                stream,
+                {"token": text, "count": 1, "chunk": text},
+                maxlen=1000,
+            )
+
     # send prompt to ai in chunks
     for chunk in chat.send_message(prompt):
+        text = parser.feed(chunk.text)
         # add to redis stream
-        app.redis.xadd(
-            stream,
-            {"token": chunk.text, "count": 1, "chunk": chunk.text},
-            maxlen=1000,
-        )
+        add_to_stream(text)
         # add to response and cost
-        ai_response += chunk.text
+        ai_response += text
         response_cost += len(chunk.text)
+    text = parser.finish()
+    add_to_stream(text)
+    ai_response += text
+
+    # attach the image search results
+    for search in images:
+        attach_images(response, search)
 
     # update query and response
     response_time = utcnow()
@@ -93,8 +139,10 @@ def send_query(
         sent_time=query_time,
     )
     response.update(
-        content=ai_response,
+        content=ai_response.strip(),
         cost=response_cost,
         sent_time=response_time,
     )
+    # the client fetches the response as soon as the stream completes
+    read_from_primary(thread.user_id)
     app.redis.set(f"{stream}:task", "COMPLETED")
@@ -0,0 +1,186 @@
+"""
+Moving conversations between environments.
+
+A user's threads are exported as JSON lines, one row per line: every
+thread, then every chat, oldest first in each thread, then every media
+file. Each query streams its rows through a server-side cursor, so the
+export holds one batch in memory whatever the size of the account. The
+queries run one after another, since a connection can't run another
+query while it streams.
+"""
+import json
+import zlib
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional
+from uuid import UUID
+
+from sqlalchemy import insert, select
+
+from cookgpt import logging
+from cookgpt.chatbot.models import (
+    Chat,
+    ChatMedia,
+    Thread,
+    ThreadArchive,
+    dump_row,
+    load_row,
+)
+from cookgpt.ext.cache import cache, threads_cache_key
+from cookgpt.ext.database import db
+
+if TYPE_CHECKING:
+    from sqlalchemy import Select, Table
+
+    from cookgpt.ext.database import BaseModel
+
+# the rows of each type, in the order they have to be inserted
+MODELS: "dict[str, type[BaseModel]]" = {
+    "thread": Thread,
+    "chat": Chat,
+    "media": ChatMedia,
+}
+
+
+def export_line(type: str, row: "dict") -> str:
+    """format a row as a line of the export"""
+    return json.dumps({"type": type, "row": row}, separators=(",", ":"))
+
+
+def stream_rows(
+    table: "Table", query: "Select", batch_size: int
+) -> Iterator["dict"]:
+    """yield the rows of a query as json-friendly values, a batch at a time"""
+    result = db.session.execute(query.execution_options(yield_per=batch_size))
+    for row in result:
+        yield dump_row(table, row)
+
+
+def export_threads(
+    user_id: UUID, batch_size: int = 1000, secrets: bool = True
+) -> Iterator[str]:
+    """
+    yield the threads of a user, with their chats and media, as lines
+    of JSON. deleted threads and chats are left out, and archived
+    threads are exported with the chats held in their archives. without
+    `secrets`, the ids of the media files at imagekit are left out
+    """
+    live = (Thread.user_id == user_id, Thread.deleted_at.is_(None))
+    for row in stream_rows(
+        Thread.__table__,
+        select(*Thread.__table__.columns).where(*live).order_by(Thread.id),
+        batch_size,
+    ):
+        # the chats come along, so the thread is imported unarchived
+        row["archived_at"] = None
+        yield export_line("thread", row)
+
+    chats = (
+        select(Chat.id)
+        .join(Thread, Thread.id == Chat.thread_id)
+        .where(*live, Chat.deleted_at.is_(None))
+    )
+    for row in stream_rows(
+        Chat.__table__,
+        select(*Chat.__table__.columns)
+        .where(Chat.id.in_(chats))
+        .order_by(Chat.thread_id, Chat.order),
+        batch_size,
+    ):
+        yield export_line("chat", row)
+    for row in stream_rows(
+        ChatMedia.__table__,
+        select(*ChatMedia.__table__.columns)
+        .where(ChatMedia.chat_id.in_(chats))
+        .order_by(ChatMedia.id),
+        batch_size,
+    ):
+        yield export_line("media", media_row(row, secrets))
+
+    # archives are compressed already, a few at a time is plenty
+    archives = db.session.execute(
+        select(ThreadArchive.data)
+        .join(Thread, Thread.id == ThreadArchive.thread_id)
+        .where(*live)
+        .order_by(ThreadArchive.thread_id)
+        .execution_options(yield_per=10)
+    )
+    for (data,) in archives:
+        payload = json.loads(zlib.decompress(data))
+        for row in payload["chats"]:
+            yield export_line("chat", row)
+        for row in payload["media"]:
+            yield export_line("media", media_row(row, secrets))
+
+
+def media_row(row: "dict", secrets: bool) -> "dict":
+    """leave the imagekit file id out of a media row unless asked for"""
+    if not secrets:
+        row["secret"] = ""
+    return row
+
+
+def read_lines(lines: Iterable[str]) -> Iterator[tuple[str, "dict"]]:
+    """yield the type and row of each line of an export"""
+    for line in lines:
+        if line.strip():
+            item = json.loads(line)
+            yield item["type"], item["row"]
+
+
+def insert_rows(type: str, rows: "list[dict]") -> int:
+    """
+    insert a batch of rows of one type with one statement, skipping the
+    ones already in the database, and return the number inserted
+    """
+    model = MODELS[type]
+    values = [load_row(model.__table__, row) for row in rows]
+    existing = set(
+        db.session.scalars(
+            select(model.id).where(model.id.in_([v["id"] for v in values]))
+        )
+    )
+    values = [v for v in values if v["id"] not in existing]
+    if values:
+        # one executemany, the orm would split it on the null columns
+        db.session.execute(insert(model.__table__), values)
+    db.session.commit()
+    return len(values)
+
+
+def import_threads(
+    lines: Iterable[str],
+    user_id: Optional[UUID] = None,
+    batch_size: int = 1000,
+) -> "dict[str, int]":
+    """
+    insert the rows of an export in batches, keeping their ids, order and
+    links, optionally giving the threads to another user. rows already in
+    the database are skipped, so an interrupted import can be run again.
+    returns the number of rows of each type inserted
+    """
+    counts = dict.fromkeys(MODELS, 0)
+    user_ids: "set[str]" = set()
+    batch: "list[dict]" = []
+    batch_type = ""
+    for type, row in read_lines(lines):
+        if type not in MODELS:
+            raise ValueError(f"unknown row type: {type}")
+        # a chat's previous chat and a media's chat are inserted first
+        if batch and (type != batch_type or len(batch) >= batch_size):
+            counts[batch_type] += insert_rows(batch_type, batch)
+            batch = []
+        if type == "thread":
+            if user_id is not None:
+                row["user_id"] = str(user_id)
+            user_ids.add(row["user_id"])
+        batch.append(row)
+        batch_type = type
+    if batch:
+        counts[batch_type] += insert_rows(batch_type, batch)
+    cache.delete_many(*(threads_cache_key(user_id=id) for id in user_ids))
+    logging.info(
+        "imported %d threads, %d chats and %d media files",
+        counts["thread"],
+        counts["chat"],
+        counts["media"],
+    )
+    return counts
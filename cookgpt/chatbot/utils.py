@@ -1,12 +1,9 @@
 from contextlib import contextmanager
 from datetime import datetime, timezone
-from typing import TYPE_CHECKING, Literal, Optional, Sequence, cast
+from functools import cache as memoize
+from typing import TYPE_CHECKING, Optional, Sequence, cast
 from uuid import UUID, uuid4
 
-import tiktoken
-from langchain.adapters import openai
-from langchain.schema.messages import BaseMessage
-
 from cookgpt import logging
 from cookgpt.chatbot.data.enums import MessageType
 from cookgpt.chatbot.models import Thread
@@ -19,90 +16,116 @@ from cookgpt.utils import abort
 # from langchain_core.messages import HumanMessage
 
 if TYPE_CHECKING:
+    from langchain.schema.messages import BaseMessage
+    from tiktoken import Encoding
+
     from cookgpt.auth.models import User
+    from cookgpt.auth.models.user import UserSnapshot
     from cookgpt.chatbot.callback import ChatCallbackHandler
     from cookgpt.chatbot.models import Chat
 
-encoding = tiktoken.get_encoding("cl100k_base")
+
+@memoize
+def get_encoding() -> "Encoding":
+    """
+    Returns the tokenizer, loading it on first use.
+
+    Loading the encoding takes a while, so it is deferred until a cost is
+    actually computed. Gunicorn loads it in the master process when
+    `preload_app` is enabled, so forked workers share it.
+    """
+    import tiktoken
+
+    logging.debug("Loading cl100k_base encoding")
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def message_cost_key(message: dict, user: "Optional[User]") -> Optional[str]:
+    """Returns the cache key for a message's token cost."""
+    if "id" in message:
+        return f"chat:{message['id']}:cost"
+    if message["role"] == "system" and user is not None:
+        return f"system_msg:{user.pk}:cost"
+    return None
 
 
 def num_tokens_from_messages(
     messages: Sequence[dict], model="gpt-3.5-turbo-0613"
 ):
-    """Returns the number of tokens used by a list of messages."""
+    """
+    Returns the number of tokens used by a list of messages.
+
+    Cached costs are fetched with one `get_many`, the remaining messages
+    are tokenized in a single batch and their costs are written back with
+    one `set_many`, so a prompt costs at most two cache round trips.
+    """
     from cookgpt.auth.models import User
 
-    num_tokens = 0
-    for message in messages:
-        role = cast(Literal["user", "assistant", "system"], message["role"])
-        cost = 4
-
-        # check if message is cached
-        if "id" in message:
-            id = cast(str, message["id"])
-            cache_key = f"chat:{id}:cost"
-            if cache.has(cache_key):
-                logging.debug(
-                    "Using cached %s message cost for chat %r", role, id[:6]
-                )
-                num_tokens += cast(int, cache.get(cache_key))
-                continue  # pragma: no cover
-
-        # check if system message is cached
-        elif role == "system" and (
-            user := getvar("user", _default=None, _type=User)
-        ):
-            id = user.pk
-            cache_key = f"system_msg:{id}:cost"
-            if cache.has(cache_key):
-                logging.debug(
-                    "Using cached system message cost for %r", user.name
-                )
-                num_tokens += cast(int, cache.get(cache_key))
-                continue
-        else:  # pragma: no cover
-            if role == "system":
-                logging.warning("Working outside of user context. ")
-            else:
-                logging.warning("ID not found in %s message.", role)
-        for key, value in message.items():
-            cost += len(encoding.encode(value))
-            if key == "name":  # pragma: no cover
+    user = getvar("user", _default=None, _type=User)
+    keys = [message_cost_key(message, user) for message in messages]
+    lookup = list({key for key in keys if key is not None})
+    cached = dict(zip(lookup, cache.get_many(*lookup))) if lookup else {}
+
+    costs: list[Optional[int]] = [
+        cast(Optional[int], cached.get(key)) if key else None for key in keys
+    ]
+    misses = [i for i, cost in enumerate(costs) if cost is None]
+    logging.debug(
+        "Using cached cost for %d of %d messages",
+        len(messages) - len(misses),
+        len(messages),
+    )
+
+    if misses:
+        # tokenize every value of every uncached message in one batch
+        values: list[str] = []
+        owners: list[int] = []
+        for i in misses:
+            for value in messages[i].values():
+                values.append(value)
+                owners.append(i)
+        for i in misses:
+            cost = 4
+            if "name" in messages[i]:  # pragma: no cover
                 cost += -1  # role is always required and always 1 token
-        logging.debug("Computed cost for %s message: %s", role, cost)
-        # cache the cost
-        if "id" in message:
-            id = cast(str, message["id"])
-            cache_key = f"chat:{id}:cost"
-            logging.debug("Caching cost for %s message %r", role, id[:6])
-            cache.set(cache_key, cost, timeout=0)
-        # cache the system message cost
-        elif role == "system" and (
-            user := getvar("user", _default=None, _type=User)
-        ):
-            id = user.pk
-            cache_key = f"system_msg:{id}:cost"
-            logging.debug("Caching system message cost for %r", user.name)
-            cache.set(cache_key, cost, timeout=0)
-        else:  # pragma: no cover
-            logging.warning(
-                "Unable to cache cost for %s message: %r", role, message
-            )
-
-        num_tokens += cost
+            costs[i] = cost
+        for i, tokens in zip(owners, get_encoding().encode_batch(values)):
+            costs[i] = cast(int, costs[i]) + len(tokens)
+
+        # cache the new costs
+        new_costs: dict[str, int] = {}
+        for i in misses:
+            if (key := keys[i]) is not None:
+                new_costs[key] = cast(int, costs[i])
+            else:  # pragma: no cover
+                role = messages[i]["role"]
+                if role == "system":
+                    logging.warning("Working outside of user context. ")
+                logging.warning(
+                    "Unable to cache cost for %s message: %r",
+                    role,
+                    messages[i],
+                )
+        if new_costs:
+            logging.debug("Caching cost for %d messages", len(new_costs))
+            cache.set_many(new_costs, timeout=0)
+
+    num_tokens = sum(cast(list[int], costs))
     num_tokens += 2  # every reply is primed with <im_start>assistant
     return num_tokens
 
 
 def convert_message_to_dict(message: "BaseMessage") -> dict:
     """convert message to dict"""
+    from langchain.adapters import openai
+
     converted = openai.convert_message_to_dict(message)
     if "id" in message.additional_kwargs:
         converted["id"] = message.additional_kwargs["id"]
     return converted
 
 
-def get_stream_name(user: "User", chat: "Chat") -> str:
+def get_stream_name(user: "User | UserSnapshot", chat: "Chat") -> str:
     """Returns the stream name for a given user and chat."""
     return f"stream:{chat.id.hex}"
 
@@ -126,13 +149,22 @@ def use_chat_callback(cb: "Optional[ChatCallbackHandler]" = None):
         cb.unregister()
 
 
-def get_thread(thread_id: str | UUID, required=True):
-    """Get a thread using it's ID"""
+def get_thread(
+    thread_id: str | UUID, required=True, user_id: Optional[UUID] = None
+):
+    """Get a thread using it's ID, only if `user_id` owns it when given"""
     if isinstance(thread_id, str):  # pragma: no cover
         thread_id = UUID(thread_id)
     thread = db.session.get(Thread, thread_id)
+    if thread is not None and thread.deleted_at is not None:
+        thread = None
+    if thread is not None and user_id is not None:
+        if thread.user_id != user_id:
+            thread = None
     if not thread and required:  # pragma: no cover
         abort(404, "Thread not found")
+    if thread is not None and thread.archived_at is not None:
+        thread.restore()
     return thread
 
 
@@ -11,7 +11,7 @@ from cookgpt import docs, logging
 from cookgpt.chatbot import app
 from cookgpt.chatbot.data import examples as ex
 from cookgpt.chatbot.data import schemas as sc
-from cookgpt.chatbot.models import Chat
+from cookgpt.chatbot.models import Chat, Thread
 from cookgpt.chatbot.utils import get_stream_name, get_thread
 from cookgpt.ext import db
 from cookgpt.ext.auth import auth_required
@@ -25,6 +25,7 @@ from cookgpt.utils import abort, api_output
 
 if TYPE_CHECKING:
     from cookgpt.auth.models import User
+    from cookgpt.auth.models.user import UserSnapshot
 
 
 class ChatsView(MethodView):
@@ -52,12 +53,12 @@ class ChatsView(MethodView):
     @app.doc(description=docs.CHAT_GET_CHATS)
     @cache.cached(timeout=0, make_cache_key=chats_cache_key)
     def get(self, query_data):
-        """Get all messages in a thread."""
+        """Get the messages on the active branch of a thread."""
         logging.info("GET all chats from thread")
         thread = get_thread(query_data["thread_id"])
         logging.info("Using thread %s", thread.id)
 
-        return {"chats": [sc.parse_chat(chat) for chat in thread.chats]}
+        return {"chats": [sc.parse_chat(chat) for chat in thread.history]}
 
     @app.input(sc.Chats.Delete.Body, example=ex.Chats.Delete.Body)
     @app.output(
@@ -72,7 +73,7 @@ class ChatsView(MethodView):
         logging.info("DELETE all chats from thread")
         thread = get_thread(json_data["thread_id"])
         logging.info("Clearing thread %s", thread.id)
-        thread.clear()
+        Thread.mark_deleted([thread.id], chats_only=True)
 
         return {"message": "All chats deleted"}
 
@@ -94,7 +95,15 @@ class ChatView(MethodView):
         """Get a single chat from a thread."""
         logging.info("GET chat %s", chat_id)
         get_current_user()
-        chat = Chat.query.filter(Chat.id == chat_id).first()
+        query = Chat.query.join(Chat.thread).filter(
+            Chat.id == chat_id,
+            Chat.deleted_at.is_(None),
+            Thread.deleted_at.is_(None),
+        )
+        chat = query.first()
+        # a chat in an archive brings its thread back
+        if not chat and Thread.restore_chat(chat_id):
+            chat = query.first()
         if not chat:
             abort(404, "Chat not found")
         return sc.parse_chat(chat)
@@ -110,12 +119,43 @@ class ChatView(MethodView):
         """Delete a single chat from a thread."""
         logging.info("DELETE chat %s from thread", chat_id)
         chat = db.session.get(Chat, chat_id)
-        if not chat:
+        if not chat and Thread.restore_chat(chat_id):
+            chat = db.session.get(Chat, chat_id)
+        if not chat or chat.deleted_at is not None:
             return {"message": "Chat not found"}, 404
         logging.info("Deleting from thread %s", chat.thread.id)
-        chat.delete()
+        chat.mark_deleted()
         return {"message": "Chat deleted"}
 
+    @app.output(
+        sc.Chats.Get.Response,
+        200,
+        example=ex.Chats.Get.Response,
+        description="The messages on the branch",
+    )
+    @api_output(
+        sc.Chat.NotFound,
+        404,
+        example=ex.Chat.Get.NotFound,
+        description="An error when the specified chat is not found",
+    )
+    @app.doc(description=docs.CHAT_PATCH_CHAT)
+    def patch(self, chat_id):
+        """Switch a thread to the branch through a chat."""
+        logging.info("PATCH branch through chat %s", chat_id)
+        user: "UserSnapshot" = get_current_user()
+        chat = db.session.get(Chat, chat_id)
+        if not chat and Thread.restore_chat(chat_id, user.id):
+            chat = db.session.get(Chat, chat_id)
+        if not chat or chat.deleted_at is not None:
+            abort(404, "Chat not found")
+        # someone else's thread is not found either
+        thread = get_thread(chat.thread_id, False, user.id)
+        if thread is None:
+            abort(404, "Chat not found")
+        thread.activate(chat)
+        return {"chats": [sc.parse_chat(chat) for chat in thread.history]}
+
     @app.input(
         sc.Chat.Post.Body, example=ex.Chat.Post.Body, location="form_and_files"
     )
@@ -159,15 +199,27 @@ class ChatView(MethodView):
 
         user_query: str = form_and_files_data.get("query", "")
         image: Optional[FileStorage] = form_and_files_data.get("image", None)
-        user: "User" = get_current_user()
+        user: "UserSnapshot" = get_current_user()
 
         # create a new thread if one is not specified
         if "thread_id" in form_and_files_data:
             thread = get_thread(form_and_files_data["thread_id"])
         else:
-            thread = user.create_thread(title="New Chat")
+            thread = user.live().create_thread(title="New Chat")
             cache.delete(threads_cache_key(user_id=user.sid))
 
+        previous_chat: Optional[Chat] = None
+        if "previous_chat_id" in form_and_files_data:
+            previous_chat = db.session.get(
+                Chat, form_and_files_data["previous_chat_id"]
+            )
+            if (
+                not previous_chat
+                or previous_chat.deleted_at is not None
+                or previous_chat.thread_id != thread.id
+            ):
+                abort(404, "Chat not found")
+
         # check if the thread has reached its maximum cost
         if thread.cost >= user.max_chat_cost:
             abort(400, "Thread has reached its maximum cost")
@@ -180,7 +232,7 @@ class ChatView(MethodView):
             logging.info("POST chat to thread")
         logging.info("Using thread %s", thread.id)
 
-        query = thread.add_query("")
+        query = thread.add_query("", previous_chat=previous_chat)
         response = query.reply("")
 
         # upload the image to imagekit
@@ -298,7 +350,7 @@ def read_stream(chat_id: UUID):
 app.add_url_rule(
     "/<uuid:chat_id>",
     view_func=ChatView.as_view("single_chat"),
-    methods=["GET", "DELETE"],
+    methods=["GET", "DELETE", "PATCH"],
 )
 app.add_url_rule("/all", view_func=ChatsView.as_view("all_chats"))
 app.add_url_rule("/", view_func=ChatView.as_view("query"), methods=["POST"])
@@ -4,6 +4,7 @@ from uuid import UUID
 
 from apiflask.views import MethodView
 from flask_jwt_extended import get_current_user
+from sqlalchemy import select
 
 from cookgpt import logging
 from cookgpt.chatbot import app
@@ -14,9 +15,10 @@ from cookgpt.chatbot.utils import get_thread
 from cookgpt.ext.auth import auth_required
 from cookgpt.ext.cache import thread_cache_key  # noqa
 from cookgpt.ext.cache import cache, threads_cache_key
+from cookgpt.ext.database import db
 
 if TYPE_CHECKING:
-    from cookgpt.auth.models.user import User
+    from cookgpt.auth.models.user import UserSnapshot
 
 
 class ThreadView(MethodView):
@@ -41,9 +43,9 @@ class ThreadView(MethodView):
         supplying the `title` field in the body of the request
         """
         title = json_data.get("title", "New Thread")
-        user: "User" = get_current_user()
+        user: "UserSnapshot" = get_current_user()
         logging.info(f"POST thread {title!r} by {user.name!r}")
-        thread = user.create_thread(title=title)
+        thread = user.live().create_thread(title=title)
         return {
             "message": "Thread created successfully",
             "thread": thread,
@@ -68,7 +70,7 @@ class ThreadView(MethodView):
         """Delete a thread and all chats within it"""
         logging.info(f"DELETE thread {thread_id!r}")
         thread = get_thread(thread_id)
-        thread.delete()
+        Thread.mark_deleted([thread.id])
         return {"message": "Thread deleted successfully"}
 
 
@@ -81,21 +83,25 @@ class ThreadsView(MethodView):
     @cache.cached(timeout=0, make_cache_key=threads_cache_key)
     def get(self) -> dict:
         """Get all threads"""
-        user: "User" = get_current_user()
+        user: "UserSnapshot" = get_current_user()
         logging.info("GET all threads")
         return sc.Threads.Get.Response().dump(
-            {"threads": user.get_active_threads()}
+            {"threads": user.live().get_active_threads()}
         )
 
     @app.output(sc.Threads.Delete.Response)
     def delete(self):
         """Delete all threads"""
         logging.info("DELETE all threads")
-        all_threads = list(
-            Thread.query.filter(Thread.closed.__eq__(False)).all()
-        )
-        for thread in all_threads:
-            thread.delete()
+        user: "UserSnapshot" = get_current_user()
+        all_threads = db.session.scalars(
+            select(Thread.id).where(
+                Thread.user_id == user.id,
+                Thread.closed == False,  # noqa: E712
+                Thread.deleted_at.is_(None),
+            )
+        ).all()
+        Thread.mark_deleted(all_threads)
         if len(all_threads) == 1:  # pragma: no cover
             substr = "1 thread"
         else:  # pragma: no cover
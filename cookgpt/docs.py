@@ -40,6 +40,9 @@ The output of this endpoint is similar to the `/auth/login` endpoint."""
 AUTH_LOGOUT = """Use this endpoint to logout a user. This will invalidate the user's refresh token and access token. The user will have to login again to get a new authentication info."""
 
 
+AUTH_REVOKE = """Use this endpoint to revoke every token issued before a time, for all users or for a single user. Users holding a revoked token will have to login again. Only admins can use this endpoint."""
+
+
 AUTH_SIGNUP = """Use this endpoint to register a new user. If an error occurs, the error message will be returned in the response body."""
 
 
@@ -47,6 +50,8 @@ USER_INFO = """Get all information about a user."""
 
 USER_UPDATE = """Update a user's information. Each of the fields in the request body is optional. Only the fields that are specified will be updated."""
 
+USER_EXPORT = """Download all of the user's threads, with their messages and media, as JSON lines. The file is streamed as it is read, one thread, message or media file per line: every thread comes first, then every message, oldest first in each thread, then every media file."""
+
 USER_DELETE = """Delete a user's account. **This action cannot be undone**."""
 
 
@@ -88,6 +93,11 @@ The `streaming` field in the response body is used to determine if the AI assist
 
 If the user does not have enough tokens to send the message, a dummy response will be returned in the response body. Neither the query nor the dummy response will not be saved in the database.
 
-> INFO: To identify a dummy response, check if the `chat.cost` field is `0`."""
+> INFO: To identify a dummy response, check if the `chat.cost` field is `0`.
+
+The `previous_chat_id` field can be used to edit and resend an earlier message. The new message follows the specified chat and starts a new branch of the thread, leaving the other branches as they are."""
+
+CHAT_PATCH_CHAT = """Use this endpoint to switch a thread to the branch that goes through a specific chat. The thread then shows that branch, down to its latest message, and new messages follow it. The messages on the branch are returned in the response body. You need to specify the chat ID in the URL."""
+
 
 CHAT_READ_STREAM = """Use this endpoint to read the AI assistant's response bit by bit. This endpoint is used when the AI assistant is streaming it's response. The `chat_id` url parameter is used to specify the chat that you want to read from. The `id` field in the response body from the `/chat` endpoint contains the `chat_id`."""
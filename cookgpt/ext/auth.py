@@ -7,11 +7,9 @@ from flask_jwt_extended import JWTManager, jwt_required
 from sentry_sdk import set_user
 
 from cookgpt import docs
-from cookgpt.ext.database import db
 
 if TYPE_CHECKING:  # pragma: no cover
     from cookgpt.app import App
-    from cookgpt.auth.models.user import User
 
 
 auth = HTTPTokenAuth(description=docs.SECURITY)
@@ -45,19 +43,32 @@ def auth_required(
     return decorator
 
 
+def is_stateless(payload: dict) -> bool:
+    """
+    check if a token is trusted on its signature and expiry, with only
+    the revocation set consulted
+    """
+    from cookgpt.globals import current_app as app
+
+    return payload["type"] == "access" and bool(
+        app.config.get("JWT_STATELESS_ACCESS_TOKENS", False)
+    )
+
+
 @jwt.token_verification_loader
 def token_verification_callback(header: dict, payload: dict):
     """Token verification callback"""
-    from uuid import UUID
-
     from cookgpt.auth.models import Token
 
-    token = db.session.get(Token, UUID(payload["jti"]))
-    if token is None:  # pragma: no cover
+    if is_stateless(payload):
+        # deactivated tokens are in the revocation set
+        set_user({"id": payload["sub"]})
+        return True
+    state = Token.get_state(payload["jti"], payload["sub"])
+    if state is None:  # pragma: no cover
         return False
-    if token.active:
-        user: "User" = token.user
-        set_user({"id": user.id, "username": user.name, "email": user.email})
+    if state.active:
+        set_user({"id": state.user_id})
         return True
     return False  # pragma: no cover
 
@@ -65,14 +76,14 @@ def token_verification_callback(header: dict, payload: dict):
 @jwt.token_in_blocklist_loader
 def token_in_blocklist_callback(header: dict, payload: dict):
     """Token in blacklist callback"""
-    from uuid import UUID
-
     from cookgpt.auth.models import Token
 
-    token = db.session.get(Token, UUID(payload["jti"]))
-    if token is None:  # pragma: no cover
+    if is_stateless(payload):
+        return Token.is_revoked(payload)
+    state = Token.get_state(payload["jti"], payload["sub"])
+    if state is None:  # pragma: no cover
         return False
-    return token.revoked
+    return state.revoked
 
 
 @jwt.token_verification_failed_loader
@@ -90,11 +101,13 @@ def token_verification_failed_callback(
 @jwt.user_lookup_loader
 def user_loader_callback(header, payload):
     """User loader callback"""
-    from uuid import UUID
-
     from cookgpt.auth.models import User
 
-    return db.session.get(User, UUID(payload["sub"]))
+    # views that write to the user load it with `user.live()`
+    user = User.get_snapshot(payload["sub"])
+    if user is not None:
+        set_user({"id": user.sid, "username": user.name, "email": user.email})
+    return user
 
 
 """NOTE: For cookie-based authentication
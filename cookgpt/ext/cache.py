@@ -2,14 +2,18 @@
 Application cache.
 """
 
-from typing import TYPE_CHECKING
+import pickle
+from typing import TYPE_CHECKING, Any, Optional
 
 import click
+from cachelib.serializers import RedisSerializer
 from flask import request
 from flask_caching import Cache
+from flask_caching.backends import RedisCache
 from flask_jwt_extended import get_current_user
 
 from cookgpt import logging
+from cookgpt.utils import PACKED_ZLIB, pack, unpack
 
 if TYPE_CHECKING:
     from cookgpt.app import App
@@ -17,6 +21,44 @@ if TYPE_CHECKING:
 cache = Cache(with_jinja2_ext=False)
 
 
+class PackedSerializer(RedisSerializer):
+    """
+    pickle values like `RedisSerializer`, but compress the large ones.
+    values written before compression, and counters, still load
+    """
+
+    def __init__(self, threshold: int = 512):
+        self.threshold = threshold
+
+    def dumps(self, value: Any, protocol: int = pickle.HIGHEST_PROTOCOL):
+        data = pickle.dumps(value, protocol)
+        packed = pack(data, self.threshold)
+        if packed[:1] == PACKED_ZLIB:
+            return packed
+        return b"!" + data
+
+    def loads(self, value: Optional[bytes]) -> Any:
+        if value is not None and value[:1] == PACKED_ZLIB:
+            value = b"!" + unpack(value)
+        return super().loads(value)
+
+
+class PackedRedisCache(RedisCache):
+    """a redis cache that compresses large values"""
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        from cookgpt.ext.pools import redis_client
+
+        backend = super().factory(app, config, args, kwargs)
+        # share the app's redis pool instead of opening another one
+        backend._write_client = backend._read_client = redis_client(app)
+        backend.serializer = PackedSerializer(
+            config.get("CACHE_COMPRESS_THRESHOLD", 512)
+        )
+        return backend
+
+
 @click.group()
 def cache_cli():
     """Cache commands."""
@@ -58,6 +100,55 @@ def chats_cache_key(*args, **kwargs) -> str:
     return f"chats:{thread_id}"
 
 
+def token_state_cache_key(*args, **kwargs) -> str:
+    """get the cache key for a token's state"""
+    token_id = kwargs.get("token_id")
+    return f"token:{token_id}:state"
+
+
+def tokens_revoked_before_cache_key(*args, **kwargs) -> str:
+    """
+    get the cache key for the time before which tokens were revoked,
+    either for one user or for everyone
+    """
+    user_id = kwargs.get("user_id")
+    if user_id is None:
+        return "tokens:revoked_before"
+    return f"user:{user_id}:tokens:revoked_before"
+
+
+def user_snapshot_cache_key(*args, **kwargs) -> str:
+    """get the cache key for a user's snapshot"""
+    user_id = kwargs.get("user_id")
+    return f"user:{user_id}:snapshot"
+
+
+def user_version_cache_key(*args, **kwargs) -> str:
+    """get the cache key for the version of a user's snapshot"""
+    user_id = kwargs.get("user_id")
+    return f"user:{user_id}:version"
+
+
+def primary_reads_cache_key(*args, **kwargs) -> str:
+    """get the cache key marking a user's reads for the primary database"""
+    user_id = kwargs.get("user_id")
+    return f"user:{user_id}:primary"
+
+
+def serper_cache_key(*args, **kwargs) -> str:
+    """get the cache key for a serper.dev search"""
+    query = " ".join(kwargs["query"].lower().split())
+    return "serper:{}:{}:{}:{}:{}:{}:{}".format(
+        kwargs["type"],
+        (kwargs.get("country") or "us").lower(),
+        (kwargs.get("locale") or "en").lower(),
+        kwargs.get("page", 1),
+        kwargs.get("num", 10),
+        int(kwargs.get("auto_correct", False)),
+        query,
+    )
+
+
 def init_app(app: "App"):
     """Initialize Flask-Caching."""
 
@@ -65,8 +156,13 @@ def init_app(app: "App"):
     cache.init_app(
         app,
         config={
-            "CACHE_TYPE": "flask_caching.backends.RedisCache",
+            "CACHE_TYPE": "cookgpt.ext.cache.PackedRedisCache",
             "CACHE_REDIS_URL": app.config["REDIS_URL"],
             "CACHE_DEFAULT_TIMEOUT": app.config["CACHE_DEFAULT_TIMEOUT"],
+            "CACHE_COMPRESS_THRESHOLD": app.config.get(
+                "CACHE_COMPRESS_THRESHOLD", 512
+            ),
         },
     )
+    # without this, `delete_many` stops at the first key that isn't cached
+    app.extensions["cache"][cache].ignore_errors = True
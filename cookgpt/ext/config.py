@@ -49,9 +49,14 @@ def export_to_env(config: Dynaconf):
 
 def set_langchain_verbosity(config: Dynaconf):
     """configure langchain verbosity"""
-    import langchain
-
-    langchain.verbose = config.LANGCHAIN_VERBOSE
+    import sys
+
+    # langchain is slow to import and unused by the live chat path, so
+    # only configure it if it has already been loaded
+    # (`cookgpt.chatbot.chain` applies the setting when it is imported)
+    langchain: Any = sys.modules.get("langchain")
+    if langchain is not None:
+        langchain.verbose = config.LANGCHAIN_VERBOSE
 
 
 class Settings(Dynaconf):
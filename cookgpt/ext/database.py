@@ -1,28 +1,81 @@
 from __future__ import annotations
 
+import os
+import random
 from datetime import datetime
+from time import time_ns
 from typing import Generic, Optional, Type, TypeVar, Union, cast
-from uuid import UUID, uuid4
+from uuid import UUID
 
 import click
 import sentry_sdk
+from flask import current_app, g, has_request_context, request
 from flask.cli import with_appcontext
 from flask_migrate import Migrate
 from flask_migrate.cli import db as db_cli_group
 from flask_sqlalchemy import SQLAlchemy
 from flask_sqlalchemy.model import Model
 from flask_sqlalchemy.query import Query
+from flask_sqlalchemy.session import Session
+from sqlalchemy import LargeBinary, Select, TypeDecorator, event, make_url
 from sqlalchemy.orm import Mapped, mapped_column
 from sqlalchemy.orm.scoping import scoped_session
 from sqlalchemy_serializer import SerializerMixin
 from typing_extensions import Self, deprecated
 
 from cookgpt import logging
+from cookgpt.ext.pools import engine_options
+from cookgpt.utils import pack, unpack
 
 IDENT = Union[Union[UUID, str], tuple[Union[UUID, str], ...]]
+REPLICA_BIND_PREFIX = "replica:"
+READ_METHODS = ("GET", "HEAD")
 ModelT = TypeVar("ModelT", bound="BaseModel")
 
 
+def uuid7() -> UUID:
+    """
+    generate a time-ordered uuid (version 7): 48 bits of unix time in
+    milliseconds followed by random bits, so new rows are appended to the
+    end of primary key and foreign key indexes instead of scattered
+    """
+    millis = time_ns() // 1_000_000
+    value = (millis & 0xFFFF_FFFF_FFFF) << 80
+    value |= int.from_bytes(os.urandom(10), "big")
+    # version 7, variant 10
+    value = (value & ~(0xF << 76)) | (0x7 << 76)
+    value = (value & ~(0x3 << 62)) | (0x2 << 62)
+    return UUID(int=value)
+
+
+class CompressedText(TypeDecorator):
+    """
+    text stored as bytes with a format marker, compressed when it's at
+    least `threshold` bytes long
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def __init__(self, threshold: int = 512):
+        super().__init__()
+        self.threshold = threshold
+
+    @property
+    def python_type(self):
+        return str
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return pack(value.encode(), self.threshold)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return unpack(bytes(value)).decode()
+
+
 class BaseQuery(Query, Generic[ModelT]):
     """Base Query"""
 
@@ -116,7 +169,7 @@ class BaseModel(ModelErrorMixin, Model, SerializerMixin):
 
     query: "BaseQuery[Self]"  # type: ignore[misc]
 
-    id: Mapped[UUID] = mapped_column(primary_key=True, default=uuid4)
+    id: Mapped[UUID] = mapped_column(primary_key=True, default=uuid7)
     created_at: Mapped[datetime] = mapped_column(
         default=datetime.utcnow, nullable=False
     )
@@ -170,6 +223,95 @@ class BaseModel(ModelErrorMixin, Model, SerializerMixin):
             db.session.commit()  # pragma: no cover
 
 
+class RoutingSession(Session):
+    """
+    a session that sends the reads of GET requests to a read replica,
+    when any are configured, and everything else to the primary
+
+    once a session writes, it stays on the primary. a user who wrote in
+    the last `REPLICA_STICKY_SECONDS` reads from the primary too, so they
+    see their own writes while the replicas catch up
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not kwargs.pop("primary", False):
+            replicas = [
+                engine
+                for key, engine in self._db.engines.items()
+                if key and key.startswith(REPLICA_BIND_PREFIX)
+            ]
+            if replicas and self.can_read_replica(clause):
+                return random.choice(replicas)
+        return super().get_bind(mapper, clause, bind, **kwargs)
+
+    def can_read_replica(self, clause) -> bool:
+        """check if a statement may run on a replica"""
+        if self._flushing or not isinstance(clause, (Select, type(None))):
+            self.info["wrote"] = True
+            return False
+        # connections asked for without a statement, and locking reads
+        if clause is None or clause._for_update_arg is not None:
+            return False
+        if self.info.get("wrote"):
+            return False
+        if not has_request_context() or request.method not in READ_METHODS:
+            return False
+        return not reads_from_primary()
+
+    def close(self):
+        self.info.pop("wrote", None)
+        super().close()
+
+
+def current_user_id() -> "str | None":
+    """get the id of the authenticated user, without authenticating"""
+    from flask_jwt_extended import get_jwt
+
+    try:
+        return get_jwt().get("sub")
+    except RuntimeError:
+        # the request isn't authenticated (yet)
+        return None
+
+
+def reads_from_primary() -> bool:
+    """check if the current user wrote recently"""
+    from cookgpt.ext.cache import cache, primary_reads_cache_key
+
+    user_id = current_user_id()
+    if user_id is None:
+        return False
+    if "reads_from_primary" not in g:
+        g.reads_from_primary = bool(
+            cache.get(primary_reads_cache_key(user_id=user_id))
+        )
+    return g.reads_from_primary
+
+
+def read_from_primary(user_id: "UUID | str"):
+    """send a user's reads to the primary while the replicas catch up"""
+    from cookgpt.ext.cache import cache, primary_reads_cache_key
+
+    if not current_app.config.get("SQLALCHEMY_REPLICAS"):
+        return
+    # keyed like the `sub` claim of the user's tokens
+    if isinstance(user_id, str):
+        user_id = UUID(user_id)
+    cache.set(
+        primary_reads_cache_key(user_id=user_id.hex),
+        True,
+        timeout=current_app.config.get("REPLICA_STICKY_SECONDS", 5),
+    )
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def mark_writer(session: RoutingSession):
+    """make the user behind a request that wrote read from the primary"""
+    if session.info.get("wrote") and has_request_context():
+        if user_id := current_user_id():
+            read_from_primary(user_id)
+
+
 class Database(SQLAlchemy):
     """Database"""
 
@@ -191,7 +333,11 @@ class Database(SQLAlchemy):
         super().drop_all(*args, **kwargs)
 
 
-db = Database(model_class=BaseModel, query_class=BaseQuery)
+db = Database(
+    model_class=BaseModel,
+    query_class=BaseQuery,
+    session_options={"class_": RoutingSession},
+)
 migrate = Migrate()
 
 
@@ -216,5 +362,18 @@ def dropall():
 
 
 def init_app(app):
+    # each replica is an extra bind that `RoutingSession` reads from
+    binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+    for i, url in enumerate(app.config.get("SQLALCHEMY_REPLICAS") or ()):
+        binds[f"{REPLICA_BIND_PREFIX}{i}"] = url
+    app.config["SQLALCHEMY_BINDS"] = binds
+    # sqlite keeps an in-memory database on a single connection
+    url = make_url(app.config["SQLALCHEMY_DATABASE_URI"])
+    memory = (None, "", ":memory:")
+    if url.get_backend_name() != "sqlite" or url.database not in memory:
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+            **engine_options(app.config),
+            **(app.config.get("SQLALCHEMY_ENGINE_OPTIONS") or {}),
+        }
     db.init_app(app)
     migrate.init_app(app, db)
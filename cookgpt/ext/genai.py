@@ -1,17 +1,71 @@
-from typing import TYPE_CHECKING
-
-import google.ai.generativelanguage as glm  # noqa: F401
-import google.generativeai as genai
-
-gemini = genai.GenerativeModel(model_name="gemini-pro")
-gemini_vision = genai.GenerativeModel(model_name="gemini-pro-vision")
+"""
+Google Generative AI extension.
 
+The Google Generative AI client pulls in grpc and protobuf, so it is only
+imported when a model is first used. `genai`, `glm`, `gemini` and
+`gemini_vision` are resolved lazily on attribute access.
+"""
+from importlib import import_module
+from threading import Lock
+from typing import TYPE_CHECKING, Any
 
 if TYPE_CHECKING:
+    import google.ai.generativelanguage as glm  # noqa: F401
+    import google.generativeai as genai
+
     from cookgpt.app import App
 
+    gemini: genai.GenerativeModel
+    gemini_vision: genai.GenerativeModel
+
+MODELS = {
+    "gemini": "gemini-pro",
+    "gemini_vision": "gemini-pro-vision",
+}
+
+_transport = "rest"
+_configured = False
+_models: dict[str, Any] = {}
+_lock = Lock()
+
+
+def get_genai():
+    """import and configure the Google Generative AI client"""
+    global _configured
+
+    import google.generativeai as genai
+
+    if not _configured:
+        with _lock:
+            if not _configured:
+                genai.configure(transport=_transport)
+                _configured = True
+    return genai
+
+
+def get_model(name: str) -> "genai.GenerativeModel":
+    """get a generative model, creating it on first use"""
+    if name not in _models:
+        genai = get_genai()
+        with _lock:
+            if name not in _models:
+                _models[name] = genai.GenerativeModel(model_name=name)
+    return _models[name]
+
+
+def __getattr__(name: str) -> Any:
+    if name == "genai":
+        return get_genai()
+    if name == "glm":
+        return import_module("google.ai.generativelanguage")
+    if name in MODELS:
+        return get_model(MODELS[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 def init_app(app: "App"):
     """Initialize the Google Generative AI extension."""
-    genai.configure(transport=app.config.get("GENAI_TRANSPORT", "rest"))
-    return genai
+    global _transport, _configured
+
+    _transport = app.config.get("GENAI_TRANSPORT", "rest")
+    _configured = False
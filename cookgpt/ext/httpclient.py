@@ -0,0 +1,177 @@
+"""
+Shared HTTP client.
+
+All outbound HTTP calls (image downloads, serper.dev searches, ...) go
+through a single process-wide `requests.Session` so that connections
+are pooled and kept alive between calls. Every request gets a default
+timeout and is retried with exponential backoff on transient errors.
+"""
+
+import os
+from typing import TYPE_CHECKING, Optional, Union
+
+import requests  # type: ignore[import-untyped]
+from requests.adapters import HTTPAdapter  # type: ignore[import-untyped]
+from urllib3.util.retry import Retry
+
+from cookgpt import logging
+from cookgpt.utils import Configurable, PerProcess
+
+if TYPE_CHECKING:
+    from cookgpt.app import App
+
+Timeout = Union[float, tuple[float, float]]
+
+BROWSER_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
+        " AppleWebKit/537.36 (KHTML, like Gecko)"
+        " Chrome/120.0.0.0 Safari/537.36"
+    )
+}
+"""headers sent when downloading media from third-party sites"""
+
+
+class ResponseTooLarge(requests.RequestException):
+    """The response body exceeded the download limit"""
+
+
+class HTTPClient(Configurable):
+    """A pooled, keep-alive HTTP client"""
+
+    def __init__(
+        self,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 30.0,
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        max_download_bytes: int = 10 * 1024 * 1024,
+    ):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.max_download_bytes = max_download_bytes
+        self._session = PerProcess(
+            self._make_session, close=requests.Session.close
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"<HTTPClient timeout={self.timeout} retries={self.max_retries}"
+            f" pool={self.pool_maxsize}>"
+        )
+
+    @property
+    def timeout(self) -> tuple[float, float]:
+        """default (connect, read) timeout"""
+        return (self.connect_timeout, self.read_timeout)
+
+    def _make_session(self) -> requests.Session:
+        """create a session with pooled, retrying adapters"""
+        logging.debug("Creating HTTP session for pid %d", os.getpid())
+        retry = Retry(
+            total=self.max_retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            # serper.dev searches are POSTs but have no side effects
+            allowed_methods=frozenset({"HEAD", "GET", "OPTIONS", "POST"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=retry,
+        )
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    @property
+    def session(self) -> requests.Session:
+        """the session for the current process"""
+        return self._session.get()
+
+    def close(self):
+        """close the current session and its pooled connections"""
+        self._session.reset()
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """send a request using the pooled session"""
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """send a GET request"""
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """send a POST request"""
+        return self.request("POST", url, **kwargs)
+
+    def download(
+        self,
+        url: str,
+        headers: Optional[dict[str, str]] = None,
+        max_bytes: Optional[int] = None,
+        chunk_size: int = 64 * 1024,
+    ) -> tuple[bytes, str]:
+        """
+        Download a resource without holding more than `max_bytes` of it.
+
+        Args:
+            url (str): The url to download
+            headers (dict, optional): Extra request headers
+            max_bytes (int, optional): The download limit. Defaults to
+                `max_download_bytes`.
+            chunk_size (int, optional): Size of each streamed read
+        Returns:
+            tuple[bytes, str]: The body and its content type
+        Raises:
+            ResponseTooLarge: If the body is larger than `max_bytes`
+        """
+        if max_bytes is None:
+            max_bytes = self.max_download_bytes
+        with self.get(url, headers=headers, stream=True) as response:
+            response.raise_for_status()
+            length = response.headers.get("Content-Length")
+            if length and length.isdigit() and int(length) > max_bytes:
+                raise ResponseTooLarge(
+                    f"{url} is {length} bytes (limit is {max_bytes})",
+                    response=response,
+                )
+            body = bytearray()
+            for chunk in response.iter_content(chunk_size):
+                body += chunk
+                if len(body) > max_bytes:
+                    raise ResponseTooLarge(
+                        f"{url} is larger than {max_bytes} bytes",
+                        response=response,
+                    )
+            content_type = response.headers.get(
+                "Content-Type", "application/octet-stream"
+            )
+        return bytes(body), content_type
+
+
+client = HTTPClient()
+
+
+def init_app(app: "App"):
+    """configure the shared HTTP client"""
+    client.configure(
+        connect_timeout=app.config.get("HTTP_CONNECT_TIMEOUT", 5.0),
+        read_timeout=app.config.get("HTTP_READ_TIMEOUT", 30.0),
+        max_retries=app.config.get("HTTP_MAX_RETRIES", 3),
+        backoff_factor=app.config.get("HTTP_BACKOFF_FACTOR", 0.5),
+        pool_connections=app.config.get("HTTP_POOL_CONNECTIONS", 10),
+        pool_maxsize=app.config.get("HTTP_POOL_MAXSIZE", 10),
+        max_download_bytes=app.config.get(
+            "HTTP_MAX_DOWNLOAD_BYTES", 10 * 1024 * 1024
+        ),
+    )
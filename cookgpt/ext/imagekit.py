@@ -8,6 +8,8 @@ from cookgpt.chatbot.models import Chat, ChatMedia, MediaType
 from cookgpt.globals import setvar
 
 imagekit: ImageKit = None  # type: ignore
+# the most files ImageKit deletes in one request
+BULK_DELETE_LIMIT = 100
 
 
 def init_app(app):  # pragma: no cover
@@ -36,6 +38,18 @@ def delete_image(media: ChatMedia):
             return False
 
 
+def delete_files(file_ids: list[str]):
+    """delete files from ImageKit, as many per request as it allows"""
+    from cookgpt import logging
+
+    for start in range(0, len(file_ids), BULK_DELETE_LIMIT):
+        batch = file_ids[start : start + BULK_DELETE_LIMIT]
+        try:
+            imagekit.bulk_file_delete(batch)
+        except Exception:
+            logging.exception("Could not delete %d files", len(batch))
+
+
 def upload_image(chat: Chat, file: FileStorage):
     """Utility function to upload the file"""
     buffer = BufferedReader(file)  # type: ignore
@@ -0,0 +1,125 @@
+"""
+Password hashing.
+
+bcrypt is deliberately slow. The hasher runs it on a small, bounded thread
+pool and turns requests away once the pool is saturated, which caps the
+CPU a burst of logins can take from other requests.
+
+This is a concurrency limiter: the calling thread still waits for its hash.
+It only keeps other endpoints responsive when gunicorn serves requests on
+several threads (`GUNICORN_THREADS` > 1); with one sync thread per worker,
+a login still occupies that worker until bcrypt finishes.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore
+from typing import TYPE_CHECKING, Any, Callable, TypeVar, Union
+
+from cookgpt import logging
+from cookgpt.utils import Configurable, PerProcess
+
+if TYPE_CHECKING:
+    from cookgpt.app import App
+
+T = TypeVar("T")
+
+
+class HasherBusy(Exception):
+    """Too many passwords are waiting to be hashed"""
+
+
+class PasswordHasher(Configurable):
+    """Hash and verify passwords on a bounded thread pool"""
+
+    def __init__(
+        self,
+        max_workers: int = 2,
+        max_pending: int = 16,
+        wait_timeout: float = 5.0,
+        log_rounds: int = 12,
+    ):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.wait_timeout = wait_timeout
+        self.log_rounds = log_rounds
+        self._executor: PerProcess[ThreadPoolExecutor] = PerProcess(
+            self._make_executor, close=lambda pool: pool.shutdown(wait=False)
+        )
+        self._slots = BoundedSemaphore(max_workers + max_pending)
+
+    def __repr__(self) -> str:
+        return (
+            f"<PasswordHasher workers={self.max_workers}"
+            f" pending={self.max_pending} rounds={self.log_rounds}>"
+        )
+
+    def configure(self, **options: Any):
+        """update the hasher's options and drop the current pool"""
+        super().configure(**options)
+        self._slots = BoundedSemaphore(self.max_workers + self.max_pending)
+
+    def _make_executor(self) -> ThreadPoolExecutor:
+        """create the hashing thread pool"""
+        return ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="bcrypt"
+        )
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """the thread pool for the current process"""
+        return self._executor.get()
+
+    def close(self):
+        """shut down the thread pool"""
+        self._executor.reset()
+
+    def run(self, func: Callable[..., T], *args: Any) -> T:
+        """run `func` on the pool and wait for the result"""
+        # `configure` may replace the semaphore while this call is running
+        slots = self._slots
+        if not slots.acquire(timeout=self.wait_timeout):
+            logging.warning("Password hasher is saturated")
+            raise HasherBusy("Too many requests, try again later")
+        try:
+            return self.executor.submit(func, *args).result()
+        finally:
+            slots.release()
+
+    def hash(self, password: str) -> str:
+        """hash a password with the configured work factor"""
+        from cookgpt.ext.auth import bcrypt
+
+        hashed = self.run(
+            bcrypt.generate_password_hash, password, self.log_rounds
+        )
+        return hashed.decode()
+
+    def verify(self, hashed: Union[str, bytes], password: str) -> bool:
+        """check a password against its hash"""
+        from cookgpt.ext.auth import bcrypt
+
+        return self.run(bcrypt.check_password_hash, hashed, password)
+
+    def needs_rehash(self, hashed: Union[str, bytes]) -> bool:
+        """check if a hash was made with a different work factor"""
+        if isinstance(hashed, bytes):
+            hashed = hashed.decode()
+        # bcrypt hashes look like $2b$<rounds>$<salt + checksum>
+        try:
+            rounds = int(hashed.split("$")[2])
+        except (IndexError, ValueError):  # pragma: no cover
+            return True
+        return rounds != self.log_rounds
+
+
+hasher = PasswordHasher()
+
+
+def init_app(app: "App"):
+    """configure the password hasher"""
+    hasher.configure(
+        max_workers=app.config.get("PASSWORD_HASH_WORKERS", 2),
+        max_pending=app.config.get("PASSWORD_HASH_MAX_PENDING", 16),
+        wait_timeout=app.config.get("PASSWORD_HASH_WAIT_TIMEOUT", 5.0),
+        log_rounds=app.config.get("BCRYPT_LOG_ROUNDS", 12),
+    )
@@ -0,0 +1,383 @@
+"""
+Performance tooling.
+"""
+
+from time import perf_counter
+from typing import TYPE_CHECKING
+
+import click
+from flask.cli import with_appcontext
+
+if TYPE_CHECKING:
+    from cookgpt.app import App
+
+
+@click.group()
+def perf_cli():
+    """Performance reports and benchmarks."""
+    pass
+
+
+def report(label: str, seconds: float, runs: int = 1):
+    """print the average duration of a benchmark"""
+    click.echo(f"{label:<40} {seconds / runs * 1000:>10.2f} ms")
+
+
+@perf_cli.command("token-cost")
+@click.option(
+    "--messages", "-m", default=100, help="number of messages in history"
+)
+@click.option("--runs", "-r", default=20, help="number of warm runs")
+@with_appcontext
+def token_cost(messages: int, runs: int):
+    """Benchmark token cost computation over a chat history."""
+    from uuid import uuid4
+
+    from cookgpt.chatbot.utils import get_encoding, num_tokens_from_messages
+    from cookgpt.ext.cache import cache
+
+    history = [
+        {
+            "role": "user" if i % 2 else "assistant",
+            "content": "How do I make jollof rice? " * (i % 10 + 1),
+            "id": uuid4().hex,
+        }
+        for i in range(messages)
+    ]
+    keys = [f"chat:{message['id']}:cost" for message in history]
+
+    def per_message():
+        """the previous strategy: one has/get (and set) per message"""
+        total = 0
+        for key, message in zip(keys, history):
+            if cache.has(key):
+                total += cache.get(key)
+                continue
+            cost = 4 + sum(
+                len(get_encoding().encode(v)) for v in message.values()
+            )
+            cache.set(key, cost, timeout=0)
+            total += cost
+        return total + 2
+
+    click.echo(f"Token cost of a {messages}-message history")
+    try:
+        for label, func in (
+            ("per message", per_message),
+            ("batched", lambda: num_tokens_from_messages(history)),
+        ):
+            cache.delete_many(*keys)
+            start = perf_counter()
+            func()
+            report(f"{label} (cold)", perf_counter() - start)
+            start = perf_counter()
+            for _ in range(runs):
+                func()
+            report(f"{label} (warm)", perf_counter() - start, runs)
+    finally:
+        cache.delete_many(*keys)
+
+
+@perf_cli.command("logins")
+@click.option("--requests", "-n", default=50, help="number of logins")
+@click.option("--concurrency", "-c", default=4, help="concurrent clients")
+@with_appcontext
+def logins(requests: int, concurrency: int):
+    """Benchmark logins per second."""
+    from concurrent.futures import ThreadPoolExecutor
+    from uuid import uuid4
+
+    from flask import current_app
+
+    from cookgpt.auth.models import User
+    from cookgpt.ext.passwords import hasher
+
+    app = current_app._get_current_object()  # type: ignore[attr-defined]
+    # the benchmark creates and deletes a user in the configured database
+    if app.config.current_env.lower() not in ("development", "testing"):
+        click.echo(
+            "Refusing to run in the "
+            f"{app.config.current_env.lower()} environment",
+            err=True,
+        )
+        raise click.Abort()
+    password = "Benchmark1234"
+    user = User.create(
+        first_name="Benchmark",
+        email=f"benchmark-{uuid4().hex[:8]}@example.com",
+        password=password,
+    )
+    payload = {"login": user.email, "password": password}
+
+    def login(_):
+        with app.test_client() as client:
+            return client.post("/auth/login", json=payload).status_code
+
+    click.echo(f"{requests} logins, {concurrency} at a time, {hasher!r}")
+    try:
+        login(None)  # the first login creates the token
+        start = perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            statuses = list(executor.map(login, range(requests)))
+        elapsed = perf_counter() - start
+    finally:
+        user.delete()
+    failed = sum(status != 200 for status in statuses)
+    report("per login", elapsed, requests)
+    click.echo(f"{'logins/sec':<40} {requests / elapsed:>10.2f}")
+    if failed:
+        click.echo(f"{failed} logins failed", err=True)
+
+
+@perf_cli.command("import-times")
+@click.option(
+    "--target",
+    "-t",
+    default="from cookgpt import create_app; create_app()",
+    help="python code to time",
+)
+@click.option("--top", "-n", default=20, help="number of packages to show")
+def import_times(target: str, top: int):
+    """Report which packages make application startup slow."""
+    import subprocess
+    import sys
+    from collections import defaultdict
+
+    start = perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", target],
+        capture_output=True,
+        text=True,
+    )
+    elapsed = perf_counter() - start
+    if result.returncode != 0:
+        click.echo(result.stderr, err=True)
+        raise click.Abort()
+
+    # each line is "import time: self [us] | cumulative | imported package"
+    packages: dict[str, int] = defaultdict(int)
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        own, _, name = line[len("import time:") :].split("|")
+        package = name.strip().split(".")[0]
+        packages[package] += int(own)
+        total += int(own)
+
+    click.echo(f"{'package':<40} {'self':>10}")
+    ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+    for package, micros in ranked[:top]:
+        report(package, micros / 1e6)
+    report("all imports", total / 1e6)
+    report("process (incl. interpreter startup)", elapsed)
+
+
+def table_size(conn, table: str) -> "int | None":
+    """get the size of a table and its indexes in bytes"""
+    from sqlalchemy import text
+
+    queries = {
+        # the benchmark gives each table a database file of its own
+        "sqlite": "SELECT page_count * page_size"
+        " FROM pragma_page_count(), pragma_page_size()",
+        "mysql": "SELECT data_length + index_length"
+        " FROM information_schema.tables"
+        " WHERE table_schema = DATABASE() AND table_name = :table",
+        "postgresql": "SELECT pg_total_relation_size(:table)",
+    }
+    query = queries.get(conn.dialect.name)
+    if query is None:  # pragma: no cover
+        return None
+    return conn.execute(text(query), {"table": table}).scalar()
+
+
+@perf_cli.command("ids")
+@click.option("--rows", "-n", default=1_000_000, help="rows to insert")
+@click.option("--batch-size", "-b", default=10_000, help="rows per INSERT")
+@click.option(
+    "--url",
+    "-u",
+    default=None,
+    help="database to run in, a scratch sqlite file by default",
+)
+def ids(rows: int, batch_size: int, url: "str | None"):
+    """Benchmark inserts with random and time-ordered primary keys."""
+    import tempfile
+    from uuid import uuid4
+
+    from sqlalchemy import (
+        Column,
+        Integer,
+        MetaData,
+        Table,
+        Uuid,
+        create_engine,
+        insert,
+    )
+
+    from cookgpt.ext.database import uuid7
+
+    click.echo(f"Inserting {rows} rows, {batch_size} per statement")
+    click.echo(f"{'':<40} {'rows/sec':>10} {'last 10%':>10} {'size MB':>10}")
+    for label, factory in (("uuid4", uuid4), ("uuid7", uuid7)):
+        with tempfile.TemporaryDirectory() as scratch:
+            engine = create_engine(url or f"sqlite:///{scratch}/ids.db")
+            # shaped like a child table: a uuid key and an indexed parent
+            table = Table(
+                f"perf_ids_{label}",
+                MetaData(),
+                Column("id", Uuid, primary_key=True),
+                Column("parent_id", Uuid, index=True),
+                Column("n", Integer),
+            )
+            table.create(engine)
+            try:
+                parent = factory()
+                timings: list[float] = []
+                for start in range(0, rows, batch_size):
+                    batch = []
+                    for n in range(start, min(start + batch_size, rows)):
+                        id = factory()
+                        batch.append({"id": id, "parent_id": parent, "n": n})
+                        parent = id
+                    began = perf_counter()
+                    with engine.begin() as conn:
+                        conn.execute(insert(table), batch)
+                    timings.append(perf_counter() - began)
+                tail = timings[-max(1, len(timings) // 10) :]
+                tail_rows = min(rows, len(tail) * batch_size)
+                with engine.connect() as conn:
+                    size = table_size(conn, table.name)
+                click.echo(
+                    f"{label:<40} {rows / sum(timings):>10.0f}"
+                    f" {tail_rows / sum(tail):>10.0f}"
+                    + (f" {size / 2**20:>10.1f}" if size else f" {'n/a':>10}")
+                )
+            finally:
+                table.drop(engine)
+                engine.dispose()
+
+
+@perf_cli.command("compression")
+@click.option("--chats", "-n", default=50, help="chats in the cached thread")
+@click.option("--runs", "-r", default=1000, help="timed encodes and decodes")
+@with_appcontext
+def compression(chats: int, runs: int):
+    """Benchmark compressed chat content and cache values."""
+    from datetime import datetime
+    from uuid import uuid4
+
+    from cachelib.serializers import RedisSerializer
+
+    from cookgpt.chatbot.message import response
+    from cookgpt.ext.cache import PackedRedisCache, PackedSerializer, cache
+    from cookgpt.utils import pack, unpack
+
+    click.echo(f"{'column value':<40} {'bytes':>10} {'packed':>10}")
+    query = "How do I make jollof rice?".encode()
+    click.echo(f"{'query':<40} {len(query):>10} {len(pack(query)):>10}")
+    data = response.encode()
+    packed = pack(data)
+    click.echo(f"{'recipe response':<40} {len(data):>10} {len(packed):>10}")
+    began = perf_counter()
+    for _ in range(runs):
+        pack(data)
+    report("pack recipe", perf_counter() - began, runs)
+    began = perf_counter()
+    for _ in range(runs):
+        unpack(packed)
+    report("unpack recipe", perf_counter() - began, runs)
+
+    # shaped like a cached `chats:` entry
+    value = {
+        "chats": [
+            {
+                "id": uuid4(),
+                # distinct strings, or pickle would store one copy
+                "content": f"{response}{i}" if i % 2 else f"Query {i}",
+                "chat_type": "RESPONSE" if i % 2 else "QUERY",
+                "cost": 100,
+                "sent_time": datetime.utcnow(),
+                "media": [],
+            }
+            for i in range(chats)
+        ]
+    }
+    backend = cache.cache
+    if not isinstance(backend, PackedRedisCache):  # pragma: no cover
+        click.echo("\nThe cache isn't redis, skipping the cache entry sizes")
+        return
+    client = backend._write_client
+    click.echo(f"\n{chats} chats in one cache entry")
+    click.echo(f"{'':<40} {'bytes':>10} {'redis':>10}")
+    for label, serializer in (
+        ("pickle", RedisSerializer()),
+        ("packed pickle", PackedSerializer()),
+    ):
+        dumped = serializer.dumps(value)
+        key = f"perf:compression:{uuid4().hex}"
+        client.set(key, dumped)
+        try:
+            memory = client.memory_usage(key)
+        finally:
+            client.delete(key)
+        click.echo(f"{label:<40} {len(dumped):>10} {memory:>10}")
+        began = perf_counter()
+        for _ in range(runs):
+            serializer.dumps(value)
+        report(f"{label} dumps", perf_counter() - began, runs)
+        began = perf_counter()
+        for _ in range(runs):
+            serializer.loads(dumped)
+        report(f"{label} loads", perf_counter() - began, runs)
+
+
+@perf_cli.command("pools")
+@with_appcontext
+def pools():
+    """Show the size and usage of each process's connection pools."""
+    from flask import current_app
+
+    from cookgpt.ext.pools import gunicorn_settings, pool_sizes
+    from cookgpt.ext.pools import published_stats
+
+    app = current_app._get_current_object()  # type: ignore
+    workers, threads = gunicorn_settings()
+    sizes = pool_sizes(app.config)
+    database = sizes["database"] + sizes["database_overflow"]
+    click.echo(f"gunicorn: {workers} workers x {threads} threads")
+    click.echo(
+        f"database: {sizes['database']} + {sizes['database_overflow']} "
+        f"overflow per process, up to {workers * database} connections"
+    )
+    click.echo(
+        f"redis:    {sizes['redis']} per process, "
+        f"up to {workers * sizes['redis']} connections"
+    )
+
+    app.extensions["pool_stats"](app, force=True)
+    stats = published_stats(app)
+    if not stats:  # pragma: no cover
+        click.echo("no pool stats published")
+        return
+    click.echo(
+        f"{'process':<28} {'pool':<20} {'size':>5} {'max':>5} {'out':>5} "
+        f"{'peak':>5} {'over':>5} {'checkouts':>10} {'timeouts':>8} "
+        f"{'avg ms':>8} {'max ms':>8}"
+    )
+    for process, snapshots in stats.items():
+        for name, pool in snapshots.items():
+            click.echo(
+                f"{process:<28} {name:<20} {pool['size']:>5} "
+                f"{pool['max']:>5} {pool['checked_out']:>5} "
+                f"{pool['peak']:>5} {pool['overflow']:>5} "
+                f"{pool['checkouts']:>10} {pool['timeouts']:>8} "
+                f"{pool['avg_wait'] * 1000:>8.2f} "
+                f"{pool['max_wait'] * 1000:>8.2f}"
+            )
+
+
+def init_app(app: "App"):
+    """Register the performance commands."""
+    app.cli.add_command(perf_cli, "perf")
@@ -0,0 +1,294 @@
+"""
+Connection pools.
+
+The database engines and redis are pooled per process and sized from the
+number of threads that use them: gunicorn's threads in the web processes,
+and the worker's concurrency in celery, as each request or task holds at
+most one connection of each pool at a time. Other processes, or a web
+process without GUNICORN_THREADS, keep the libraries' default sizes. The
+cache, the chat streams and the celery glue all share the one redis pool.
+
+Both kinds of pool time how long callers wait for a connection and count
+the ones that give up. Every process publishes its numbers to redis, for
+`flask perf pools` to show them side by side.
+"""
+
+import json
+import os
+import socket
+import sys
+from threading import Lock
+from time import monotonic, perf_counter
+from typing import TYPE_CHECKING, Any, Optional, cast
+
+from redis import BlockingConnectionPool, Redis  # type: ignore
+from redis.exceptions import ConnectionError as RedisConnectionError
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+from cookgpt import logging
+
+if TYPE_CHECKING:
+    from cookgpt.app import App
+
+STATS_KEY_PREFIX = "pools:"
+# the sizes sqlalchemy's `QueuePool` and redis' `BlockingConnectionPool`
+# use by default
+DEFAULT_POOL_SIZE = 5
+DEFAULT_MAX_OVERFLOW = 10
+DEFAULT_REDIS_CONNECTIONS = 50
+# what `BlockingConnectionPool` raises once its timeout runs out
+REDIS_POOL_EMPTY = "No connection available."
+
+
+class PoolStats:
+    """how long a pool's callers waited for connections"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+        self.peak = 0
+        self._lock = Lock()
+
+    def record(self, seconds: float, checked_out: int, timed_out=False):
+        """count a checkout, or a caller that gave up waiting"""
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+                self.peak = max(self.peak, checked_out)
+            self.wait_time += seconds
+            self.max_wait = max(self.max_wait, seconds)
+
+    def as_dict(self) -> "dict[str, Any]":
+        """the counters, with the average wait"""
+        waits = self.checkouts + self.timeouts
+        return {
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "peak": self.peak,
+            "avg_wait": self.wait_time / waits if waits else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+
+class TimedQueuePool(QueuePool):
+    """a sqlalchemy queue pool that records its checkouts"""
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def connect(self):
+        start = perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeout:
+            self.stats.record(perf_counter() - start, 0, timed_out=True)
+            logging.warning("Database pool exhausted: %s", self.status())
+            raise
+        self.stats.record(perf_counter() - start, self.checkedout())
+        return connection
+
+    def snapshot(self) -> "dict[str, Any]":
+        """the pool's size and usage"""
+        return {
+            "size": self.size(),
+            "max": self.size() + max(self._max_overflow, 0),
+            "checked_out": self.checkedout(),
+            "overflow": max(self.overflow(), 0),
+            **self.stats.as_dict(),
+        }
+
+
+class TimedRedisPool(BlockingConnectionPool):
+    """a blocking redis pool that records its checkouts"""
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def get_connection(self, *args: Any, **kwargs: Any):
+        start = perf_counter()
+        try:
+            connection = super().get_connection(*args, **kwargs)
+        except RedisConnectionError as err:
+            if str(err) != REDIS_POOL_EMPTY:
+                raise
+            self.stats.record(perf_counter() - start, 0, timed_out=True)
+            logging.warning(
+                "Redis pool exhausted: %d connections checked out",
+                self.checked_out(),
+            )
+            raise
+        self.stats.record(perf_counter() - start, self.checked_out())
+        return connection
+
+    def checked_out(self) -> int:
+        """the number of connections in use"""
+        # the queue holds the idle connections and a `None` for each one
+        # that hasn't been made yet
+        with self.pool.mutex:
+            idle = sum(1 for c in self.pool.queue if c is not None)
+        return len(self._connections) - idle
+
+    def snapshot(self) -> "dict[str, Any]":
+        """the pool's size and usage"""
+        return {
+            "size": len(self._connections),
+            "max": self.max_connections,
+            "checked_out": self.checked_out(),
+            "overflow": 0,
+            **self.stats.as_dict(),
+        }
+
+
+def gunicorn_settings() -> "tuple[int, int]":
+    """the number of gunicorn workers, and of threads in each"""
+    workers = int(os.getenv("GUNICORN_WORKERS", "1"))
+    threads = int(os.getenv("GUNICORN_THREADS", "1"))
+    return workers, threads
+
+
+def is_celery_worker() -> bool:
+    """whether this process was started by `celery worker`"""
+    return "celery" in sys.argv[0] and "worker" in sys.argv[1:]
+
+
+def process_threads() -> Optional[int]:
+    """the number of threads that use the pools in this process, if known"""
+    if is_celery_worker():
+        # celery's own default concurrency is the number of cpus
+        return int(os.getenv("CELERY_CONCURRENCY") or os.cpu_count() or 1)
+    threads = os.getenv("GUNICORN_THREADS")
+    return int(threads) if threads else None
+
+
+def pool_sizes(config: Any) -> "dict[str, int]":
+    """the size of each pool in a process, unless configured"""
+    threads = process_threads()
+    if threads is None:
+        sizes = {
+            "database": DEFAULT_POOL_SIZE,
+            "database_overflow": DEFAULT_MAX_OVERFLOW,
+            "redis": DEFAULT_REDIS_CONNECTIONS,
+        }
+    else:
+        sizes = {
+            "database": threads,
+            "database_overflow": threads,
+            # serper searches are cached from their own threads
+            "redis": threads + config.get("SERPER_MAX_WORKERS", 4) + 1,
+        }
+    return {
+        "database": config.get("SQLALCHEMY_POOL_SIZE", sizes["database"]),
+        "database_overflow": config.get(
+            "SQLALCHEMY_MAX_OVERFLOW", sizes["database_overflow"]
+        ),
+        "redis": config.get("REDIS_MAX_CONNECTIONS", sizes["redis"]),
+    }
+
+
+def engine_options(config: Any) -> "dict[str, Any]":
+    """the pool options for the database engines"""
+    sizes = pool_sizes(config)
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": sizes["database"],
+        "max_overflow": sizes["database_overflow"],
+        "pool_timeout": config.get("SQLALCHEMY_POOL_TIMEOUT", 10.0),
+    }
+
+
+def redis_pool(app: "App") -> TimedRedisPool:
+    """get the app's redis pool, creating it the first time"""
+    pool = app.extensions.get("redis_pool")
+    if pool is None:
+        pool = TimedRedisPool.from_url(
+            app.config["REDIS_URL"],
+            max_connections=pool_sizes(app.config)["redis"],
+            timeout=app.config.get("REDIS_POOL_TIMEOUT", 5.0),
+        )
+        app.extensions["redis_pool"] = pool
+    return pool
+
+
+def redis_client(app: "App") -> Redis:
+    """a redis client on the app's shared pool"""
+    return Redis(connection_pool=redis_pool(app))
+
+
+def pool_snapshots(app: "App") -> "dict[str, dict[str, Any]]":
+    """the usage of each of the process's pools"""
+    from cookgpt.ext.database import db
+
+    snapshots = {"redis": redis_pool(app).snapshot()}
+    with app.app_context():
+        for bind, engine in db.engines.items():
+            if isinstance(engine.pool, TimedQueuePool):
+                name = f"database:{bind}" if bind else "database"
+                snapshots[name] = engine.pool.snapshot()
+    return snapshots
+
+
+def stats_key() -> str:
+    """the redis key this process publishes its pool stats under"""
+    return f"{STATS_KEY_PREFIX}{socket.gethostname()}:{os.getpid()}"
+
+
+class StatsPublisher:
+    """publish a process's pool stats at most once an interval"""
+
+    def __init__(self, interval: float = 10.0):
+        self.interval = interval
+        self._last: Optional[float] = None
+        self._lock = Lock()
+
+    def __call__(self, app: "App", force=False):
+        now = monotonic()
+        with self._lock:
+            due = self._last is None or now - self._last >= self.interval
+            if not (due or force):
+                return
+            self._last = now
+        try:
+            redis_client(app).set(
+                stats_key(),
+                json.dumps(pool_snapshots(app)),
+                # a process that stopped publishing has gone away
+                ex=max(int(self.interval * 6), 60),
+            )
+        except Exception:  # pragma: no cover
+            logging.exception("Could not publish pool stats")
+
+
+def published_stats(app: "App") -> "dict[str, dict[str, dict[str, Any]]]":
+    """the pool stats of every live process, by process"""
+    client = redis_client(app)
+    stats = {}
+    for key in sorted(client.scan_iter(f"{STATS_KEY_PREFIX}*")):
+        value = cast("Optional[bytes]", client.get(key))
+        if value is not None:
+            process = key.decode()[len(STATS_KEY_PREFIX) :]
+            stats[process] = json.loads(value)
+    return stats
+
+
+def init_app(app: "App"):
+    """publish pool stats after requests and celery tasks"""
+    from celery.signals import task_postrun
+
+    publish = StatsPublisher(app.config.get("POOL_STATS_INTERVAL", 10.0))
+    app.extensions["pool_stats"] = publish
+
+    @app.after_request
+    def publish_pool_stats(response):
+        publish(app)
+        return response
+
+    @task_postrun.connect(weak=False)
+    def publish_task_pool_stats(**kwargs: Any):
+        publish(app)
@@ -11,6 +11,7 @@ if TYPE_CHECKING:
 def init_app(app: "App"):
     """initialize celery"""
     from cookgpt import logging
+    from cookgpt.ext.pools import redis_client
     from redisflow import celeryapp
 
     if hasattr(app, "redis"):  # pragma: no cover
@@ -18,7 +19,7 @@ def init_app(app: "App"):
         return
 
     logging.debug("Initializing redis")
-    redis = cast(Redis, Redis.from_url(app.config.REDIS_URL))
+    redis = cast(Redis, redis_client(app))
     app.redis = redis
     celeryapp.init_app(app)
     setvar("redis", redis)
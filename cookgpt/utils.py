@@ -1,6 +1,18 @@
 """Utilities"""
+import os
+import zlib
 from datetime import datetime, timezone
-from typing import Any, Callable, NoReturn, Optional, ParamSpec, TypeVar, Union
+from threading import Lock
+from typing import (
+    Any,
+    Callable,
+    Generic,
+    NoReturn,
+    Optional,
+    ParamSpec,
+    TypeVar,
+    Union,
+)
 
 from apiflask import HTTPError
 from apiflask.schemas import EmptySchema, FileSchema
@@ -36,6 +48,30 @@ def utcnow_from__ts(timestamp) -> datetime:
     return no_ms(datetime.fromtimestamp(timestamp, tz=timezone.utc))
 
 
+# the first byte of a packed value says how the rest is stored
+PACKED_RAW = b"\x00"
+PACKED_ZLIB = b"\x01"
+
+
+def pack(data: bytes, threshold: int = 512) -> bytes:
+    """mark `data` with its format, compressing it if it's large enough"""
+    if len(data) >= threshold:
+        compressed = zlib.compress(data, 6)
+        if len(compressed) < len(data):
+            return PACKED_ZLIB + compressed
+    return PACKED_RAW + data
+
+
+def unpack(data: bytes) -> bytes:
+    """reverse `pack`"""
+    marker, body = data[:1], data[1:]
+    if marker == PACKED_ZLIB:
+        return zlib.decompress(body)
+    if marker == PACKED_RAW:
+        return body
+    raise ValueError(f"Unknown packed format: {marker!r}")
+
+
 def add_response(
     operation: dict,
     status_code: str,
@@ -147,3 +183,65 @@ def cast_func_to(type: Callable[P, R]):
         return func  # type: ignore
 
     return cast
+
+
+T = TypeVar("T")
+
+
+class PerProcess(Generic[T]):
+    """
+    a lazily created resource that is rebuilt in every process
+
+    threads and sockets don't survive a fork (gunicorn and celery
+    workers), so a pool made in the parent must not be used by a child
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], T],
+        close: Optional[Callable[[T], Any]] = None,
+    ):
+        self.factory = factory
+        self.closer = close
+        self._value: Optional[T] = None
+        self._pid: Optional[int] = None
+        self._lock = Lock()
+
+    def get(self) -> T:
+        """get the resource for the current process, creating it if needed"""
+        pid = os.getpid()
+        if self._value is None or self._pid != pid:
+            with self._lock:
+                if self._value is None or self._pid != pid:
+                    self._value = self.factory()
+                    self._pid = pid
+        return self._value
+
+    def reset(self):
+        """drop the resource, closing it if this process created it"""
+        with self._lock:
+            if (
+                self._value is not None
+                and self._pid == os.getpid()
+                and self.closer is not None
+            ):
+                self.closer(self._value)
+            self._value = None
+            self._pid = None
+
+
+class Configurable:
+    """an object whose public attributes can be changed with `configure`"""
+
+    def configure(self, **options: Any):
+        """update options, then drop anything built from the old ones"""
+        for name, value in options.items():
+            if not hasattr(self, name) or name.startswith("_"):
+                raise ValueError(
+                    f"Unknown {type(self).__name__} option: {name!r}"
+                )
+            setattr(self, name, value)
+        self.close()
+
+    def close(self):
+        """release resources built from the current options"""
@@ -1,15 +1,16 @@
 import pathlib
+from io import BytesIO
 from time import sleep
 from typing import Optional
 
 import PIL.Image
-import requests
 from trulens_eval.feedback import Feedback, Groundedness
 from trulens_eval.feedback.provider.litellm import LiteLLM
 from trulens_eval.tru import Tru
 from trulens_eval.tru_basic_app import TruBasicApp
 
 from cookgpt.ext.genai import gemini, gemini_vision, genai, glm  # noqa: F401
+from cookgpt.ext.httpclient import BROWSER_HEADERS, client
 
 # litellm.set_verbose = True
 
@@ -46,16 +47,8 @@ def load_image(url: str) -> PIL.Image.Image:
     """
     Load an image from a URL.
     """
-    headers = {
-        "User-Agent": (
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
-            " AppleWebKit/537.36 (KHTML, like Gecko)"
-            " Chrome/120.0.0.0 Safari/537.36"
-        )
-    }
-    response = requests.get(url, headers=headers, stream=True)
-    response.raise_for_status()
-    image = PIL.Image.open(response.raw)
+    data, _ = client.download(url, headers=BROWSER_HEADERS)
+    image = PIL.Image.open(BytesIO(data))
     if image.mode in ("RGBA", "P"):
         image = image.convert("RGB")
     return image
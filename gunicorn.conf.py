@@ -8,6 +8,25 @@ PORT = os.getenv("PORT", "8000")
 bind = os.getenv("GUNICORN_BIND", f"{HOST}:{PORT}")
 workers = int(os.getenv("GUNICORN_WORKERS", "1"))
 threads = int(os.getenv("GUNICORN_THREADS", "1"))
+preload_app = os.getenv("GUNICORN_PRELOAD_APP", "0") == "1"
 
 # Logging
 loglevel = os.getenv("GUNICORN_LOG_LEVEL", os.getenv("LOG_LEVEL", "info"))
+
+
+def when_ready(server):
+    """load shared resources in the master before workers are forked"""
+    if preload_app:
+        from cookgpt.chatbot.utils import get_encoding
+
+        get_encoding()
+
+
+def post_fork(server, worker):
+    """drop database connections inherited from the master"""
+    if preload_app:
+        from cookgpt.ext.database import db
+
+        with server.app.wsgi().app_context():
+            # close=False leaves the sockets to the master
+            db.engine.dispose(close=False)
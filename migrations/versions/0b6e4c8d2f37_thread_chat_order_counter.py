@@ -0,0 +1,42 @@
+"""thread chat order counter
+
+Revision ID: 0b6e4c8d2f37
+Revises: f2a8c6e0d511
+Create Date: 2026-10-19 19:21:36.660418
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0b6e4c8d2f37"
+down_revision = "f2a8c6e0d511"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("thread", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column(
+                "next_order", sa.Integer(), server_default="0", nullable=False
+            )
+        )
+
+    # carry on after the last chat of each thread, deleted ones included
+    thread = sa.table("thread", sa.column("id"), sa.column("next_order"))
+    chat = sa.table("chat", sa.column("thread_id"), sa.column("order"))
+    op.execute(
+        thread.update().values(
+            next_order=sa.select(
+                sa.func.coalesce(sa.func.max(chat.c.order) + 1, 0)
+            )
+            .where(chat.c.thread_id == thread.c.id)
+            .scalar_subquery()
+        )
+    )
+
+
+def downgrade():
+    with op.batch_alter_table("thread", schema=None) as batch_op:
+        batch_op.drop_column("next_order")
@@ -0,0 +1,100 @@
+"""token expiry columns
+
+Revision ID: 49a1ce8708b4
+Revises: e70d1c2e1441
+Create Date: 2026-10-19 09:12:31.402117
+
+"""
+from datetime import datetime
+
+import jwt
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "49a1ce8708b4"
+down_revision = "e70d1c2e1441"
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+
+def expiry(encoded: str) -> datetime:
+    """read the `exp` claim of a jwt as a naive utc datetime"""
+    payload = jwt.decode(encoded, options={"verify_signature": False})
+    return datetime.utcfromtimestamp(payload["exp"])
+
+
+def upgrade():
+    with op.batch_alter_table("token", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column("access_expires_at", sa.DateTime(), nullable=True)
+        )
+        batch_op.add_column(
+            sa.Column("refresh_expires_at", sa.DateTime(), nullable=True)
+        )
+
+    # backfill from the tokens' own `exp` claims
+    conn = op.get_bind()
+    token = sa.table(
+        "token",
+        sa.column("id"),
+        sa.column("access_token", sa.String),
+        sa.column("refresh_token", sa.String),
+        sa.column("access_expires_at", sa.DateTime),
+        sa.column("refresh_expires_at", sa.DateTime),
+    )
+    update = (
+        token.update()
+        .where(token.c.id == sa.bindparam("token_id"))
+        .values(
+            access_expires_at=sa.bindparam("aexpiry"),
+            refresh_expires_at=sa.bindparam("rexpiry"),
+        )
+    )
+    # a page of tokens at a time, the table has never been purged
+    last_id = None
+    while True:
+        query = sa.select(
+            token.c.id, token.c.access_token, token.c.refresh_token
+        ).order_by(token.c.id)
+        if last_id is not None:
+            query = query.where(token.c.id > last_id)
+        rows = conn.execute(query.limit(BATCH_SIZE)).fetchall()
+        if not rows:
+            break
+        conn.execute(
+            update,
+            [
+                {
+                    "token_id": id,
+                    "aexpiry": expiry(atoken),
+                    "rexpiry": expiry(rtoken),
+                }
+                for id, atoken, rtoken in rows
+            ],
+        )
+        last_id = rows[-1][0]
+
+    with op.batch_alter_table("token", schema=None) as batch_op:
+        batch_op.alter_column(
+            "access_expires_at", existing_type=sa.DateTime(), nullable=False
+        )
+        batch_op.alter_column(
+            "refresh_expires_at", existing_type=sa.DateTime(), nullable=False
+        )
+        batch_op.create_index(
+            "ix_token_user_id_active_revoked_access_expires_at",
+            ["user_id", "active", "revoked", "access_expires_at"],
+            unique=False,
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("token", schema=None) as batch_op:
+        batch_op.drop_index(
+            "ix_token_user_id_active_revoked_access_expires_at"
+        )
+        batch_op.drop_column("refresh_expires_at")
+        batch_op.drop_column("access_expires_at")
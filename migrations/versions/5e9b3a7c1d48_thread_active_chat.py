@@ -0,0 +1,93 @@
+"""thread active chat
+
+Revision ID: 5e9b3a7c1d48
+Revises: 0b6e4c8d2f37
+Create Date: 2026-10-19 20:02:17.381254
+
+"""
+import json
+import zlib
+from uuid import UUID
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5e9b3a7c1d48"
+down_revision = "0b6e4c8d2f37"
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 100
+
+
+def upgrade():
+    with op.batch_alter_table("thread", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column("active_chat_id", sa.Uuid(), nullable=True)
+        )
+
+    # every thread is a single branch so far, ending at its last chat
+    conn = op.get_bind()
+    thread = sa.table(
+        "thread",
+        sa.column("id", sa.Uuid()),
+        sa.column("active_chat_id", sa.Uuid()),
+    )
+    chat = sa.table(
+        "chat",
+        sa.column("id", sa.Uuid()),
+        sa.column("thread_id", sa.Uuid()),
+        sa.column("order"),
+        sa.column("deleted_at"),
+    )
+    archive = sa.table(
+        "thread_archive",
+        sa.column("thread_id", sa.Uuid()),
+        sa.column("data", sa.LargeBinary()),
+    )
+    update_thread = (
+        thread.update()
+        .where(thread.c.id == sa.bindparam("thread_id"))
+        .values(active_chat_id=sa.bindparam("chat_id"))
+    )
+    last_id = None
+    while True:
+        query = sa.select(thread.c.id).order_by(thread.c.id)
+        if last_id is not None:
+            query = query.where(thread.c.id > last_id)
+        thread_ids = conn.scalars(query.limit(BATCH_SIZE)).all()
+        if not thread_ids:
+            break
+        active: "dict[UUID, UUID]" = {}
+        for thread_id, chat_id in conn.execute(
+            sa.select(chat.c.thread_id, chat.c.id)
+            .where(
+                chat.c.thread_id.in_(thread_ids), chat.c.deleted_at.is_(None)
+            )
+            .order_by(chat.c.thread_id, chat.c.order)
+        ):
+            active[thread_id] = chat_id
+        # the chats of archived threads are in their archives, in order
+        for thread_id, data in conn.execute(
+            sa.select(archive.c.thread_id, archive.c.data).where(
+                archive.c.thread_id.in_(thread_ids)
+            )
+        ):
+            chats = json.loads(zlib.decompress(data))["chats"]
+            if chats:
+                active[thread_id] = UUID(chats[-1]["id"])
+        if active:
+            conn.execute(
+                update_thread,
+                [
+                    {"thread_id": id, "chat_id": chat_id}
+                    for id, chat_id in active.items()
+                ],
+            )
+        last_id = thread_ids[-1]
+
+
+def downgrade():
+    with op.batch_alter_table("thread", schema=None) as batch_op:
+        batch_op.drop_column("active_chat_id")
@@ -0,0 +1,46 @@
+"""access pattern indexes
+
+Revision ID: 7c2d5e91b0a4
+Revises: 49a1ce8708b4
+Create Date: 2026-10-19 14:03:52.118640
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "7c2d5e91b0a4"
+down_revision = "49a1ce8708b4"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("chat", schema=None) as batch_op:
+        batch_op.create_index(
+            "ix_chat_thread_id_previous_chat_id",
+            ["thread_id", "previous_chat_id"],
+            unique=False,
+        )
+        batch_op.create_index(
+            "ix_chat_previous_chat_id", ["previous_chat_id"], unique=False
+        )
+    with op.batch_alter_table("thread", schema=None) as batch_op:
+        batch_op.create_index(
+            "ix_thread_user_id_closed_created_at",
+            ["user_id", "closed", "created_at"],
+            unique=False,
+        )
+    with op.batch_alter_table("chat_media", schema=None) as batch_op:
+        batch_op.create_index(
+            "ix_chat_media_chat_id", ["chat_id"], unique=False
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("chat_media", schema=None) as batch_op:
+        batch_op.drop_index("ix_chat_media_chat_id")
+    with op.batch_alter_table("thread", schema=None) as batch_op:
+        batch_op.drop_index("ix_thread_user_id_closed_created_at")
+    with op.batch_alter_table("chat", schema=None) as batch_op:
+        batch_op.drop_index("ix_chat_previous_chat_id")
+        batch_op.drop_index("ix_chat_thread_id_previous_chat_id")
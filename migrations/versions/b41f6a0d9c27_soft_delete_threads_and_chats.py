@@ -0,0 +1,33 @@
+"""soft delete threads and chats
+
+Revision ID: b41f6a0d9c27
+Revises: 7c2d5e91b0a4
+Create Date: 2026-10-19 15:27:08.540913
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "b41f6a0d9c27"
+down_revision = "7c2d5e91b0a4"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ("thread", "chat"):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(
+                sa.Column("deleted_at", sa.DateTime(), nullable=True)
+            )
+            batch_op.create_index(
+                f"ix_{table}_deleted_at", ["deleted_at"], unique=False
+            )
+
+
+def downgrade():
+    for table in ("chat", "thread"):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index(f"ix_{table}_deleted_at")
+            batch_op.drop_column("deleted_at")
@@ -0,0 +1,64 @@
+"""thread archives
+
+Revision ID: d93e1f4a7b20
+Revises: b41f6a0d9c27
+Create Date: 2026-10-19 16:48:12.207533
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "d93e1f4a7b20"
+down_revision = "b41f6a0d9c27"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "thread_archive",
+        sa.Column("thread_id", sa.Uuid(), nullable=False),
+        sa.Column("data", sa.LargeBinary(), nullable=False),
+        sa.Column("chat_count", sa.Integer(), nullable=False),
+        sa.Column("cost", sa.Integer(), nullable=False),
+        sa.Column("raw_size", sa.Integer(), nullable=False),
+        sa.Column("id", sa.Uuid(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["thread_id"],
+            ["thread.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("thread_id"),
+    )
+    op.create_table(
+        "archived_chat",
+        sa.Column("thread_id", sa.Uuid(), nullable=False),
+        sa.Column("id", sa.Uuid(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["thread_id"],
+            ["thread.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    with op.batch_alter_table("archived_chat", schema=None) as batch_op:
+        batch_op.create_index(
+            "ix_archived_chat_thread_id", ["thread_id"], unique=False
+        )
+    with op.batch_alter_table("thread", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column("archived_at", sa.DateTime(), nullable=True)
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("thread", schema=None) as batch_op:
+        batch_op.drop_column("archived_at")
+    with op.batch_alter_table("archived_chat", schema=None) as batch_op:
+        batch_op.drop_index("ix_archived_chat_thread_id")
+    op.drop_table("archived_chat")
+    op.drop_table("thread_archive")
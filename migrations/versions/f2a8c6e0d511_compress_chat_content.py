@@ -0,0 +1,92 @@
+"""compress chat content
+
+Revision ID: f2a8c6e0d511
+Revises: d93e1f4a7b20
+Create Date: 2026-10-19 18:05:44.918230
+
+"""
+import zlib
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "f2a8c6e0d511"
+down_revision = "d93e1f4a7b20"
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+THRESHOLD = 512
+# (table, column) pairs stored with `CompressedText`
+COLUMNS = (("chat", "content"), ("chat_media", "description"))
+
+
+def pack(text: str) -> bytes:
+    """the format written by `cookgpt.utils.pack`, frozen here"""
+    data = text.encode()
+    if len(data) >= THRESHOLD:
+        compressed = zlib.compress(data, 6)
+        if len(compressed) < len(data):
+            return b"\x01" + compressed
+    return b"\x00" + data
+
+
+def unpack(data: bytes) -> str:
+    """the format read by `cookgpt.utils.unpack`, frozen here"""
+    data = bytes(data)
+    if data[:1] == b"\x01":
+        return zlib.decompress(data[1:]).decode()
+    return data[1:].decode()
+
+
+def convert(table_name: str, column: str, old_type, new_type, codec):
+    """copy a column into one of a new type, a batch at a time"""
+    staging = f"{column}_new"
+    with op.batch_alter_table(table_name, schema=None) as batch_op:
+        batch_op.add_column(sa.Column(staging, new_type, nullable=True))
+
+    conn = op.get_bind()
+    table = sa.table(
+        table_name,
+        sa.column("id"),
+        sa.column(column, old_type),
+        sa.column(staging, new_type),
+    )
+    update = (
+        table.update()
+        .where(table.c.id == sa.bindparam("row_id"))
+        .values({staging: sa.bindparam("value")})
+    )
+    last_id = None
+    while True:
+        query = sa.select(table.c.id, table.c[column]).order_by(table.c.id)
+        if last_id is not None:
+            query = query.where(table.c.id > last_id)
+        rows = conn.execute(query.limit(BATCH_SIZE)).fetchall()
+        if not rows:
+            break
+        conn.execute(
+            update,
+            [{"row_id": id, "value": codec(value)} for id, value in rows],
+        )
+        last_id = rows[-1][0]
+
+    with op.batch_alter_table(table_name, schema=None) as batch_op:
+        batch_op.drop_column(column)
+        batch_op.alter_column(
+            staging,
+            new_column_name=column,
+            existing_type=new_type,
+            nullable=False,
+        )
+
+
+def upgrade():
+    for table_name, column in COLUMNS:
+        convert(table_name, column, sa.Text(), sa.LargeBinary(), pack)
+
+
+def downgrade():
+    for table_name, column in COLUMNS:
+        convert(table_name, column, sa.LargeBinary(), sa.Text(), unpack)
@@ -56,6 +56,16 @@ def user(app: "App") -> Generator[User, None, None]:
     user.delete()
 
 
+@pytest.fixture(scope="function")
+def send_task():
+    """Tasks sent to celery, recorded instead of sent"""
+    from unittest.mock import patch
+
+    # a running worker would delete the media at imagekit
+    with patch("redisflow.celeryapp.send_task") as send_task:
+        yield send_task
+
+
 @pytest.fixture(scope="function")
 def random_user(app: "App", database):
     """A random user"""
@@ -3,7 +3,12 @@ from typing import cast
 import pytest
 from marshmallow import ValidationError
 
-from cookgpt.auth.cli import create_admin, create_cook
+from cookgpt.auth.cli import (
+    create_admin,
+    create_cook,
+    import_users,
+    purge_tokens,
+)
 from cookgpt.auth.data.enums import UserType
 from cookgpt.auth.models.user import User
 
@@ -348,3 +353,55 @@ class TestGetAccessToken:
         result = runner.invoke(app.cli, ["get-access-token", "non-existent"])
         assert result.exit_code == 1
         assert result.exception
+
+
+def test_purge_tokens(user: User, capsys):
+    """test `auth purge-tokens`"""
+    token = user.create_token()
+    user.revoke_token(token)
+    purge_tokens.main(["-b", "10"], standalone_mode=False)
+    assert "Purged 1 tokens" in capsys.readouterr().out
+
+
+def test_import_users(user: User, tmp_path, capsys):
+    """test `auth import-users`"""
+    path = tmp_path / "users.csv"
+    path.write_text(
+        "first_name,last_name,email,username,password\n"
+        "Ada,Lovelace,ada@example.com,ada,Password1234\n"
+        "Alan,,alan@example.com,,Password1234\n"
+        "Ada,Again,ada@example.com,ada2,Password1234\n"
+        f"John,Doe,{user.email},,Password1234\n"
+        "Bad.,Name,bad@example.com,,Password1234\n"
+    )
+    import_users.main([str(path), "-b", "2", "-w", "2"], standalone_mode=False)
+    captured = capsys.readouterr()
+    assert "Imported 2 users" in captured.out
+    assert captured.err.count("user already exists") == 2
+    assert "line 6" in captured.err
+    ada = User.query.filter_by(email="ada@example.com").one()
+    assert ada.username == "ada"
+    assert ada.type == UserType.COOK
+    assert ada.validate_password("Password1234")
+    alan = User.query.filter_by(email="alan@example.com").one()
+    assert alan.last_name is None and alan.username is None
+
+
+def test_import_users_jsonl(tmp_path, capsys):
+    """test `auth import-users` with a JSON lines file"""
+    path = tmp_path / "users.jsonl"
+    path.write_text(
+        '{"first_name": "Grace", "email": "grace@example.com",'
+        ' "password": "Password1234"}\n'
+        "{not json\n"
+        '["Grace", "Hopper"]\n'
+        '{"first_name": "Hopper", "email": "hopper@example.com",'
+        ' "password": "Password1234"}\n'
+    )
+    import_users.main([str(path), "-t", "ADMIN"], standalone_mode=False)
+    captured = capsys.readouterr()
+    assert "Imported 2 users" in captured.out
+    assert "line 2: invalid json" in captured.err
+    assert "line 3: not an object" in captured.err
+    grace = User.query.filter_by(email="grace@example.com").one()
+    assert grace.type == UserType.ADMIN
@@ -1,4 +1,4 @@
-from datetime import timedelta
+from datetime import datetime, timedelta
 from time import sleep
 from typing import Callable
 from uuid import UUID
@@ -6,8 +6,13 @@ from uuid import UUID
 from flask_jwt_extended import decode_token
 
 from cookgpt.auth.models import Token, User
+from cookgpt.ext.auth import (
+    token_in_blocklist_callback,
+    token_verification_callback,
+)
+from cookgpt.ext.cache import cache, token_state_cache_key
 from cookgpt.ext.database import db
-from tests.utils import mock_config
+from tests.utils import mock_config, record_queries
 
 
 class TestTokenModel:
@@ -85,6 +90,29 @@ class TestTokenModel:
         sleep(0.1)
         assert token2.rtoken_has_expired() is False
 
+    def test_expiry_matches_claims(self, user: "User"):
+        """test that the stored expiries match the tokens' `exp` claims"""
+        token = user.create_token()
+        atoken = decode_token(token.access_token)
+        rtoken = decode_token(token.refresh_token)
+        assert token.atoken_expiry.timestamp() == atoken["exp"]
+        assert token.rtoken_expiry.timestamp() == rtoken["exp"]
+
+    def test_purge(self, user: "User"):
+        """test that revoked and unrefreshable tokens are deleted"""
+        live = user.create_token()
+        revoked = user.create_token()
+        expired = user.create_token()
+        user.revoke_token(revoked)
+        expired.update(refresh_expires_at=datetime.utcnow() - timedelta(1))
+        key = token_state_cache_key(token_id=revoked.id.hex)
+        assert cache.get(key) is not None
+
+        assert Token.purge(batch_size=1) == 2
+        db.session.expire_all()
+        assert user.get_all_tokens() == [live]
+        assert cache.get(key) is None
+
     def test_refresh(self, user: "User", add_jwt_salt: Callable[[], None]):
         """test that a token properly refreshes"""
 
@@ -343,3 +371,84 @@ class TestTokenMixin:
         assert token.access_token is not None
         assert token.revoked is False
         assert token.active is True
+
+
+def test_request_token_is_one_query(user: "User"):
+    """test that an existing token is selected with a single query"""
+    token = user.create_token()
+    db.session.refresh(user)
+    with record_queries() as statements:
+        assert user.request_token() == token
+    assert len(statements) == 1
+
+
+class TestTokenState:
+    """Test the cached token state"""
+
+    def test_state_is_cached(self, user: "User"):
+        """test that saving a token caches its state"""
+        token = user.create_token()
+        key = token_state_cache_key(token_id=token.id.hex)
+        assert cache.get(key) == token.state
+        assert token.state[:3] == (True, False, user.id.hex)
+        user.revoke_token(token)
+        assert cache.get(key).revoked is True
+
+    def test_callbacks_do_not_query_tokens(self, app, user: "User"):
+        """test that authenticating a request reads the token from cache"""
+        token = user.create_token()
+        payload = decode_token(token.access_token)
+        with record_queries() as statements:
+            with app.test_request_context():
+                assert token_in_blocklist_callback({}, payload) is False
+                assert token_verification_callback({}, payload) is True
+        assert statements == []
+
+    def test_state_falls_back_to_database(self, app, user: "User"):
+        """test that a missing cache entry is loaded and cached again"""
+        token = user.create_token()
+        key = token_state_cache_key(token_id=token.id.hex)
+        cache.delete(key)
+        with app.test_request_context():
+            assert Token.get_state(token.id.hex) == token.state
+        assert cache.get(key) == token.state
+
+    def test_bulk_revocation_overrides_cached_state(self, app, user: "User"):
+        """test that revoking all tokens applies to cached states"""
+        token = user.create_token()
+        user.revoke_all_tokens()
+        assert cache.get(token_state_cache_key(token_id=token.id.hex))
+        with app.test_request_context():
+            state = Token.get_state(token.id.hex, user.id.hex)
+        assert state is not None and state.revoked is True
+        # tokens issued afterwards are unaffected
+        token2 = user.create_token()
+        with app.test_request_context():
+            state = Token.get_state(token2.id.hex, user.id.hex)
+        assert state is not None and state.revoked is False
+
+
+def test_revoke_all_tokens_is_one_update(user: "User"):
+    """test that revoking all tokens doesn't load them"""
+    for _ in range(5):
+        user.create_token()
+    db.session.refresh(user)
+    with record_queries() as statements:
+        user.revoke_all_tokens()
+    assert len(statements) == 1
+    assert statements[0].startswith("UPDATE token")
+    assert all(token.revoked for token in user.get_all_tokens())
+
+
+def test_revoke_expired_tokens_is_one_update(user: "User", config):
+    """test that expired tokens are revoked without loading them"""
+    with mock_config(config, JWT_ACCESS_TOKEN_EXPIRES=timedelta(0)):
+        expired = user.create_token()
+    live = user.create_token()
+    db.session.refresh(user)
+    with record_queries() as statements:
+        user.revoke_expired_tokens()
+    assert len(statements) == 1
+    assert statements[0].startswith("UPDATE token")
+    assert expired.revoked is True
+    assert live.revoked is False
@@ -1,7 +1,8 @@
 import pytest
 
 from cookgpt.auth.models import User
-from tests.utils import Random
+from cookgpt.ext.database import db
+from tests.utils import Random, record_queries
 
 
 class TestUserModel:
@@ -85,7 +86,90 @@ class TestUserModel:
         user.update(email=user.email)
         assert True, "Should not raise error"
 
+    def test_create_user_is_one_insert(self):
+        """Test creating a user doesn't look for existing users first"""
+        data = Random.user_data()
+        with record_queries() as statements:
+            User.create(**data)
+        assert not [s for s in statements if s.startswith("SELECT")]
+
+    def test_racing_signups(self, app):
+        """Test that only one of several racing signups succeeds"""
+        from threading import Barrier, Thread
+
+        email = Random.email()
+        barrier = Barrier(4)
+        errors: "list[str]" = []
+
+        def signup():
+            with app.app_context():
+                barrier.wait()
+                try:
+                    User.create(**Random.user_data(email=email))
+                except User.CreateError as err:
+                    errors.append(err.args[0])
+                finally:
+                    db.session.remove()
+
+        threads = [Thread(target=signup) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == ["email is taken"] * 3
+        assert User.query.filter_by(email=email).count() == 1
+
     def test_validate_password(self, user: "User"):
         """Test validating a password"""
         assert user.validate_password("JohnDoe1234") is True
         assert user.validate_password("JohnDoe123") is False
+
+
+@pytest.mark.usefixtures("app")
+class TestUserSnapshot:
+    """Test cached user snapshots"""
+
+    def test_snapshot_is_cached(self, user: "User"):
+        """Test the user is only loaded once"""
+        from cookgpt.auth.models.user import _local_snapshots
+
+        first = User.get_snapshot(user.id.hex)
+        assert first is not None
+        assert first.name == user.name
+        assert first.type == user.type
+        assert first.profile_picture == user.profile_picture
+        # skip the in-process copy to read from redis
+        _local_snapshots.clear()
+        with record_queries() as statements:
+            second = User.get_snapshot(user.id.hex)
+        assert second == first
+        assert statements == []
+
+    def test_update_invalidates_snapshot(self, user: "User"):
+        """Test updating a user drops its snapshot"""
+        old = User.get_snapshot(user.id.hex)
+        assert old is not None
+        user.update(first_name="Jane")
+        new = User.get_snapshot(user.id.hex)
+        assert new is not None
+        assert new.first_name == "Jane"
+        assert new.version > old.version
+
+    def test_stale_snapshot_is_not_served(self, user: "User"):
+        """Test a snapshot taken before an update is reloaded"""
+        from cookgpt.auth.models.user import _local_snapshots
+        from cookgpt.ext.cache import cache, user_snapshot_cache_key
+
+        stale = user.snapshot()
+        user.update(first_name="Jane")
+        cache.set(user_snapshot_cache_key(user_id=user.id.hex), stale)
+        _local_snapshots.clear()
+        snapshot = User.get_snapshot(user.id.hex)
+        assert snapshot is not None
+        assert snapshot.first_name == "Jane"
+
+    def test_live(self, user: "User"):
+        """Test getting the live user from a snapshot"""
+        snapshot = User.get_snapshot(user.id.hex)
+        assert snapshot is not None
+        assert snapshot.live() is user
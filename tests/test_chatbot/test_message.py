@@ -0,0 +1,113 @@
+from concurrent.futures import Future
+
+import pytest
+
+from cookgpt.chatbot.message import (
+    ImageSearchParser,
+    attach_images,
+    extract_image_search,
+)
+from cookgpt.chatbot.models import Chat
+from cookgpt.chatbot.serper import ImageResult
+
+RESPONSE = """\
+Image Search: Nigerian jollof rice
+
+Ingredients:
+
+- 2 cups long grain rice
+- 1/2 cup palm oil
+"""
+
+
+def stream(parser: ImageSearchParser, text: str, size: int) -> str:
+    """feed text to the parser in chunks of `size` characters"""
+    output = ""
+    for i in range(0, len(text), size):
+        output += parser.feed(text[i : i + size])
+    return output + parser.finish()
+
+
+class TestImageSearchParser:
+    """Test the streaming image search parser"""
+
+    @pytest.mark.parametrize("size", [1, 3, 7, 14, len(RESPONSE)])
+    def test_strips_directive(self, size: int):
+        """test that the directive is removed however the text is split"""
+        queries: list[str] = []
+        parser = ImageSearchParser(on_query=queries.append)
+        output = stream(parser, RESPONSE, size)
+        assert output == RESPONSE.split("\n\n", 1)[1]
+        assert parser.query == "Nigerian jollof rice"
+        assert queries == ["Nigerian jollof rice"]
+
+    def test_query_is_reported_once_line_is_complete(self):
+        """test that the lookup can start before the response ends"""
+        queries: list[str] = []
+        parser = ImageSearchParser(on_query=queries.append)
+        assert parser.feed("Image Search: suya") == ""
+        assert queries == []
+        parser.feed("\n\nIngre")
+        assert queries == ["suya"]
+
+    def test_text_is_not_held_back(self):
+        """test that ordinary lines are streamed as they arrive"""
+        parser = ImageSearchParser()
+        assert parser.feed("Here is") == "Here is"
+        assert parser.feed(" a recipe\nIma") == " a recipe\n"
+        assert parser.feed("gine that") == "Imagine that"
+        assert parser.finish() == ""
+        assert parser.query == ""
+
+    def test_directive_without_trailing_newline(self):
+        """test that a directive at the very end is still removed"""
+        parser = ImageSearchParser()
+        assert stream(parser, "Okay!\nImage Search: moi moi", 4) == "Okay!\n"
+        assert parser.query == "moi moi"
+
+    def test_directive_must_start_a_line(self):
+        """test that the directive is only matched at the start of a line"""
+        text = "Try an Image Search: jollof rice\n"
+        parser = ImageSearchParser()
+        assert stream(parser, text, 5) == text
+        assert parser.query == ""
+
+
+def test_extract_image_search():
+    """test that the query is extracted from a complete response"""
+    query, response = extract_image_search(RESPONSE)
+    assert query == "Nigerian jollof rice"
+    assert response.startswith("Ingredients:")
+
+
+def test_attach_images(response: Chat):
+    """test that search results become media on the chat"""
+    result = {
+        "imageUrl": "https://example.com/image.png",
+        "imageWidth": 640,
+        "imageHeight": 480,
+        "thumbnailUrl": "https://example.com/thumb.png",
+        "thumbnailWidth": 64,
+        "thumbnailHeight": 48,
+        "source": "Example",
+        "domain": "example.com",
+        "link": "https://example.com",
+        "googleUrl": "https://google.com",
+        "position": 1,
+    }
+    images: Future = Future()
+    images.set_result(
+        [ImageResult(title=f"jollof {i}", **result) for i in range(5)]
+    )
+    media = attach_images(response, images, limit=2)
+    response.update(content=response.content)
+    assert [m.description for m in media] == ["jollof 0", "jollof 1"]
+    assert len(response.media) == 2
+    assert response.media[0].url == "https://example.com/image.png"
+
+
+def test_attach_images_failed_search(response: Chat):
+    """test that a failed search does not break the response"""
+    images: Future = Future()
+    images.set_exception(RuntimeError("serper.dev is down"))
+    assert attach_images(response, images) == []
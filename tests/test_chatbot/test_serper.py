@@ -0,0 +1,131 @@
+import json
+from http.server import BaseHTTPRequestHandler
+from threading import Barrier, Lock, Thread
+from time import perf_counter, sleep
+from typing import Iterator
+
+import pytest
+
+from cookgpt.chatbot.serper import ImageResult, Serper
+from cookgpt.ext.cache import cache
+from tests.utils import local_server
+
+
+class SerperHandler(BaseHTTPRequestHandler):
+    """a stand-in for the serper.dev api"""
+
+    delay = 0.0
+    queries: list[str] = []
+    lock = Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        payload = json.loads(self.rfile.read(length))
+        with self.lock:
+            self.queries.append(payload["q"])
+        sleep(self.delay)
+        body = json.dumps(
+            {
+                "images": [
+                    {
+                        "title": payload["q"],
+                        "imageUrl": "https://example.com/image.png",
+                        "imageWidth": 640,
+                        "imageHeight": 480,
+                        "thumbnailUrl": "https://example.com/thumb.png",
+                        "thumbnailWidth": 64,
+                        "thumbnailHeight": 48,
+                        "source": "Example",
+                        "domain": "example.com",
+                        "link": "https://example.com",
+                        "googleUrl": "https://google.com",
+                        "position": 1,
+                    }
+                ]
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture(scope="module")
+def server() -> Iterator[str]:
+    with local_server(SerperHandler) as url:
+        yield url
+
+
+@pytest.fixture(scope="function")
+def serper(app, server: str) -> Iterator[Serper]:
+    SerperHandler.delay = 0.0
+    SerperHandler.queries = []
+    yield Serper(type="images", base_url=server)
+    cache.clear()
+
+
+class TestSerper:
+    """Test the serper.dev wrapper"""
+
+    def test_search(self, serper: Serper):
+        """test that results are parsed into the given model"""
+        results = serper.search("jollof rice", ImageResult)
+        assert len(results) == 1
+        assert isinstance(results[0], ImageResult)
+        assert results[0].title == "jollof rice"
+
+    def test_search_is_cached(self, serper: Serper):
+        """test that repeated searches are served from the cache"""
+        serper.search("jollof rice")
+        serper.search("Jollof  Rice")
+        assert SerperHandler.queries == ["jollof rice"]
+
+    def test_cache_key_includes_options(self, serper: Serper, server: str):
+        """test that different search options are cached separately"""
+        serper.search("jollof rice")
+        Serper(type="images", base_url=server, page=2).search("jollof rice")
+        Serper(type="images", base_url=server, country="ng").search(
+            "jollof rice"
+        )
+        assert len(SerperHandler.queries) == 3
+
+    def test_search_many(self, serper: Serper):
+        """test that queries run concurrently and keep their order"""
+        SerperHandler.delay = 0.3
+        queries = ["egusi soup", "pounded yam", "suya", "moi moi"]
+        start = perf_counter()
+        results = serper.search_many(queries)
+        elapsed = perf_counter() - start
+        assert [r[0]["title"] for r in results] == queries
+        assert sorted(SerperHandler.queries) == sorted(queries)
+        assert elapsed < 0.3 * len(queries)
+
+    def test_search_many_uses_cache(self, serper: Serper):
+        """test that cached queries are not searched again"""
+        serper.search("suya")
+        results = serper.search_many(["suya", "moi moi", "suya"])
+        assert len(results) == 3
+        assert SerperHandler.queries.count("suya") == 1
+        assert SerperHandler.queries.count("moi moi") == 1
+
+    def test_inflight_searches_are_shared(self, serper: Serper):
+        """test that simultaneous identical searches hit upstream once"""
+        SerperHandler.delay = 0.3
+        barrier = Barrier(5)
+        results: list = []
+
+        def search():
+            barrier.wait()
+            results.append(serper._fetch_shared("key", "fried rice"))
+
+        threads = [Thread(target=search) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(results) == 5
+        assert SerperHandler.queries == ["fried rice"]
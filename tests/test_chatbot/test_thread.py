@@ -5,7 +5,7 @@ import pytest
 
 from cookgpt.auth.models import User
 from cookgpt.chatbot.models import Chat, MessageType, Thread
-from tests.utils import Random
+from tests.utils import Random, record_queries
 
 
 class TestThreadModel:
@@ -123,6 +123,339 @@ class TestThreadModel:
         thread.clear()
         assert len(thread.chats) == 0  # type: ignore
 
+    def test_concurrent_add_chat(self, app, thread: Thread):
+        """test that chats added to a thread at once all get an order"""
+        from threading import Barrier
+        from threading import Thread as Worker
+
+        from cookgpt.ext.database import db
+
+        workers, per_worker = 6, 10
+        barrier = Barrier(workers)
+        errors: "list[Exception]" = []
+        thread_id = thread.id
+
+        def send():
+            with app.app_context():
+                try:
+                    mine = db.session.get(Thread, thread_id)
+                    barrier.wait()
+                    for i in range(per_worker):
+                        mine.add_query(f"Query {i}")
+                except Exception as err:  # pragma: no cover
+                    errors.append(err)
+                finally:
+                    db.session.remove()
+
+        pool = [Worker(target=send) for _ in range(workers)]
+        for worker in pool:
+            worker.start()
+        for worker in pool:
+            worker.join()
+        assert errors == []
+        chats = Chat.query.filter_by(thread_id=thread_id).order_by(Chat.order)
+        orders = [chat.order for chat in chats]
+        assert orders == list(range(workers * per_worker))
+        # every chat follows the one before it
+        previous = [chat.previous_chat_id for chat in chats]
+        assert previous == [None] + [chat.id for chat in chats][:-1]
+
+    def test_purge_deleted(self, user: "User"):
+        """test hidden threads and chats are purged in batches"""
+        kept = user.create_thread(title="Kept")
+        for i in range(3):
+            kept.add_query(f"Query {i}")
+        gone = user.create_thread(title="Gone")
+        gone.add_query("Query")
+        kept_id, gone_id = kept.id, gone.id
+        Thread.mark_deleted([kept_id], chats_only=True)
+        Thread.mark_deleted([gone_id])
+        assert len(kept.chats) == 0  # type: ignore
+        assert [t.id for t in user.get_active_threads()] == [kept_id]
+
+        assert Thread.purge_deleted(batch_size=2) == (1, 3)
+        assert (
+            Chat.query.filter(Chat.thread_id.in_([kept_id, gone_id])).count()
+            == 0
+        )
+        assert Thread.query.filter(Thread.id == gone_id).count() == 0
+        assert Thread.purge_deleted() == (0, 0)
+
+    def test_clear_large_thread(self, send_task, thread: Thread):
+        """test that clearing a thread doesn't depend on its size"""
+        from sqlalchemy import insert
+
+        from cookgpt.chatbot.models import ChatMedia, MediaType
+        from cookgpt.ext.database import db, uuid7
+
+        chats, media, previous = [], [], None
+        for order in range(2000):
+            chat_id = uuid7()
+            chats.append(
+                {
+                    "id": chat_id,
+                    "thread_id": thread.id,
+                    "previous_chat_id": previous,
+                    "order": order,
+                    "content": "hello",
+                    "chat_type": MessageType.QUERY,
+                }
+            )
+            media.append(
+                {
+                    "chat_id": chat_id,
+                    "secret": f"file{order}",
+                    "url": f"https://example.com/{order}",
+                    "type": MediaType.IMAGE,
+                    "description": "",
+                }
+            )
+            previous = chat_id
+        db.session.execute(insert(Chat), chats)
+        db.session.execute(insert(ChatMedia), media)
+        db.session.commit()
+
+        with record_queries() as statements:
+            thread.clear()
+        assert len(statements) <= 8
+        assert len(thread.chats) == 0  # type: ignore
+        assert ChatMedia.query.count() == 0
+        send_task.assert_called_once()
+        name, kwargs = send_task.call_args.args[0], send_task.call_args.kwargs
+        assert name == "chatbot.delete_media"
+        assert sorted(kwargs["args"][0]) == sorted(m["secret"] for m in media)
+
+    def test_archive_and_restore(self, send_task, thread: Thread):
+        """test that an archived thread is rehydrated when it's opened"""
+        from datetime import datetime, timedelta
+
+        from cookgpt.chatbot.models import ChatMedia, MediaType, ThreadArchive
+        from cookgpt.chatbot.utils import get_thread
+        from cookgpt.ext.database import db
+
+        query = thread.add_query("What's for dinner?", cost=4)
+        response = query.reply("Jollof rice", cost=7)
+        db.session.add(
+            ChatMedia(
+                chat=response,
+                secret="file1",
+                url="https://example.com/jollof.png",
+                type=MediaType.IMAGE,
+                description="a plate of jollof rice",
+            )
+        )
+        db.session.commit()
+        thread_id, query_id, response_id = thread.id, query.id, response.id
+        sent_time = response.sent_time
+
+        future = datetime.utcnow() + timedelta(days=1)
+        assert thread_id in Thread.archivable(future, future, limit=1000)
+        chats, raw_size, stored_size = Thread.archive_many([thread_id])
+        assert chats == 2 and 0 < stored_size
+        assert Chat.query.filter(Chat.thread_id == thread_id).count() == 0
+        assert ChatMedia.query.count() == 0
+        archive = ThreadArchive.query.filter_by(thread_id=thread_id).one()
+        assert archive.chat_count == 2 and archive.raw_size == raw_size
+        assert thread_id not in Thread.archivable(future, future, limit=1000)
+        # still counted against the user
+        assert archive.cost == thread.cost == 11
+        assert thread.chat_count == 2
+        assert thread.user.total_chat_cost == 11
+
+        thread = get_thread(thread_id)
+        assert thread.archived_at is None
+        assert [chat.id for chat in thread.chats] == [  # type: ignore
+            query_id,
+            response_id,
+        ]
+        response = db.session.get(Chat, response_id)
+        assert response.previous_chat_id == query_id
+        assert response.chat_type == MessageType.RESPONSE
+        assert response.cost == 7 and response.sent_time == sent_time
+        assert [m.secret for m in response.media] == ["file1"]
+        assert thread.last_chat.id == response_id
+        assert ThreadArchive.query.count() == 0
+
+        # or when one of its chats is opened
+        Thread.archive_many([thread_id])
+        assert not Thread.restore_chat(query_id, uuid4())
+        assert Thread.restore_chat(query_id)
+        assert db.session.get(Chat, query_id) is not None
+        assert not Thread.restore_chat(query_id)
+
+    def test_restore_old_archive(self, thread: Thread):
+        """test restoring an archive dumped before columns were added"""
+        import json
+        import zlib
+
+        from sqlalchemy import update
+
+        from cookgpt.chatbot.models import ThreadArchive, load_row
+        from cookgpt.ext.database import db
+
+        query_id = thread.add_query("What's for dinner?", cost=4).id
+        Thread.archive_many([thread.id])
+        archive = ThreadArchive.query.filter_by(thread_id=thread.id).one()
+        payload = json.loads(zlib.decompress(archive.data))
+        for chat in payload["chats"]:
+            del chat["cost"], chat["deleted_at"]
+        row = load_row(Chat.__table__, payload["chats"][0])
+        assert row["cost"] == 0 and row["deleted_at"] is None
+        db.session.execute(
+            update(ThreadArchive)
+            .where(ThreadArchive.id == archive.id)
+            .values(data=zlib.compress(json.dumps(payload).encode()))
+        )
+        db.session.commit()
+
+        thread.restore()
+        chat = db.session.get(Chat, query_id)
+        assert chat.cost == 0 and chat.deleted_at is None
+        assert thread.archived_at is None
+
+    def test_restore_conflict(self, thread: Thread):
+        """test that a restore failing for another reason is not hidden"""
+        from sqlalchemy.exc import IntegrityError
+
+        from cookgpt.chatbot.models import ThreadArchive
+        from cookgpt.ext.database import db
+
+        query = thread.add_query("What's for dinner?")
+        query_id = query.id
+        Thread.archive_many([thread.id])
+        # a chat with the same id was put back by hand
+        other = Random.user().create_thread(title="Other")
+        other.add_query("Lunch?", id=query_id)
+
+        with pytest.raises(IntegrityError):
+            thread.restore()
+        db.session.rollback()
+        assert ThreadArchive.query.filter_by(thread_id=thread.id).count()
+
+    def test_archive_keeps_new_chats(self, monkeypatch, thread: Thread):
+        """test that a chat added while a thread is archived is kept"""
+        import json
+
+        from sqlalchemy import insert
+
+        from cookgpt.ext.database import db, uuid7
+
+        thread.add_query("What's for dinner?").reply("Jollof rice")
+        late_id = uuid7()
+        dumps = json.dumps
+
+        def add_chat_then_dump(*args, **kwargs):
+            # sent after the thread's chats were read
+            db.session.execute(
+                insert(Chat).values(
+                    id=late_id,
+                    thread_id=thread.id,
+                    content="And for lunch?",
+                    chat_type=MessageType.QUERY,
+                    order=2,
+                )
+            )
+            return dumps(*args, **kwargs)
+
+        monkeypatch.setattr(json, "dumps", add_chat_then_dump)
+        assert Thread.archive_many([thread.id])[0] == 2
+        monkeypatch.undo()
+        chats = Chat.query.filter(Chat.thread_id == thread.id).all()
+        assert [chat.id for chat in chats] == [late_id]
+        # a thread already archived is skipped
+        assert Thread.archive_many([thread.id]) == (0, 0, 0)
+
+    def test_archivable(self, user: "User"):
+        """test which threads are old enough to archive"""
+        from datetime import datetime, timedelta
+
+        now = datetime.utcnow()
+        idle = user.create_thread(title="Idle")
+        idle.add_query("Query")
+        closed = user.create_thread(title="Closed", closed=True)
+        fresh = user.create_thread(title="Fresh")
+        fresh.add_query("Query")
+        hidden = user.create_thread(title="Hidden")
+        hidden.add_query("Query").mark_deleted()
+
+        ids = {idle.id, closed.id, fresh.id, hidden.id}
+        week_ago = now - timedelta(days=7)
+        later = now + timedelta(minutes=1)
+        archivable = Thread.archivable(week_ago, later, limit=1000)
+        assert ids.intersection(archivable) == {closed.id}
+        archivable = Thread.archivable(later, later, limit=1000)
+        assert ids.intersection(archivable) == {idle.id, closed.id, fresh.id}
+
+    def test_branching(self, thread: Thread):
+        """test forking a thread without touching the chats already in it"""
+        query = thread.add_query("Jollof rice?")
+        response = query.reply("Here is jollof rice")
+        follow_up = response.reply("Less pepper")
+        follow_up.reply("Here is mild jollof rice")
+        before = {
+            chat.id: (chat.order, chat.previous_chat_id)
+            for chat in Chat.query.filter_by(thread_id=thread.id)
+        }
+
+        # edit the follow up: a second reply to the same response
+        edited = thread.add_query("More pepper", previous_chat=response)
+        answer = edited.reply("Here is spicy jollof rice")
+        for chat in Chat.query.filter(Chat.id.in_(before)):
+            assert (chat.order, chat.previous_chat_id) == before[chat.id]
+        assert edited.previous_chat_id == response.id
+        assert [edited.order, answer.order] == [4, 5]
+        assert thread.active_chat_id == answer.id
+        assert thread.last_chat == answer
+        assert [chat.content for chat in thread.history] == [
+            "Jollof rice?",
+            "Here is jollof rice",
+            "More pepper",
+            "Here is spicy jollof rice",
+        ]
+        assert [chat.id for chat in response.replies] == [
+            follow_up.id,
+            edited.id,
+        ]
+        assert response.next_chat == edited
+        assert thread.chat_count == 6
+
+        # go back to the first branch, down to its latest chat
+        thread.activate(follow_up)
+        assert [chat.content for chat in thread.history][2:] == [
+            "Less pepper",
+            "Here is mild jollof rice",
+        ]
+        assert response.next_chat == follow_up
+        assert thread.add_query("Thanks").previous_chat.content == (
+            "Here is mild jollof rice"
+        )
+
+        # deleting a branch leaves the other one, and shows its parent
+        follow_up.mark_deleted()
+        assert [chat.content for chat in thread.history] == [
+            "Jollof rice?",
+            "Here is jollof rice",
+        ]
+        assert [chat.id for chat in thread.chats] == [  # type: ignore
+            query.id,
+            response.id,
+            edited.id,
+            answer.id,
+        ]
+
+    def test_history_query(self, thread: Thread):
+        """test that the active branch is read in one query"""
+        from cookgpt.ext.database import db
+
+        chat = thread.add_query("Query")
+        for _ in range(5):
+            chat = chat.reply("Reply")
+        db.session.expire_all()
+        thread = db.session.get(Thread, thread.id)
+        with record_queries() as queries:
+            assert len(thread.history) == 6
+        assert len(queries) == 1
+
 
 class TestThreadMixin:
     def test_create_thread(self, user: "User"):
@@ -334,3 +667,35 @@ class TestThreadMixin:
         assert len(threads) == 5
         for thread in threads:
             assert len(thread.chats) == 0  # type: ignore
+
+
+def test_archive_command(user: "User", capsys):
+    """test `chat archive`"""
+    from datetime import datetime, timedelta
+
+    from cookgpt.chatbot.cli import archive
+    from cookgpt.chatbot.models import ThreadArchive
+    from cookgpt.ext.database import db
+
+    old = user.create_thread(title="Old")
+    for i in range(3):
+        old.add_query(f"Query {i}")
+    db.session.execute(
+        Chat.__table__.update()
+        .where(Chat.thread_id == old.id)
+        .values(sent_time=datetime.utcnow() - timedelta(days=120))
+    )
+    db.session.commit()
+    new = user.create_thread(title="New")
+    new.add_query("Query")
+    old_id, new_id = old.id, new.id
+
+    archive.main(["-b", "1"], standalone_mode=False)
+    assert "Archived 1 threads (3 chats)" in capsys.readouterr().out
+    assert ThreadArchive.query.one().thread_id == old_id
+    assert Chat.query.filter(Chat.thread_id == old_id).count() == 0
+    assert Chat.query.filter(Chat.thread_id == new_id).count() == 1
+    assert db.session.get(Thread, old_id).archived_at is not None
+
+    Thread.delete_many([old_id])
+    assert ThreadArchive.query.count() == 0
@@ -0,0 +1,140 @@
+import json
+from typing import TYPE_CHECKING
+
+from cookgpt.chatbot.models import Chat, ChatMedia, Thread, ThreadArchive
+from cookgpt.chatbot.transfer import export_threads, import_threads
+from cookgpt.ext.database import db
+from tests.utils import Random, record_queries
+
+if TYPE_CHECKING:
+    from cookgpt.auth.models import User
+
+
+def make_threads(user: "User") -> "list[Thread]":
+    """a branched thread with media, an archived thread and a deleted one"""
+    from cookgpt.chatbot.data.enums import MediaType
+
+    branched = user.create_thread(title="Branched")
+    query = branched.add_query("Jollof rice?")
+    response = query.reply("Here is jollof rice")
+    response.reply("Less pepper").reply("Mild jollof rice")
+    branched.add_query("More pepper", previous_chat=response).reply("Spicy")
+    db.session.add(
+        ChatMedia(
+            chat=query,
+            secret="file1",
+            url="https://example.com/jollof.png",
+            type=MediaType.IMAGE,
+            description="a plate of jollof rice",
+        )
+    )
+    db.session.commit()
+    archived = user.create_thread(title="Archived")
+    archived.add_query("Egusi?").reply("Here is egusi soup")
+    Thread.archive_many([archived.id])
+    deleted = user.create_thread(title="Deleted")
+    deleted.add_query("Hidden")
+    Thread.mark_deleted([deleted.id])
+    return [branched, archived]
+
+
+def snapshot(thread_ids: "list") -> "list[tuple]":
+    """the rows that have to survive a round trip"""
+    return [
+        (chat.thread_id, chat.id, chat.order, chat.previous_chat_id)
+        for chat in Chat.query.filter(Chat.thread_id.in_(thread_ids))
+        .order_by(Chat.thread_id, Chat.order)
+        .all()
+    ]
+
+
+def test_export_and_import(send_task, user: "User"):
+    """test that threads survive an export and an import"""
+    branched, archived = make_threads(user)
+    lines = list(export_threads(user.id))
+    rows = [json.loads(line) for line in lines]
+    types = [row["type"] for row in rows]
+    assert types == ["thread"] * 2 + ["chat"] * 6 + ["media"] + ["chat"] * 2
+    assert rows[8]["row"]["secret"] == "file1"
+    assert all(row["row"]["archived_at"] is None for row in rows[:2])
+    thread_ids = [branched.id, archived.id]
+    active_chat_id = branched.active_chat_id
+    archived.restore()
+    before = snapshot(thread_ids)
+
+    # imported into another user, after the originals are gone
+    Thread.delete_many(thread_ids)
+    send_task.assert_called_once_with(
+        "chatbot.delete_media", args=(["file1"],)
+    )
+    other = Random.user()
+    counts = import_threads(lines, other.id, batch_size=4)
+    assert counts == {"thread": 2, "chat": 8, "media": 1}
+    assert snapshot(thread_ids) == before
+    imported = db.session.get(Thread, thread_ids[0])
+    assert imported.user_id == other.id
+    assert imported.active_chat_id == active_chat_id
+    assert [chat.content for chat in imported.history] == [
+        "Jollof rice?",
+        "Here is jollof rice",
+        "More pepper",
+        "Spicy",
+    ]
+    assert imported.history[0].media[0].description == (
+        "a plate of jollof rice"
+    )
+    assert ThreadArchive.query.count() == 0
+
+    # running it again inserts nothing
+    assert import_threads(lines, other.id) == dict.fromkeys(
+        ("thread", "chat", "media"), 0
+    )
+    Thread.delete_many(thread_ids)
+    other.delete()
+
+
+def test_export_without_secrets(user: "User"):
+    """test that the api export leaves out imagekit file ids"""
+    make_threads(user)
+    media = [
+        json.loads(line)["row"]
+        for line in export_threads(user.id, secrets=False)
+        if '"type":"media"' in line
+    ]
+    assert [row["secret"] for row in media] == [""]
+
+
+def test_import_batches(user: "User"):
+    """test that an import takes one insert per batch of rows"""
+    thread = user.create_thread(title="Long")
+    chat = thread.add_query("Query")
+    for _ in range(19):
+        chat = chat.reply("Reply")
+    lines = list(export_threads(user.id))
+    Thread.delete_many([thread.id])
+    with record_queries() as queries:
+        import_threads(lines, batch_size=10)
+    inserts = [q for q in queries if q.startswith("INSERT INTO chat ")]
+    assert len(inserts) == 2
+    assert Chat.query.filter_by(thread_id=thread.id).count() == 20
+    Thread.delete_many([thread.id])
+
+
+def test_transfer_commands(send_task, user: "User", tmp_path, capsys):
+    """test `chat export` and `chat import`"""
+    from cookgpt.chatbot.cli import export, import_
+
+    branched, archived = make_threads(user)
+    thread_ids = [branched.id, archived.id]
+    path = tmp_path / "export.jsonl"
+    export.main(["johndoe", "-o", str(path)], standalone_mode=False)
+    assert "Exported 11 rows" in capsys.readouterr().err
+    Thread.delete_many(thread_ids)
+
+    import_.main(
+        [str(path), "-u", "johndoe@example.com"], standalone_mode=False
+    )
+    out = capsys.readouterr().out
+    assert "Imported 2 threads, 8 chats and 1 media files" in out
+    assert {t.id for t in user.get_active_threads()} == set(thread_ids)
+    Thread.delete_many(thread_ids)
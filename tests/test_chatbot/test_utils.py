@@ -0,0 +1,69 @@
+from uuid import uuid4
+
+import pytest
+
+from cookgpt.chatbot.utils import get_encoding, num_tokens_from_messages
+from cookgpt.ext.cache import cache
+
+
+@pytest.fixture(scope="function")
+def history():
+    """a chat history with message ids"""
+    messages = [
+        {
+            "role": "user" if i % 2 else "assistant",
+            "content": f"message number {i}",
+            "id": uuid4().hex,
+        }
+        for i in range(10)
+    ]
+    yield messages
+    cache.delete_many(*[f"chat:{m['id']}:cost" for m in messages])
+
+
+def expected_cost(messages: list[dict]) -> int:
+    """compute the cost of messages one by one"""
+    total = 2
+    for message in messages:
+        total += 4 + sum(
+            len(get_encoding().encode(v)) for v in message.values()
+        )
+    return total
+
+
+class TestNumTokensFromMessages:
+    """Test token cost computation"""
+
+    def test_cost(self, app, history: list[dict]):
+        """test that the batched cost matches the per-message cost"""
+        assert num_tokens_from_messages(history) == expected_cost(history)
+
+    def test_costs_are_cached(self, app, history: list[dict]):
+        """test that computed costs are written to the cache"""
+        num_tokens_from_messages(history)
+        for message in history:
+            key = f"chat:{message['id']}:cost"
+            assert cache.get(key) == expected_cost([message]) - 2
+
+    def test_one_round_trip_each_way(
+        self, app, history: list[dict], monkeypatch
+    ):
+        """test that lookups and writes are batched"""
+        calls: list[str] = []
+        for name in ("get", "has", "set", "get_many", "set_many"):
+            method = getattr(cache, name)
+
+            def spy(*args, _name=name, _method=method, **kwargs):
+                calls.append(_name)
+                return _method(*args, **kwargs)
+
+            monkeypatch.setattr(cache, name, spy)
+
+        num_tokens_from_messages(history[:5])
+        assert calls == ["get_many", "set_many"]
+        calls.clear()
+        cost = num_tokens_from_messages(history)
+        assert calls == ["get_many", "set_many"]
+        calls.clear()
+        assert num_tokens_from_messages(history) == cost
+        assert calls == ["get_many"]
@@ -0,0 +1,47 @@
+import pickle
+
+import pytest
+
+from cookgpt.ext.cache import PackedSerializer, cache
+from cookgpt.utils import pack, unpack
+
+
+def test_pack():
+    """test that only large values are compressed"""
+    small, large = b"jollof", b"jollof rice " * 100
+    assert pack(small) == b"\x00" + small
+    assert pack(large)[:1] == b"\x01"
+    assert len(pack(large)) < len(large)
+    assert unpack(pack(small)) == small
+    assert unpack(pack(large)) == large
+    with pytest.raises(ValueError):
+        unpack(b"!" + small)
+
+
+def test_packed_serializer():
+    """test that large values are compressed and old values still load"""
+    serializer = PackedSerializer(threshold=64)
+    small, large = {"content": "hi"}, {"content": "jollof rice " * 100}
+    assert serializer.dumps(small)[:1] == b"!"
+    assert serializer.dumps(large)[:1] == b"\x01"
+    assert serializer.loads(serializer.dumps(small)) == small
+    assert serializer.loads(serializer.dumps(large)) == large
+    # written by the plain serializer, or by `inc`
+    assert serializer.loads(b"!" + pickle.dumps(large)) == large
+    assert serializer.loads(b"12") == 12
+    assert serializer.loads(None) is None
+
+
+@pytest.mark.usefixtures("app")
+def test_cache_compresses_values():
+    """test that the app's cache stores large values compressed"""
+    value = {"content": "jollof rice " * 100}
+    cache.set("test:packed", value)
+    try:
+        stored = cache.cache._read_client.get(
+            cache.cache.key_prefix + "test:packed"
+        )
+        assert stored[:1] == b"\x01"
+        assert cache.get("test:packed") == value
+    finally:
+        cache.delete("test:packed")
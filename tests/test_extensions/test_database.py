@@ -0,0 +1,257 @@
+from time import sleep
+from typing import TYPE_CHECKING
+
+import pytest
+
+from cookgpt.chatbot.models import Chat
+from cookgpt.ext.database import db, uuid7
+from tests.utils import explain_queries
+
+if TYPE_CHECKING:
+    from cookgpt.auth.models import User
+
+
+def test_uuid7():
+    """test that uuid7 ids are version 7 and ordered by time"""
+    first = uuid7()
+    sleep(0.002)
+    second = uuid7()
+    assert first.version == 7
+    assert first.variant == second.variant == "specified in RFC 4122"
+    assert first < second
+    assert first.hex < second.hex
+
+
+def test_compressed_text(thread):
+    """test that large text is stored compressed and read back as text"""
+    from sqlalchemy import LargeBinary, select, type_coerce
+
+    from cookgpt.chatbot.message import response
+
+    query = "How do I make jollof rice?"
+    short = thread.add_query(query)
+    long = short.reply(response)
+    stored = dict(
+        db.session.execute(
+            select(Chat.id, type_coerce(Chat.content, LargeBinary)).where(
+                Chat.thread_id == thread.id
+            )
+        ).all()
+    )
+    assert stored[short.id] == b"\x00" + query.encode()
+    assert stored[long.id][:1] == b"\x01"
+    assert len(stored[long.id]) < len(response.encode()) / 2
+    db.session.expire_all()
+    assert db.session.get(Chat, long.id).content == response
+    assert db.session.get(Chat, short.id).content == query
+
+
+USERS = 50
+THREADS_PER_USER = 20
+CHATS_PER_THREAD = 20
+TOKENS_PER_USER = 20
+
+
+@pytest.fixture(scope="module")
+def seeded(app):
+    """a database big enough for the planner to prefer indexes"""
+    from datetime import datetime, timedelta
+
+    from sqlalchemy import insert, text
+
+    from cookgpt.auth.data.enums import UserType
+    from cookgpt.auth.models import Token, User
+    from cookgpt.chatbot.data.enums import MediaType, MessageType
+    from cookgpt.chatbot.models import Chat, ChatMedia, Thread
+
+    now = datetime.utcnow()
+    users, threads, chats, media, tokens = [], [], [], [], []
+    for u in range(USERS):
+        user_id = uuid7()
+        users.append(
+            {
+                "id": user_id,
+                "first_name": "Seed",
+                "email": f"seed{u}@example.com",
+                "username": f"seed{u}",
+                "password": "x",
+                "user_type": UserType.COOK,
+                "max_chat_cost": 1000,
+            }
+        )
+        for t in range(TOKENS_PER_USER):
+            tokens.append(
+                {
+                    "id": uuid7(),
+                    "user_id": user_id,
+                    "access_token": f"a{u}.{t}",
+                    "refresh_token": f"r{u}.{t}",
+                    "access_expires_at": now + timedelta(minutes=t - 10),
+                    "refresh_expires_at": now + timedelta(minutes=t),
+                    "active": t % 3 != 0,
+                    "revoked": t % 5 == 0,
+                }
+            )
+        for t in range(THREADS_PER_USER):
+            thread_id = uuid7()
+            threads.append(
+                {
+                    "id": thread_id,
+                    "user_id": user_id,
+                    "title": f"Thread {t}",
+                    "closed": t % 2 == 0,
+                }
+            )
+            previous = None
+            for order in range(CHATS_PER_THREAD):
+                chat_id = uuid7()
+                chats.append(
+                    {
+                        "id": chat_id,
+                        "thread_id": thread_id,
+                        "previous_chat_id": previous,
+                        "order": order,
+                        "content": "hello",
+                        "chat_type": MessageType.QUERY,
+                    }
+                )
+                if order % 5 == 0:
+                    media.append(
+                        {
+                            "chat_id": chat_id,
+                            "secret": "x",
+                            "url": f"https://example.com/{chat_id.hex}",
+                            "type": MediaType.IMAGE,
+                            "description": "",
+                        }
+                    )
+                previous = chat_id
+            threads[-1]["active_chat_id"] = previous
+    for model, rows in (
+        (User, users),
+        (Thread, threads),
+        (Chat, chats),
+        (ChatMedia, media),
+        (Token, tokens),
+    ):
+        db.session.execute(insert(model), rows)
+    db.session.commit()
+    db.session.execute(text("ANALYZE"))
+    yield db.session.get(User, users[0]["id"])
+    db.session.rollback()
+
+
+@pytest.mark.usefixtures("app")
+def test_query_plans(seeded: "User"):
+    """test that the model and view queries never scan a whole table"""
+    user = seeded
+    with explain_queries() as plans:
+        threads = list(user.threads)
+        user.get_active_threads()
+        thread = threads[0]
+        chats = list(thread.chats)
+        thread.last_chat
+        thread.history
+        Chat.query.filter(
+            Chat.thread_id == thread.id,
+            Chat.previous_chat_id == None,  # noqa: E711
+        ).all()
+        chat = Chat.query.filter(Chat.id == chats[0].id).first()
+        chat.next_chat
+        chat.media
+        thread.activate(chats[1])
+        chats[-1].mark_deleted()
+        user.get_active_tokens()
+        user.get_inactive_tokens()
+        user.request_token()
+        user.revoke_expired_tokens()
+    assert len(plans) >= 10
+    # the branches walked by recursive ctes are scanned, the tables are not
+    walks = ("SCAN earlier_chats", "SCAN later_chats")
+    scans = [
+        (statement, detail)
+        for statement, details in plans
+        for detail in details
+        if detail.startswith("SCAN")
+        and "CONSTANT ROW" not in detail
+        and detail not in walks
+    ]
+    assert scans == []
+    assert sum(detail in walks for _, details in plans for detail in details)
+
+
+@pytest.fixture
+def replicas(app, tmp_path):
+    """two empty sqlite databases standing in for read replicas"""
+    from sqlalchemy import create_engine
+
+    from cookgpt.ext.database import REPLICA_BIND_PREFIX
+
+    engines = {}
+    for i in range(2):
+        engine = create_engine(f"sqlite:///{tmp_path}/replica{i}.db")
+        db.metadata.create_all(engine)
+        engines[f"{REPLICA_BIND_PREFIX}{i}"] = engine
+    db.engines.update(engines)
+    app.config["SQLALCHEMY_REPLICAS"] = [str(e.url) for e in engines.values()]
+    try:
+        yield list(engines.values())
+    finally:
+        for key, engine in engines.items():
+            db.engines.pop(key)
+            engine.dispose()
+        app.config["SQLALCHEMY_REPLICAS"] = []
+
+
+def test_replica_routing(app, replicas, user: "User"):
+    """test that only the reads of GET requests go to the replicas"""
+    from sqlalchemy import func, select
+
+    from cookgpt.auth.models import User
+
+    count = select(func.count()).select_from(User)
+    # each app context has a session of its own
+    with app.app_context(), app.test_request_context(method="GET"):
+        assert db.session.scalar(count) == 0
+        assert db.session.scalar(count.with_for_update()) > 0
+        assert db.session.scalar(count, bind_arguments={"primary": True}) > 0
+    with app.app_context(), app.test_request_context(method="POST"):
+        assert db.session.scalar(count) > 0
+
+
+def test_replica_read_your_writes(app, replicas, user: "User", access_token):
+    """test that a user reads from the primary after writing"""
+    from flask_jwt_extended import verify_jwt_in_request
+    from sqlalchemy import func, select
+
+    from cookgpt.chatbot.models import Thread
+    from cookgpt.ext.cache import cache, primary_reads_cache_key
+    from cookgpt.ext.database import read_from_primary
+
+    count = (
+        select(func.count())
+        .select_from(Thread)
+        .where(Thread.user_id == user.id)
+    )
+    headers = {"Authorization": f"Bearer {access_token}"}
+    with app.app_context(), app.test_request_context(headers=headers):
+        verify_jwt_in_request()
+        assert db.session.scalar(count) == 0
+        db.session.add(Thread(title="Stew", user_id=user.id))
+        db.session.commit()
+        # the session that wrote stays on the primary
+        assert db.session.scalar(count) == 1
+    with app.app_context(), app.test_request_context(headers=headers):
+        verify_jwt_in_request()
+        assert db.session.scalar(count) == 1
+
+    cache.delete(primary_reads_cache_key(user_id=user.id.hex))
+    with app.app_context(), app.test_request_context(headers=headers):
+        verify_jwt_in_request()
+        assert db.session.scalar(count) == 0
+
+    # as a background task does after writing for the user
+    read_from_primary(user.id)
+    with app.app_context(), app.test_request_context(headers=headers):
+        verify_jwt_in_request()
+        assert db.session.scalar(count) == 1
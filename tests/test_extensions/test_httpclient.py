@@ -0,0 +1,110 @@
+from http.server import BaseHTTPRequestHandler
+from typing import Iterator
+
+import pytest
+
+from cookgpt.ext.httpclient import HTTPClient, ResponseTooLarge
+from tests.utils import local_server
+
+IMAGE = b"\x89PNG" + b"x" * 2048
+
+
+class Handler(BaseHTTPRequestHandler):
+    """serves fixed payloads for the client tests"""
+
+    failures = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/image.png":
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(IMAGE)))
+            self.end_headers()
+            self.wfile.write(IMAGE)
+        elif self.path == "/chunked":
+            # no Content-Length, so the limit must be enforced while reading
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.write(IMAGE)
+        elif self.path == "/flaky":
+            if Handler.failures < 2:
+                Handler.failures += 1
+                self.send_response(503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"ok")
+        else:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+
+@pytest.fixture(scope="module")
+def server() -> Iterator[str]:
+    with local_server(Handler) as url:
+        yield url
+
+
+@pytest.fixture(scope="function")
+def client() -> Iterator[HTTPClient]:
+    client = HTTPClient(backoff_factor=0, max_download_bytes=4096)
+    yield client
+    client.close()
+
+
+def test_download(client: HTTPClient, server: str):
+    """test that a download returns the body and content type"""
+    data, content_type = client.download(f"{server}/image.png")
+    assert data == IMAGE
+    assert content_type == "image/png"
+
+
+def test_download_limit_from_content_length(client: HTTPClient, server: str):
+    """test that a declared size above the limit is rejected upfront"""
+    with pytest.raises(ResponseTooLarge):
+        client.download(f"{server}/image.png", max_bytes=1024)
+
+
+def test_download_limit_while_streaming(client: HTTPClient, server: str):
+    """test that an undeclared size is capped while reading"""
+    with pytest.raises(ResponseTooLarge):
+        client.download(f"{server}/chunked", max_bytes=1024)
+
+
+def test_session_is_reused(client: HTTPClient, server: str):
+    """test that requests share one session"""
+    session = client.session
+    client.get(f"{server}/image.png").raise_for_status()
+    client.get(f"{server}/image.png").raise_for_status()
+    assert client.session is session
+
+
+def test_configure_resets_session(client: HTTPClient):
+    """test that reconfiguring the client drops the old session"""
+    session = client.session
+    client.configure(read_timeout=1.0)
+    assert client.timeout == (5.0, 1.0)
+    assert client.session is not session
+
+
+def test_configure_rejects_unknown_option(client: HTTPClient):
+    """test that unknown options are rejected"""
+    with pytest.raises(ValueError):
+        client.configure(verify=False)
+
+
+def test_retries_transient_errors(client: HTTPClient, server: str):
+    """test that 5xx responses are retried"""
+    Handler.failures = 0
+    response = client.get(f"{server}/flaky")
+    assert response.status_code == 200
+    assert Handler.failures == 2
@@ -0,0 +1,80 @@
+from threading import Event, Thread
+from typing import Iterator
+
+import pytest
+
+from cookgpt.auth.models import User
+from cookgpt.ext.passwords import HasherBusy, PasswordHasher, hasher
+
+
+@pytest.fixture(scope="function")
+def pool() -> Iterator[PasswordHasher]:
+    pool = PasswordHasher(max_workers=1, max_pending=0, log_rounds=4)
+    yield pool
+    pool.close()
+
+
+def test_hash_and_verify(app, pool: PasswordHasher):
+    """test that a hashed password can be verified"""
+    hashed = pool.hash("JohnDoe1234")
+    assert hashed.startswith("$2b$04$")
+    assert pool.verify(hashed, "JohnDoe1234") is True
+    assert pool.verify(hashed, "JohnDoe123") is False
+
+
+def test_needs_rehash(app, pool: PasswordHasher):
+    """test that hashes with a different work factor are detected"""
+    assert pool.needs_rehash(pool.hash("JohnDoe1234")) is False
+    pool.configure(log_rounds=5)
+    assert pool.needs_rehash(b"$2b$04$" + b"x" * 53) is True
+
+
+def test_saturated_pool_is_rejected(pool: PasswordHasher):
+    """test that callers don't queue forever once the pool is full"""
+    pool.wait_timeout = 0.1
+    started, release = Event(), Event()
+
+    def block():
+        started.set()
+        release.wait()
+
+    thread = Thread(target=pool.run, args=(block,))
+    thread.start()
+    started.wait()
+    try:
+        with pytest.raises(HasherBusy):
+            pool.run(lambda: None)
+    finally:
+        release.set()
+        thread.join()
+
+
+def test_password_is_rehashed_on_login(user: User):
+    """test that outdated hashes are upgraded after a successful login"""
+    rounds = hasher.log_rounds
+    hasher.log_rounds = rounds + 1
+    try:
+        user.update(password="JohnDoe1234")
+    finally:
+        hasher.log_rounds = rounds
+    assert hasher.needs_rehash(user.password)
+    assert user.validate_password("JohnDoe1234")
+    assert not hasher.needs_rehash(user.password)
+    assert user.validate_password("JohnDoe1234")
+
+
+def test_configure_while_hashing(pool: PasswordHasher):
+    """test that reconfiguring doesn't break calls already running"""
+    started, release = Event(), Event()
+
+    def block():
+        started.set()
+        release.wait()
+
+    thread = Thread(target=pool.run, args=(block,))
+    thread.start()
+    started.wait()
+    pool.configure(max_pending=4)
+    release.set()
+    thread.join()
+    assert pool.run(lambda: 1) == 1
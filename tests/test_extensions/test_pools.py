@@ -0,0 +1,99 @@
+from typing import TYPE_CHECKING
+
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from cookgpt.ext.cache import cache
+from cookgpt.ext.pools import (
+    TimedQueuePool,
+    TimedRedisPool,
+    pool_sizes,
+    redis_pool,
+)
+
+if TYPE_CHECKING:
+    from cookgpt.app import App
+
+
+def test_pool_sizes(monkeypatch):
+    """test that the pools are sized from the threads that use them"""
+    monkeypatch.delenv("GUNICORN_THREADS", raising=False)
+    monkeypatch.setenv("CELERY_CONCURRENCY", "6")
+    monkeypatch.setattr("sys.argv", ["gunicorn", "-c", "gunicorn.conf.py"])
+    # the libraries' defaults
+    assert pool_sizes({}) == {
+        "database": 5,
+        "database_overflow": 10,
+        "redis": 50,
+    }
+    monkeypatch.setenv("GUNICORN_THREADS", "8")
+    assert pool_sizes({}) == {
+        "database": 8,
+        "database_overflow": 8,
+        "redis": 13,
+    }
+    assert pool_sizes({"REDIS_MAX_CONNECTIONS": 3})["redis"] == 3
+    # a worker runs its tasks on CELERY_CONCURRENCY threads or greenlets
+    monkeypatch.setattr(
+        "sys.argv", ["/venv/bin/celery", "-A", "redisflow.app", "worker"]
+    )
+    assert pool_sizes({}) == {
+        "database": 6,
+        "database_overflow": 6,
+        "redis": 11,
+    }
+
+
+def test_shared_redis_pool(app: "App"):
+    """test that the cache and the streams share the app's redis pool"""
+    pool = redis_pool(app)
+    assert app.redis.connection_pool is pool
+    backend = cache.cache
+    assert backend._write_client.connection_pool is pool
+    assert backend._read_client.connection_pool is pool
+    checkouts = pool.stats.checkouts
+    cache.set("test:pool", 1)
+    assert cache.get("test:pool") == 1
+    assert pool.stats.checkouts == checkouts + 2
+    assert pool.checked_out() == 0
+    cache.delete("test:pool")
+
+
+def test_redis_pool_timeout(app: "App"):
+    """test that a caller that gives up waiting is counted"""
+    pool = TimedRedisPool.from_url(
+        app.config["REDIS_URL"], max_connections=1, timeout=0.01
+    )
+    connection = pool.get_connection("PING")
+    assert pool.checked_out() == 1
+    with pytest.raises(RedisConnectionError):
+        pool.get_connection("PING")
+    assert pool.snapshot()["timeouts"] == 1
+    pool.release(connection)
+    assert pool.snapshot()["checked_out"] == 0
+    pool.disconnect()
+
+
+def test_database_pool(app: "App"):
+    """test that the database engine records its checkouts"""
+    from cookgpt.ext.database import db
+
+    with app.app_context():
+        pool = db.engine.pool
+        assert isinstance(pool, TimedQueuePool)
+        checkouts = pool.stats.checkouts
+        with db.engine.connect():
+            assert pool.snapshot()["checked_out"] == 1
+        assert pool.stats.checkouts == checkouts + 1
+
+
+def test_perf_pools(app: "App"):
+    """test that `flask perf pools` shows this process's pools"""
+    from click.testing import CliRunner
+
+    result = CliRunner().invoke(app.cli, ["perf", "pools"])
+    assert result.exit_code == 0, result.output
+    assert "workers x" in result.output
+    lines = result.output.splitlines()
+    assert any(" redis " in line for line in lines)
+    assert any(" database " in line for line in lines)
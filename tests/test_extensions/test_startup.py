@@ -0,0 +1,28 @@
+import subprocess
+import sys
+
+SCRIPT = """
+import sys
+from cookgpt import create_app
+create_app()
+print("loaded:", sorted(m for m in {modules} if m in sys.modules))
+"""
+
+
+def test_heavy_dependencies_are_lazy():
+    """test that creating the app does not import the AI clients"""
+    modules = {"tiktoken", "langchain", "google.generativeai", "grpc"}
+    result = subprocess.run(
+        [sys.executable, "-c", SCRIPT.format(modules=modules)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert "loaded: []" in result.stdout.splitlines()
+
+
+def test_encoder_is_loaded_once():
+    """test that the encoder is shared after the first use"""
+    from cookgpt.chatbot.utils import get_encoding
+
+    assert get_encoding() is get_encoding()
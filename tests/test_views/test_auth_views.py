@@ -1,11 +1,15 @@
+from datetime import datetime, timedelta
 from typing import Callable, cast
 
+import pytest
 from flask import url_for
 from flask.testing import FlaskClient as Client
 
+from cookgpt.auth.data.enums import UserType
 from cookgpt.auth.models import Token, User
+from cookgpt.ext.cache import cache, tokens_revoked_before_cache_key
 from cookgpt.ext.database import db
-from tests.utils import Random
+from tests.utils import Random, mock_config, record_queries
 
 
 class TestLoginView:
@@ -177,3 +181,127 @@ class TestRefreshView:
 
         assert atoken != token.access_token, "access token did not change"
         assert rtoken == token.refresh_token, "refresh token changed"
+
+
+class TestRevokeTokensView:
+    """Test bulk token revocation"""
+
+    def test_requires_admin(self, client: "Client", auth_header):
+        """Test that only admins can revoke tokens"""
+        response = client.post(
+            url_for("auth.revoke_tokens"), json={}, headers=auth_header
+        )
+        assert response.status_code == 403
+
+    def test_user_is_not_loaded(self, client: "Client", auth_header):
+        """Test that the requesting user comes from its cached snapshot"""
+        url = url_for("auth.revoke_tokens")
+        client.post(url, json={}, headers=auth_header)
+        with record_queries() as statements:
+            response = client.post(url, json={}, headers=auth_header)
+        assert response.status_code == 403
+        assert not [s for s in statements if 'FROM "user"' in s]
+
+    def test_revoke_user_tokens(self, client: "Client", user: "User"):
+        """Test revoking another user's tokens"""
+        admin = Random.user()
+        admin.update(user_type=UserType.ADMIN)
+        headers = {
+            "Authorization": f"Bearer {admin.create_token().access_token}"
+        }
+        other = {"Authorization": f"Bearer {user.create_token().access_token}"}
+        assert (
+            client.get(url_for("auth.user"), headers=other).status_code == 200
+        )
+
+        response = client.post(
+            url_for("auth.revoke_tokens"),
+            json={"user_id": str(user.id)},
+            headers=headers,
+        )
+        assert response.status_code == 200
+        assert cast(dict, response.json)["revoked"] == 1
+        assert (
+            client.get(url_for("auth.user"), headers=other).status_code == 401
+        )
+        assert (
+            client.get(url_for("auth.user"), headers=headers).status_code
+            == 200
+        )
+        admin.delete()
+
+    def test_revoke_issued_before(self, client: "Client", user: "User"):
+        """Test revoking everyone's tokens issued before a time"""
+        admin = Random.user()
+        admin.update(user_type=UserType.ADMIN)
+        headers = {
+            "Authorization": f"Bearer {admin.create_token().access_token}"
+        }
+        other = {"Authorization": f"Bearer {user.create_token().access_token}"}
+        try:
+            response = client.post(
+                url_for("auth.revoke_tokens"),
+                json={"issued_before": datetime.utcnow().isoformat()},
+                headers=headers,
+            )
+            assert response.status_code == 200
+            assert cast(dict, response.json)["revoked"] >= 2
+            response = client.get(url_for("auth.user"), headers=other)
+            assert response.status_code == 401
+        finally:
+            cache.delete(tokens_revoked_before_cache_key())
+            admin.delete()
+
+    def test_issued_before_in_future(self, client: "Client"):
+        """Test that revoking tokens issued in the future is rejected"""
+        admin = Random.user()
+        admin.update(user_type=UserType.ADMIN)
+        headers = {
+            "Authorization": f"Bearer {admin.create_token().access_token}"
+        }
+        before = datetime.utcnow() + timedelta(minutes=5)
+        response = client.post(
+            url_for("auth.revoke_tokens"),
+            json={"issued_before": before.isoformat()},
+            headers=headers,
+        )
+        assert response.status_code == 422
+        assert cache.get(tokens_revoked_before_cache_key()) is None
+        admin.delete()
+
+
+class TestStatelessAccessTokens:
+    """Test verifying access tokens without the database"""
+
+    @pytest.fixture(autouse=True)
+    def stateless(self, app):
+        with mock_config(app.config, JWT_STATELESS_ACCESS_TOKENS=True):
+            yield
+
+    def test_token_table_is_not_queried(self, client: "Client", auth_header):
+        """Test that an authenticated request doesn't load the token"""
+        with record_queries() as statements:
+            response = client.get(url_for("auth.user"), headers=auth_header)
+        assert response.status_code == 200
+        assert not any("FROM token" in s for s in statements)
+
+    def test_logout(self, client: "Client", auth_header):
+        """Test that a deactivated token is rejected"""
+        response = client.post(url_for("auth.logout"), headers=auth_header)
+        assert response.status_code == 200
+        response = client.get(url_for("auth.user"), headers=auth_header)
+        assert response.status_code == 401
+
+    def test_revoke_all_tokens(self, client: "Client", user: "User"):
+        """Test that bulk revocations are respected"""
+        headers = {
+            "Authorization": f"Bearer {user.create_token().access_token}"
+        }
+        user.revoke_all_tokens()
+        response = client.get(url_for("auth.user"), headers=headers)
+        assert response.status_code == 401
+        headers = {
+            "Authorization": f"Bearer {user.create_token().access_token}"
+        }
+        response = client.get(url_for("auth.user"), headers=headers)
+        assert response.status_code == 200
@@ -88,6 +88,24 @@ class TestChatView:
         assert chat["previous_chat_id"] is None
         assert chat["next_chat_id"] is None
 
+    def test_get_archived_chat(
+        self, client: "FlaskClient", access_token: str, thread: "Thread"
+    ):
+        """test that getting an archived chat restores its thread"""
+        from cookgpt.ext.database import db
+
+        query_id, thread_id = thread.add_query("Hi!").id, thread.id
+        Thread.archive_many([thread_id])
+        headers = {"Authorization": f"Bearer {access_token}"}
+        response = client.get(
+            url_for("chatbot.single_chat", chat_id=query_id), headers=headers
+        )
+
+        assert response.status_code == 200
+        assert response.json is not None
+        assert response.json["id"] == str(query_id)
+        assert db.session.get(Thread, thread_id).archived_at is None
+
     def test_get_non_existent_chat(
         self, client: "FlaskClient", access_token: str
     ):
@@ -120,6 +138,43 @@ class TestChatView:
         assert "message" in response.json
         assert "deleted" in response.json["message"].lower()
 
+    def test_delete_chat_hides_it(
+        self,
+        client: "FlaskClient",
+        access_token: str,
+        thread: "Thread",
+    ):
+        """test a deleted chat and the chats after it are hidden at once"""
+        query = thread.add_query("first")
+        response = query.reply("second")
+        query2 = response.reply("third")
+        headers = {"Authorization": f"Bearer {access_token}"}
+        # cached before the delete
+        client.get(
+            url_for("chatbot.single_chat", chat_id=query2.id), headers=headers
+        )
+        client.delete(
+            url_for("chatbot.single_chat", chat_id=response.id),
+            headers=headers,
+        )
+        chats = client.get(
+            url_for("chatbot.all_chats", thread_id=thread.id), headers=headers
+        ).json
+        assert [chat["id"] for chat in chats["chats"]] == [str(query.id)]
+        assert (
+            client.get(
+                url_for("chatbot.single_chat", chat_id=query2.id),
+                headers=headers,
+            ).status_code
+            == 404
+        )
+        # the thread carries on from the last chat that is left
+        new = thread.add_response("fourth")
+        assert new.previous_chat_id == query.id
+        assert new.order == 3
+        Thread.purge_deleted()
+        assert Chat.query.filter(Chat.thread_id == thread.id).count() == 2
+
     def test_delete_non_existent_chat(
         self, client: "FlaskClient", access_token
     ):
@@ -134,6 +189,59 @@ class TestChatView:
         assert "message" in response.json
         assert "not found" in response.json["message"].lower()
 
+    def test_switch_branch(
+        self,
+        client: "FlaskClient",
+        access_token: str,
+        thread: "Thread",
+    ):
+        """test that a thread shows the branch it was switched to"""
+        query = thread.add_query("first")
+        response = query.reply("second")
+        old = response.reply("third").reply("fourth")
+        new = thread.add_query("edited third", previous_chat=response)
+        headers = {"Authorization": f"Bearer {access_token}"}
+        url = url_for("chatbot.all_chats", thread_id=thread.id)
+        chats = client.get(url, headers=headers).json["chats"]  # type: ignore
+        assert [chat["content"] for chat in chats] == [
+            "first",
+            "second",
+            "edited third",
+        ]
+        assert chats[1]["next_chat_id"] == str(new.id)
+
+        result = client.patch(
+            url_for("chatbot.single_chat", chat_id=old.previous_chat_id),
+            headers=headers,
+        )
+        assert result.status_code == 200
+        assert [
+            chat["content"] for chat in result.json["chats"]  # type: ignore
+        ] == ["first", "second", "third", "fourth"]
+        chats = client.get(url, headers=headers).json["chats"]  # type: ignore
+        assert [chat["id"] for chat in chats][-1] == str(old.id)
+        assert (
+            client.patch(
+                url_for("chatbot.single_chat", chat_id=uuid4()),
+                headers=headers,
+            ).status_code
+            == 404
+        )
+
+        # another user can't switch the branch or read the thread
+        other = Random.user()
+        result = client.patch(
+            url_for("chatbot.single_chat", chat_id=new.id),
+            headers={
+                "Authorization": f"Bearer {other.request_token().access_token}"
+            },
+        )
+        assert result.status_code == 404
+        assert "chats" not in result.json  # type: ignore
+        chats = client.get(url, headers=headers).json["chats"]  # type: ignore
+        assert [chat["id"] for chat in chats][-1] == str(old.id)
+        other.delete()
+
     def test_send_query(
         self, client: "FlaskClient", access_token: str, thread: "Thread"
     ):
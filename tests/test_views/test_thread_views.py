@@ -90,6 +90,9 @@ class TestThreadView:
         )
         assert response.status_code == 200
         assert get_thread(thread.id, required=False) is None
+        # the rows stay until they are purged
+        assert len(Chat.query.filter(Chat.thread_id == thread.id).all()) == 3
+        Thread.purge_deleted()
         assert len(Chat.query.filter(Chat.thread_id == thread.id).all()) == 0
 
 
@@ -130,4 +133,19 @@ class TestThreadsView:
             url_for("chatbot.all_threads"), headers=auth_header
         )
         assert response.status_code == 200
+        assert len(user.get_active_threads()) == 0
+        Thread.purge_deleted()
         assert len(Thread.query.all()) == 0
+
+    def test_delete_threads_of_user_only(
+        self, client: FlaskClient, user: User, auth_header: dict
+    ):
+        """Test that deleting all threads leaves other users' threads"""
+        user.create_thread(title="Test Thread 1")
+        other = Random.user().create_thread(title="Test Thread 2")
+        response = client.delete(
+            url_for("chatbot.all_threads"), headers=auth_header
+        )
+        assert response.status_code == 200
+        assert len(user.get_active_threads()) == 0
+        assert get_thread(other.id, required=False) is not None
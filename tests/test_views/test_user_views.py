@@ -122,8 +122,42 @@ class TestUserView:
         )
         assert response.status_code == 200
 
+    def test_patch_user_refreshes_snapshot(
+        self, app, client: FlaskClient, random_user: User
+    ):
+        from flask_jwt_extended import get_current_user, verify_jwt_in_request
+
+        headers = get_headers(random_user)
+        with app.test_request_context(headers=headers):
+            verify_jwt_in_request()
+            assert get_current_user().first_name == random_user.first_name
+
+        response = client.patch(
+            url_for("auth.user"), json={"first_name": "Jane"}, headers=headers
+        )
+        assert response.status_code == 200
+        # the next request with the same token sees the change
+        with app.test_request_context(headers=headers):
+            verify_jwt_in_request()
+            assert get_current_user().first_name == "Jane"
+
     def test_delete_user(self, client: FlaskClient, random_user: User):
         headers = get_headers(random_user)
         response = client.delete(url_for("auth.user"), headers=headers)
         assert response.status_code == 422
         assert User.query.get(random_user.id), "User should not be deleted"
+
+    def test_export_user(self, client: FlaskClient, random_user: User):
+        import json
+
+        thread = random_user.create_thread(title="Jollof")
+        thread.add_query("Jollof rice?").reply("Here is jollof rice")
+        headers = get_headers(random_user)
+        response = client.get(url_for("auth.export_user"), headers=headers)
+        assert response.status_code == 200
+        assert response.mimetype == "application/x-ndjson"
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [row["type"] for row in rows] == ["thread", "chat", "chat"]
+        assert rows[0]["row"]["id"] == thread.pk
+        assert rows[2]["row"]["content"] == "Here is jollof rice"
+        assert client.get(url_for("auth.export_user")).status_code == 401
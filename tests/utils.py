@@ -1,6 +1,8 @@
 """utilities for testing"""
 from contextlib import contextmanager
-from typing import Any
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from typing import Any, Iterator, Type
 
 from faker import Faker
 
@@ -30,6 +32,71 @@ def mock_config(config, **vars):
                 config[k] = v
 
 
+@contextmanager
+def record_queries() -> Iterator[list[str]]:
+    """collect the SQL statements executed inside the block"""
+    from sqlalchemy import event
+
+    from cookgpt.ext.database import db
+
+    statements: list[str] = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+
+
+@contextmanager
+def explain_queries() -> Iterator[list[tuple[str, list[str]]]]:
+    """
+    collect the sqlite query plan of each SELECT, UPDATE and DELETE, with
+    or without a WITH clause, executed inside the block
+    """
+    from sqlalchemy import event
+
+    from cookgpt.ext.database import db
+
+    queries: list[tuple[str, Any]] = []
+    plans: list[tuple[str, list[str]]] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.startswith(
+            ("SELECT", "UPDATE", "DELETE", "WITH")
+        ):
+            queries.append((statement, parameters))
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        yield plans
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+    conn = db.session.connection()
+    for statement, parameters in queries:
+        rows = conn.exec_driver_sql(
+            f"EXPLAIN QUERY PLAN {statement}", parameters
+        )
+        plans.append((statement, [row[-1] for row in rows]))
+
+
+@contextmanager
+def local_server(handler: Type[BaseHTTPRequestHandler]) -> Iterator[str]:
+    """run a stand-in HTTP server in a thread and yield its base url"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        host, port = server.server_address[:2]
+        yield f"http://{host}:{port}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
 class Random:
     """a namespace for random data"""
 